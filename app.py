@@ -1,14 +1,51 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, send_file, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_, and_, text
+from sqlalchemy import or_, text, event, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, load_only
 from datetime import datetime, timezone, timedelta
 import os
-from io import BytesIO
+from io import BytesIO, RawIOBase
 import re
-from functools import wraps
+from functools import wraps, lru_cache
 from time import time
 import logging
 import secrets
+import hashlib
+import json
+import zipfile
+import base64
+import binascii
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from scripts.cache_imagens import (
+    CAMPOS_RENDER,
+    chave_render,
+    chave_alternativa,
+    versao_miniatura,
+    obter_imagem_cache,
+    salvar_imagem_cache,
+    invalidar_cache_comunicado,
+)
+from scripts.derivados_imagem import (
+    gerar_miniatura, gerar_variante, sufixo_variante,
+    FORMATOS_SAIDA, LARGURA_MINIMA, LARGURA_MAXIMA, SUFIXO_MINIATURA, MIMETYPE_MINIATURA,
+    MINIATURA_PROVISORIA_SVG
+)
+from scripts.cache_contagens import CacheContagens
+from scripts.disjuntor import Disjuntor
+from scripts.layout_texto import VERSAO_LAYOUT, serializar_layout, obter_layout, texto_plano
+from scripts import indice_busca
+from scripts.migracoes import Migracao, aplicar_migracoes, colunas_tabela, criar_indice
+from scripts.limitador_renderizacao import LimitadorRenderizacao, LimiteRenderizacaoError
+from scripts.fila_renderizacao import (
+    FilaRenderizacao,
+    FilaCheiaError,
+    ESTADO_PROCESSANDO,
+    ESTADO_CONCLUIDO,
+    ESTADO_ERRO,
+)
 
 # Carregar variáveis de ambiente (opcional)
 try:
@@ -28,12 +65,31 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_urlsafe(32))
 # Para SQLite, usar caminho absoluto para evitar problemas com diretório de trabalho
 default_db_path = os.path.join(BASE_DIR, 'database', 'comunicados.db')
 print(f"DEBUG: Tentando abrir o banco em: {default_db_path}")
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////home/gcc/gccreporter/GCC-Reporter_v1/database/comunicados.db'
+# SQLALCHEMY_DATABASE_URI no ambiente aponta outro banco (ex: banco temporário dos testes)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:////home/gcc/gccreporter/GCC-Reporter_v1/database/comunicados.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'static/uploads')
 app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
 app.config['HOST'] = os.getenv('FLASK_HOST', '0.0.0.0')
 app.config['PORT'] = int(os.getenv('FLASK_PORT', '5000'))
+app.config['PRELOAD_FONTS'] = os.getenv('PRELOAD_FONTS', 'true').lower() == 'true'
+app.config['RENDER_JOB_WORKERS'] = int(os.getenv('RENDER_JOB_WORKERS', '2'))
+app.config['RENDER_JOB_QUEUE_SIZE'] = int(os.getenv('RENDER_JOB_QUEUE_SIZE', '20'))
+app.config['RENDER_JOB_TIMEOUT'] = int(os.getenv('RENDER_JOB_TIMEOUT', '60'))
+app.config['HTML_RENDER_MAX_FAILURES'] = int(os.getenv('HTML_RENDER_MAX_FAILURES', '3'))
+app.config['HTML_RENDER_COOLDOWN'] = int(os.getenv('HTML_RENDER_COOLDOWN', '60'))
+app.config['RENDER_FALLBACK_CACHE_TTL'] = int(os.getenv('RENDER_FALLBACK_CACHE_TTL', str(app.config['HTML_RENDER_COOLDOWN'])))
+app.config['RENDER_MAX_CONCURRENT'] = int(os.getenv('RENDER_MAX_CONCURRENT', '2'))
+app.config['RENDER_MAX_WAITING'] = int(os.getenv('RENDER_MAX_WAITING', '10'))
+app.config['RENDER_WAIT_TIMEOUT'] = int(os.getenv('RENDER_WAIT_TIMEOUT', '30'))
+app.config['RENDER_DOWNLOAD_WAIT'] = int(os.getenv('RENDER_DOWNLOAD_WAIT', '10'))
+app.config['RENDER_ON_SAVE'] = os.getenv('RENDER_ON_SAVE', 'true').lower() == 'true'
+app.config['CONFIG_VERSION_FILE'] = os.getenv('CONFIG_VERSION_FILE', os.path.join(BASE_DIR, 'cache', 'configuracoes.versao'))
+app.config['PREVIEW_CACHE_SIZE'] = int(os.getenv('PREVIEW_CACHE_SIZE', '256'))
+app.config['EXPORT_WORKERS'] = int(os.getenv('EXPORT_WORKERS', str(os.cpu_count() or 2)))
+app.config['HISTORICO_PAGE_SIZE'] = int(os.getenv('HISTORICO_PAGE_SIZE', '20'))
+app.config['HISTORICO_COUNT_TTL'] = int(os.getenv('HISTORICO_COUNT_TTL', '60'))
+app.config['EXPORT_MAX_ITEMS'] = int(os.getenv('EXPORT_MAX_ITEMS', '500'))
 
 db = SQLAlchemy(app)
 
@@ -148,6 +204,10 @@ def processar_tags(tags_input):
     
     return ', '.join(tags_unicas)
 
+def separar_tags(tags_texto):
+    """Lista de tags do texto separado por vírgulas guardado em Comunicado.tags"""
+    return [tag.strip() for tag in (tags_texto or '').split(',') if tag.strip()]
+
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -169,15 +229,15 @@ class Configuracao(db.Model):
 class Comunicado(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     codigo_unico = db.Column(db.String(20), unique=True, nullable=False)  # Ex: COM-2511281 (COM-YYMMDDN)
-    titulo = db.Column(db.String(200), nullable=False)
+    titulo = db.Column(db.String(200), nullable=False, index=True)
     subtitulo = db.Column(db.String(300))
     corpo = db.Column(db.Text, nullable=False)
     rodape = db.Column(db.Text)
     publico_alvo = db.Column(db.String(100))
     template_id = db.Column(db.Integer, db.ForeignKey('template.id'))
-    status = db.Column(db.String(20), default='rascunho')  # rascunho, enviado
+    status = db.Column(db.String(20), default='rascunho', index=True)  # rascunho, enviado
     tags = db.Column(db.Text, default='')  # Tags separadas por vírgula (ex: "SAP,Oracle,MySQL")
-    criado_em = db.Column(db.DateTime, default=agora_brasil)
+    criado_em = db.Column(db.DateTime, default=agora_brasil, index=True)
     atualizado_em = db.Column(db.DateTime, default=agora_brasil, onupdate=agora_brasil)
     criado_por = db.Column(db.String(100))
     atualizado_por = db.Column(db.String(100))
@@ -198,9 +258,161 @@ class Comunicado(db.Model):
     publico_alvo_pos_x = db.Column(db.Integer, default=60)
     publico_alvo_pos_y = db.Column(db.Integer, default=1120)
     publico_alvo_tamanho = db.Column(db.Integer, default=16)
+    # Layout do corpo (parágrafos e trechos formatados em JSON), compilado ao salvar
+    corpo_layout = db.Column(db.Text)
     
     template = db.relationship('Template', backref='comunicados')
 
+# Tags normalizadas: Comunicado.tags continua sendo o texto exibido, e a tabela de
+# associação (indexada nos dois sentidos) serve aos filtros e às contagens por tag
+comunicado_tag = db.Table(
+    'comunicado_tag',
+    db.Column('comunicado_id', db.Integer, db.ForeignKey('comunicado.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_comunicado_tag_tag_id', 'tag_id', 'comunicado_id'),
+)
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100, collation='NOCASE'), unique=True, nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)  # Comunicados com a tag (mantido a cada alteração)
+
+@event.listens_for(Comunicado, 'before_insert')
+@event.listens_for(Comunicado, 'before_update')
+def _compilar_layout_corpo(mapper, connection, comunicado):
+    """Compila o layout do corpo quando ele muda, para não reinterpretar o HTML a cada renderização"""
+    if comunicado.corpo_layout is None or db.inspect(comunicado).attrs.corpo.history.has_changes():
+        comunicado.corpo_layout = serializar_layout(comunicado.corpo)
+
+def _indexar_busca(connection, comunicado):
+    indice_busca.indexar(connection, comunicado.id, comunicado.titulo, comunicado.subtitulo,
+                         texto_plano(obter_layout(comunicado)))
+
+# Manter o índice de busca na mesma transação em que o comunicado é salvo ou excluído
+@event.listens_for(Comunicado, 'after_insert')
+def _indexar_comunicado_inserido(mapper, connection, comunicado):
+    _indexar_busca(connection, comunicado)
+
+@event.listens_for(Comunicado, 'after_update')
+def _indexar_comunicado_atualizado(mapper, connection, comunicado):
+    estado = db.inspect(comunicado)
+    if any(estado.attrs[campo].history.has_changes() for campo in ('titulo', 'subtitulo', 'corpo')):
+        _indexar_busca(connection, comunicado)
+
+@event.listens_for(Comunicado, 'after_delete')
+def _remover_comunicado_indice(mapper, connection, comunicado):
+    indice_busca.remover(connection, comunicado.id)
+
+def sincronizar_tags(connection, comunicado_id, tags_texto):
+    """Atualiza as associações do comunicado na tabela de tags e o total de cada tag alterada"""
+    tabela_tag = Tag.__table__
+    atuais = {
+        nome.lower(): tag_id for nome, tag_id in connection.execute(
+            select(tabela_tag.c.nome, tabela_tag.c.id)
+            .join(comunicado_tag, comunicado_tag.c.tag_id == tabela_tag.c.id)
+            .where(comunicado_tag.c.comunicado_id == comunicado_id)
+        )
+    }
+    novas = {tag.lower(): tag for tag in separar_tags(tags_texto)}
+    
+    removidas = [tag_id for chave, tag_id in atuais.items() if chave not in novas]
+    if removidas:
+        connection.execute(comunicado_tag.delete().where(
+            comunicado_tag.c.comunicado_id == comunicado_id, comunicado_tag.c.tag_id.in_(removidas)
+        ))
+        connection.execute(tabela_tag.update().where(tabela_tag.c.id.in_(removidas))
+                           .values(total=tabela_tag.c.total - 1))
+    
+    for chave, nome in novas.items():
+        if chave in atuais:
+            continue
+        connection.execute(sqlite_insert(tabela_tag).values(nome=nome, total=0).on_conflict_do_nothing())
+        tag_id = connection.execute(select(tabela_tag.c.id).where(tabela_tag.c.nome == nome)).scalar_one()
+        connection.execute(comunicado_tag.insert().values(comunicado_id=comunicado_id, tag_id=tag_id))
+        connection.execute(tabela_tag.update().where(tabela_tag.c.id == tag_id)
+                           .values(total=tabela_tag.c.total + 1))
+
+@event.listens_for(Comunicado, 'after_insert')
+def _associar_tags_inserido(mapper, connection, comunicado):
+    if comunicado.tags:
+        sincronizar_tags(connection, comunicado.id, comunicado.tags)
+
+@event.listens_for(Comunicado, 'after_update')
+def _associar_tags_atualizado(mapper, connection, comunicado):
+    if db.inspect(comunicado).attrs.tags.history.has_changes():
+        sincronizar_tags(connection, comunicado.id, comunicado.tags)
+
+@event.listens_for(Comunicado, 'before_delete')
+def _desassociar_tags_excluido(mapper, connection, comunicado):
+    sincronizar_tags(connection, comunicado.id, '')
+
+# Contagens do histórico por filtro, recalculadas em segundo plano quando vencem
+# (ou quando um comunicado é criado, alterado ou excluído, ver os eventos da sessão abaixo)
+contagens_historico = CacheContagens(ttl=app.config['HISTORICO_COUNT_TTL'])
+
+# Versão das configurações e templates, compartilhada entre os workers por um arquivo:
+# muda a cada alteração e faz parte da chave dos caches que dependem deles
+# (configurações em memória, prévias). O conteúdo é um token novo a cada alteração,
+# pois duas gravações no mesmo instante podem ter a mesma data de modificação; a data
+# entra na versão para que um `touch` no arquivo também invalide os caches
+def versao_configuracoes():
+    try:
+        with open(app.config['CONFIG_VERSION_FILE']) as f:
+            return f'{f.read().strip()}-{os.fstat(f.fileno()).st_mtime_ns}'
+    except OSError:
+        return ''
+
+def marcar_configuracoes_alteradas():
+    """Invalida as configurações em cache em todos os workers (ex: após editar o banco manualmente)"""
+    caminho = app.config['CONFIG_VERSION_FILE']
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # Gravar em arquivo temporário e renomear, para nenhum worker ler o arquivo vazio
+        temp_path = f'{caminho}.{os.getpid()}.{secrets.token_hex(4)}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(secrets.token_hex(16))
+        os.replace(temp_path, caminho)
+    except OSError as e:
+        logger.error(f"Erro ao atualizar versão das configurações: {e}")
+
+@event.listens_for(db.session, 'after_flush')
+def _detectar_alteracao_configuracoes(session, flush_context):
+    alterados = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, (Configuracao, Template)) for obj in alterados):
+        session.info['configuracoes_alteradas'] = True
+    if any(isinstance(obj, Comunicado) for obj in alterados):
+        session.info['comunicados_alterados'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _publicar_alteracao_configuracoes(session):
+    # Só após o commit, para nenhum worker recarregar os dados antigos com a versão nova
+    # (nem uma contagem feita antes do commit ser guardada como atual)
+    if session.info.pop('configuracoes_alteradas', False):
+        marcar_configuracoes_alteradas()
+    if session.info.pop('comunicados_alterados', False):
+        contagens_historico.invalidar()
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_alteracao_configuracoes(session):
+    session.info.pop('configuracoes_alteradas', None)
+    session.info.pop('comunicados_alterados', None)
+
+_configuracoes_cache = (None, None)
+
+def obter_configuracoes():
+    """
+    Retorna as configurações de estilo ({chave: valor}) como um dicionário somente leitura.
+    
+    A tabela é lida uma vez e recarregada apenas quando a versão das configurações muda.
+    """
+    global _configuracoes_cache
+    versao = versao_configuracoes()
+    versao_cache, configs = _configuracoes_cache
+    if configs is None or versao_cache != versao:
+        configs = MappingProxyType({c.chave: c.valor for c in Configuracao.query.all()})
+        _configuracoes_cache = (versao, configs)
+    return configs
+
 # Rotas principais
 @app.route('/')
 def index():
@@ -294,33 +506,162 @@ def criar_comunicado():
         
         db.session.add(comunicado)
         db.session.commit()
+        pre_renderizar_imagem(comunicado)
         
         return jsonify({'success': True, 'id': comunicado.id, 'codigo': codigo_unico})
     
     templates = Template.query.filter_by(ativo=True).all()
-    configs = {c.chave: c.valor for c in Configuracao.query.all()}
+    configs = obter_configuracoes()
     
     return render_template('criar_comunicado.html', templates=templates, configs=configs)
 
-@app.route('/gerar-imagem/<int:comunicado_id>')
-def gerar_imagem(comunicado_id):
-    # Usar renderização HTML para garantir 100% de fidelidade com a prévia
+# Após falhas seguidas do Chrome, usar direto o renderizador PIL por um tempo
+disjuntor_html = Disjuntor(
+    'renderizador_html',
+    limite_falhas=app.config['HTML_RENDER_MAX_FAILURES'],
+    tempo_espera=app.config['HTML_RENDER_COOLDOWN'],
+)
+
+# Limite de renderizações simultâneas (Chrome ou PIL) no processo
+limitador_render = LimitadorRenderizacao(
+    max_simultaneas=app.config['RENDER_MAX_CONCURRENT'],
+    max_aguardando=app.config['RENDER_MAX_WAITING'],
+    timeout_espera=app.config['RENDER_WAIT_TIMEOUT'],
+)
+
+@app.errorhandler(LimiteRenderizacaoError)
+def renderizacao_sobrecarregada(e):
+    """Sem vaga para renderizar: pedir ao cliente que tente novamente"""
+    logger.warning(f"[RENDER] Recusado por sobrecarga | {request.path} | IP: {request.remote_addr} | {e}")
+    resposta = jsonify({'error': 'Muitas imagens sendo geradas. Tente novamente em instantes.'})
+    resposta.headers['Retry-After'] = '5'
+    return resposta, 503
+
+def renderizar_imagem(comunicado, configs, em_segundo_plano=False):
+    """
+    Obtém a imagem PNG do comunicado do cache em disco ou renderizando-a.
+    
+    A imagem do renderizador alternativo (PIL), usado quando o Chrome falha, fica no
+    cache com uma chave própria, válida por RENDER_FALLBACK_CACHE_TTL segundos e usada
+    apenas enquanto o disjuntor do Chrome não está fechado.
+    
+    Args:
+        em_segundo_plano: True para jobs e exportação, que aguardam vaga sem limite de fila
+            (por até RENDER_JOB_TIMEOUT segundos)
+    
+    Raises:
+        LimiteRenderizacaoError: Sem vaga para renderizar
+    
+    Returns:
+        tuple: (caminho no cache ou None, bytes da imagem ou None se veio do cache,
+                True se veio do renderizador alternativo (PIL))
+    """
+    # Reaproveitar a imagem já renderizada se nada que afeta a renderização mudou
+    chave = chave_render(comunicado, configs)
+    caminho_cache = obter_imagem_cache(comunicado.id, chave)
+    if caminho_cache is not None:
+        return caminho_cache, None, False
+    chave_pil = _chave_alternativa(chave)
+    if not disjuntor_html.fechado():
+        caminho_cache = obter_imagem_cache(comunicado.id, chave_pil)
+        if caminho_cache is not None:
+            return caminho_cache, None, True
+    
+    espera = app.config['RENDER_JOB_TIMEOUT'] if em_segundo_plano else None
+    with limitador_render.vaga(limitar_fila=not em_segundo_plano, timeout=espera):
+        # Usar renderização HTML para garantir 100% de fidelidade com a prévia
+        img_bytes = None
+        if disjuntor_html.permitir():
+            try:
+                from scripts.gerar_imagem_html import gerar_png_html
+                # Gerar imagem a partir do HTML (método novo - 100% fiel à prévia)
+                img_bytes = gerar_png_html(comunicado, configs)
+                disjuntor_html.registrar_sucesso()
+            except Exception as e:
+                disjuntor_html.registrar_falha(e)
+                print(f"Erro ao usar renderização HTML, usando método PIL: {e}")
+        
+        alternativa = img_bytes is None
+        if alternativa:
+            # Fallback para método antigo se houver erro (ou se o disjuntor estiver aberto)
+            from scripts.pool_processos_pil import gerar_png_processo
+            # Gerar imagem (em um processo auxiliar se PIL_PROCESS_WORKERS > 0)
+            img_bytes = gerar_png_processo(comunicado, configs)
+    
+    # A imagem do PIL não pode ocupar a chave da renderização HTML
+    chave_salvar = chave_pil if alternativa else chave
+    caminho_cache = salvar_imagem_cache(comunicado.id, chave_salvar, img_bytes)
+    
+    # Guardar a miniatura do histórico junto com a imagem completa
     try:
-        from scripts.gerar_imagem_html import gerar_png_html
-        comunicado = Comunicado.query.get_or_404(comunicado_id)
-        configs = {c.chave: c.valor for c in Configuracao.query.all()}
-        # Gerar imagem a partir do HTML (método novo - 100% fiel à prévia)
-        img_bytes = gerar_png_html(comunicado, configs)
+        salvar_imagem_cache(comunicado.id, chave_salvar, gerar_miniatura(img_bytes), SUFIXO_MINIATURA)
     except Exception as e:
-        # Fallback para método antigo se houver erro
-        print(f"Erro ao usar renderização HTML, usando método PIL: {e}")
-        from scripts.gerar_imagem import gerar_png
-        comunicado = Comunicado.query.get_or_404(comunicado_id)
-        configs = {c.chave: c.valor for c in Configuracao.query.all()}
-        # Gerar imagem
-        img_bytes = gerar_png(comunicado, configs)
-    
-    # Gerar nome do arquivo: tipo_dia_mes_ano.png
+        logger.warning(f"Erro ao gerar miniatura do comunicado {comunicado.id}: {e}")
+    
+    return caminho_cache, img_bytes, alternativa
+
+def _chave_alternativa(chave):
+    """Chave no cache das imagens do renderizador alternativo (PIL) para a chave de renderização"""
+    return chave_alternativa(chave, app.config['RENDER_FALLBACK_CACHE_TTL'])
+
+def abrir_imagem(obter):
+    """
+    Abre para leitura a imagem retornada por `obter` (renderizar_imagem ou obter_imagem_derivada).
+    
+    Outro worker pode remover o arquivo entre a busca no cache e a abertura (limite de
+    tamanho ou edição do comunicado): nesse caso a imagem é obtida de novo, renderizando-a.
+    
+    Returns:
+        tuple: (arquivo binário aberto, True se veio do renderizador alternativo (PIL));
+               send_file fecha o arquivo ao fim da resposta
+    """
+    for _ in range(2):
+        caminho_cache, img_bytes, alternativa = obter()
+        if img_bytes is not None:
+            return BytesIO(img_bytes), alternativa
+        try:
+            return open(caminho_cache, 'rb'), alternativa
+        except FileNotFoundError:
+            logger.warning(f"⚠️ Imagem removida do cache antes da leitura, obtendo novamente: {caminho_cache}")
+    raise FileNotFoundError(f'Imagem removida do cache: {caminho_cache}')
+
+def obter_imagem_derivada(comunicado, configs, sufixo, derivar):
+    """
+    Obtém uma imagem derivada (miniatura, outro formato/tamanho) do cache,
+    gerando-a a partir da imagem completa se necessário.
+    
+    Args:
+        sufixo: Sufixo do arquivo da derivada no cache
+        derivar: Função que recebe os bytes PNG da imagem completa e retorna a derivada
+    
+    Returns:
+        tuple: (caminho no cache ou None, bytes da derivada ou None se veio do cache,
+                True se a imagem completa veio do renderizador alternativo)
+    """
+    chave = chave_render(comunicado, configs)
+    caminho_cache = obter_imagem_cache(comunicado.id, chave, sufixo)
+    if caminho_cache is not None:
+        return caminho_cache, None, False
+    
+    arquivo, alternativa = abrir_imagem(lambda: renderizar_imagem(comunicado, configs))
+    with arquivo:
+        img_bytes = arquivo.read()
+    # A derivada fica na mesma chave da imagem completa (renderizar_imagem já grava a miniatura)
+    if alternativa:
+        chave = _chave_alternativa(chave)
+    caminho_cache = obter_imagem_cache(comunicado.id, chave, sufixo)
+    if caminho_cache is not None:
+        return caminho_cache, None, alternativa
+    
+    derivada = derivar(img_bytes)
+    return salvar_imagem_cache(comunicado.id, chave, derivada, sufixo), derivada, alternativa
+
+def obter_miniatura(comunicado, configs):
+    """Obtém a miniatura do comunicado exibida no histórico"""
+    return obter_imagem_derivada(comunicado, configs, SUFIXO_MINIATURA, gerar_miniatura)
+
+def nome_arquivo_imagem(comunicado, extensao='png'):
+    """Gera o nome do arquivo de download: tipo_dia_mes_ano.<extensao>"""
     # Sanitizar o título removendo caracteres inválidos para nomes de arquivo
     tipo = re.sub(r'[<>:"/\\|?*]', '', comunicado.titulo).strip()
     tipo = re.sub(r'\s+', '_', tipo)  # Substituir espaços por underscore
@@ -331,97 +672,370 @@ def gerar_imagem(comunicado_id):
     mes = f"{data.month:02d}"
     ano = f"{data.year}"
     
-    nome_arquivo = f"{tipo}_{dia}_{mes}_{ano}.png"
+    return f"{tipo}_{dia}_{mes}_{ano}.{extensao}"
+
+# Cache HTTP: o cliente sempre revalida e recebe 304 se nada mudou
+CACHE_CONTROL_COMUNICADO = 'private, no-cache'
+CACHE_CONTROL_IMAGEM = 'public, no-cache'
+
+def etag_comunicado(comunicado):
+    """ETag forte dos dados do comunicado, baseado em atualizado_em e nos campos exibidos"""
+    dados = [comunicado.id, comunicado.atualizado_em, comunicado.status, comunicado.tags]
+    dados += [getattr(comunicado, campo, None) for campo in CAMPOS_RENDER]
+    serializado = json.dumps(dados, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()[:32]
+
+def resposta_nao_modificada(etag, cache_control):
+    """Retorna uma resposta 304 se o cliente já tem a versão `etag`, senão None"""
+    if etag not in request.if_none_match:
+        return None
+    resposta = Response(status=304)
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = cache_control
+    return resposta
+
+def renderizar_imagem_por_id(comunicado_id, ler_bytes=False):
+    """
+    Renderiza a imagem de um comunicado fora de uma requisição (threads de segundo plano).
+    
+    Args:
+        ler_bytes: True para sempre retornar os bytes da imagem (exportação)
+    
+    Returns:
+        dict: caminho no cache, bytes (apenas se não foi possível gravar no cache ou ler_bytes),
+              nome do arquivo de download e código único do comunicado
+    """
+    with app.app_context():
+        comunicado = db.session.get(Comunicado, comunicado_id)
+        if comunicado is None:
+            raise LookupError(f'Comunicado {comunicado_id} não encontrado')
+        configs = obter_configuracoes()
+        obter = lambda: renderizar_imagem(comunicado, configs, em_segundo_plano=True)
+        if ler_bytes:
+            arquivo, _ = abrir_imagem(obter)
+            with arquivo:
+                return {
+                    'caminho': None,
+                    'bytes': arquivo.read(),
+                    'nome_arquivo': nome_arquivo_imagem(comunicado),
+                    'codigo_unico': comunicado.codigo_unico,
+                }
+        caminho_cache, img_bytes, _ = obter()
+        return {
+            'caminho': caminho_cache,
+            # Manter os bytes em memória apenas se não foi possível gravar no cache
+            'bytes': img_bytes if caminho_cache is None else None,
+            'nome_arquivo': nome_arquivo_imagem(comunicado),
+            'codigo_unico': comunicado.codigo_unico,
+        }
+
+def _executar_job_imagem(job):
+    """Renderiza a imagem de um job da fila (executado fora da requisição)"""
+    return renderizar_imagem_por_id(job.comunicado_id)
+
+fila_imagens = FilaRenderizacao(
+    _executar_job_imagem,
+    num_workers=app.config['RENDER_JOB_WORKERS'],
+    tamanho_maximo=app.config['RENDER_JOB_QUEUE_SIZE'],
+    timeout=app.config['RENDER_JOB_TIMEOUT'],
+)
+
+def pre_renderizar_imagem(comunicado):
+    """Enfileira a geração da imagem de um comunicado enviado, antecipando o download"""
+    if not app.config['RENDER_ON_SAVE'] or comunicado.status != 'enviado':
+        return
+    try:
+        fila_imagens.submeter(comunicado.id)
+    except FilaCheiaError:
+        # Sem problema: a imagem será gerada no download
+        logger.warning(f"Fila cheia, pré-renderização do comunicado {comunicado.id} ignorada")
+
+def aguardar_render_em_andamento(comunicado_id):
+    """
+    Se a imagem do comunicado já está sendo gerada em segundo plano, espera (por até
+    RENDER_DOWNLOAD_WAIT segundos) em vez de gerar outra.
+    
+    Um job ainda na fila (ex: atrás das miniaturas do histórico) não é aguardado: o
+    download renderiza na hora e o job encontra a imagem pronta no cache.
+    """
+    job = fila_imagens.job_ativo(comunicado_id)
+    if job is not None and job.estado == ESTADO_PROCESSANDO:
+        job.aguardar(app.config['RENDER_DOWNLOAD_WAIT'])
+
+@app.route('/gerar-imagem/<int:comunicado_id>')
+def gerar_imagem(comunicado_id):
+    """
+    Baixa a imagem do comunicado.
+    
+    Query params opcionais:
+        formato: png (padrão), png8 (paleta de 256 cores), jpeg (progressivo) ou webp
+        largura: largura em pixels; a altura mantém a proporção
+    """
+    formato = request.args.get('formato', 'png').strip().lower()
+    if formato == 'jpg':
+        formato = 'jpeg'
+    if formato not in FORMATOS_SAIDA:
+        return jsonify({'error': f"Formato inválido. Use: {', '.join(FORMATOS_SAIDA)}"}), 400
+    
+    largura = request.args.get('largura', type=int)
+    if largura is not None and not LARGURA_MINIMA <= largura <= LARGURA_MAXIMA:
+        return jsonify({'error': f'Largura deve estar entre {LARGURA_MINIMA} e {LARGURA_MAXIMA}px'}), 400
+    
+    comunicado = Comunicado.query.get_or_404(comunicado_id)
+    configs = obter_configuracoes()
+    
+    # A chave de renderização identifica a imagem: se o cliente já a tem, nem renderizar
+    original = formato == 'png' and largura is None
+    sufixo = '.png' if original else sufixo_variante(formato, largura)
+    etag = f'{chave_render(comunicado, configs)}{sufixo}'
+    nao_modificada = resposta_nao_modificada(etag, CACHE_CONTROL_IMAGEM)
+    if nao_modificada is not None:
+        return nao_modificada
+    
+    aguardar_render_em_andamento(comunicado_id)
+    
+    if original:
+        # Imagem renderizada original, sem recodificar
+        arquivo, alternativa = abrir_imagem(lambda: renderizar_imagem(comunicado, configs))
+    else:
+        arquivo, alternativa = abrir_imagem(lambda: obter_imagem_derivada(
+            comunicado, configs, sufixo,
+            lambda mestre: gerar_variante(mestre, formato, largura)
+        ))
+    
+    config_formato = FORMATOS_SAIDA[formato]
+    resposta = send_file(
+        arquivo,
+        mimetype=config_formato['mimetype'],
+        as_attachment=True,
+        download_name=nome_arquivo_imagem(comunicado, config_formato['extensao']),
+        etag=etag if not alternativa else False
+    )
+    # A imagem do PIL não é guardada pelo navegador: com o Chrome de volta, o próximo download já sai do HTML
+    resposta.headers['Cache-Control'] = CACHE_CONTROL_IMAGEM if not alternativa else 'no-store'
+    return resposta
+
+def _miniatura_provisoria(comunicado_id):
+    """Enfileira a renderização do comunicado e responde com o marcador provisório da miniatura"""
+    try:
+        fila_imagens.submeter(comunicado_id)
+    except FilaCheiaError:
+        pass  # O histórico pede de novo e tenta enfileirar outra vez
+    resposta = Response(MINIATURA_PROVISORIA_SVG, mimetype='image/svg+xml')
+    resposta.headers['Cache-Control'] = 'no-store'
+    resposta.headers['Retry-After'] = '3'
+    return resposta
+
+@app.route('/comunicado/<int:comunicado_id>/miniatura')
+def miniatura_comunicado(comunicado_id):
+    """
+    Retorna a miniatura do comunicado para o histórico.
+    
+    As miniaturas não disputam as vagas de renderização dos downloads: sem a imagem em
+    cache, ela é enfileirada para geração em segundo plano e a resposta é um marcador
+    provisório (sem cache), que o histórico volta a pedir depois de alguns segundos.
+    """
+    comunicado = Comunicado.query.get_or_404(comunicado_id)
+    configs = obter_configuracoes()
+    
+    chave = chave_render(comunicado, configs)
+    chaves = (chave,) if disjuntor_html.fechado() else (chave, _chave_alternativa(chave))
+    if not any(obter_imagem_cache(comunicado_id, c, sufixo) is not None
+               for c in chaves for sufixo in (SUFIXO_MINIATURA, '.png')):
+        return _miniatura_provisoria(comunicado_id)
+    
+    try:
+        # Com a imagem completa em cache, a miniatura é só redimensionada
+        arquivo, alternativa = abrir_imagem(lambda: obter_miniatura(comunicado, configs))
+    except LimiteRenderizacaoError:
+        # A imagem completa saiu do cache nesse meio tempo e precisaria ser renderizada
+        return _miniatura_provisoria(comunicado_id)
+    
+    resposta = send_file(
+        arquivo,
+        mimetype=MIMETYPE_MINIATURA
+    )
+    if alternativa:
+        # Miniatura do PIL: sem cache no navegador, para ser trocada pela do HTML
+        resposta.headers['Cache-Control'] = 'no-store'
+    else:
+        # A URL usada no histórico muda com o comunicado, as configurações e o template (?v=versao_miniatura)
+        resposta.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resposta
+
+@app.route('/gerar-imagem/<int:comunicado_id>', methods=['POST'])
+@rate_limit
+def criar_job_imagem(comunicado_id):
+    """Enfileira a geração da imagem e retorna o id do job para acompanhamento"""
+    Comunicado.query.get_or_404(comunicado_id)
+    
+    try:
+        job = fila_imagens.submeter(comunicado_id)
+    except FilaCheiaError:
+        logger.warning(f"[JOB IMAGEM] Fila cheia | ID: {comunicado_id} | IP: {request.remote_addr}")
+        resposta = jsonify({'error': 'Fila de renderização cheia. Tente novamente em instantes.'})
+        resposta.headers['Retry-After'] = '5'
+        return resposta, 503
+    
+    logger.info(f"[JOB IMAGEM] ID: {comunicado_id} | IP: {request.remote_addr} | Job: {job.id}")
+    
+    return jsonify({
+        'success': True,
+        **job.to_dict(),
+        'status_url': url_for('status_job_imagem', job_id=job.id),
+        'download_url': url_for('download_job_imagem', job_id=job.id)
+    }), 202
+
+@app.route('/gerar-imagem/status')
+def status_renderizador():
+    """Mostra qual renderizador está atendendo (estado do disjuntor do HTML), a ocupação e a fila de jobs"""
+    disjuntor = disjuntor_html.to_dict()
+    return jsonify({
+        'renderizador_ativo': 'pil' if disjuntor['estado'] == 'aberto' else 'html',
+        'disjuntor_html': disjuntor,
+        'limitador': limitador_render.to_dict(),
+        'fila_jobs': fila_imagens.tamanho_fila(),
+        'execucoes_jobs': fila_imagens.execucoes_ativas(),
+        'pid': os.getpid(),
+    })
+
+@app.route('/gerar-imagem/job/<job_id>')
+def status_job_imagem(job_id):
+    """Retorna o estado de um job de geração de imagem"""
+    job = fila_imagens.obter(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/gerar-imagem/job/<job_id>/download')
+def download_job_imagem(job_id):
+    """Baixa a imagem gerada por um job concluído"""
+    job = fila_imagens.obter(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    if job.estado == ESTADO_ERRO:
+        return jsonify({'error': job.erro, 'status': job.estado}), 500
+    if job.estado != ESTADO_CONCLUIDO:
+        return jsonify({'error': 'Imagem ainda não está pronta', 'status': job.estado}), 409
+    
+    resultado = job.resultado
+    if resultado['caminho']:
+        try:
+            arquivo = open(resultado['caminho'], 'rb')
+        except FileNotFoundError:
+            # Removida do cache (edição do comunicado ou limite de tamanho)
+            return jsonify({'error': 'Imagem expirada, gere novamente'}), 410
+    else:
+        arquivo = BytesIO(resultado['bytes'])
     
     return send_file(
-        BytesIO(img_bytes),
+        arquivo,
         mimetype='image/png',
         as_attachment=True,
-        download_name=nome_arquivo
+        download_name=resultado['nome_arquivo']
     )
 
+# Campos da prévia e seus valores padrão
+CAMPOS_PREVIEW = (
+    ('titulo', ''), ('subtitulo', ''), ('corpo', ''), ('rodape', ''), ('publico_alvo', ''),
+    ('tipo_pos_x', '60'), ('tipo_pos_y', '80'), ('tipo_tamanho', '42'),
+    ('subtitulo_pos_x', '0'), ('subtitulo_pos_y', '430'), ('subtitulo_tamanho', '32'),
+    ('corpo_pos_x', '60'), ('corpo_pos_y', '510'), ('corpo_tamanho', '24'), ('corpo_alinhamento', 'justify'),
+    ('rodape_pos_x', '60'), ('rodape_pos_y', '1000'), ('rodape_tamanho', '24'),
+    ('publico_alvo_pos_x', '60'), ('publico_alvo_pos_y', '1120'), ('publico_alvo_tamanho', '16'),
+)
+
+@lru_cache(maxsize=app.config['PREVIEW_CACHE_SIZE'])
+def _html_preview(payload, versao_config):
+    """
+    Renderiza a prévia a partir do payload normalizado (JSON).
+    
+    Payloads idênticos com a mesma versão das configurações reaproveitam o HTML,
+    sem consultar o banco nem executar o Jinja.
+    """
+    data = json.loads(payload)
+    configs = obter_configuracoes()
+    
+    # Sanitize HTML content
+    data['corpo'] = sanitize_html(data['corpo'])
+    data['rodape'] = sanitize_html(data['rodape'])
+    
+    template_id = data.pop('template_id')
+    template = db.session.get(Template, template_id) if template_id else None
+    
+    return render_template('preview_comunicado.html', template=template, configs=configs, **data)
+
 @app.route('/preview', methods=['POST'])
 @rate_limit
 def preview():
     """Retorna prévia em HTML do comunicado"""
     data = request.get_json()
-    configs = {c.chave: c.valor for c in Configuracao.query.all()}
-    
-    # Sanitize HTML content
-    corpo_sanitized = sanitize_html(data.get('corpo', ''))
-    rodape_sanitized = sanitize_html(data.get('rodape', ''))
     
     template_id = data.get('template_id')
     try:
         template_id = int(template_id) if template_id else None
     except (ValueError, TypeError):
         template_id = None
-    template = db.session.get(Template, template_id) if template_id else None
     
-    html = render_template('preview_comunicado.html', 
-                          titulo=data.get('titulo', ''),
-                          subtitulo=data.get('subtitulo', ''),
-                          corpo=corpo_sanitized,
-                          rodape=rodape_sanitized,
-                          publico_alvo=data.get('publico_alvo', ''),
-                          tipo_pos_x=data.get('tipo_pos_x', '60'),
-                          tipo_pos_y=data.get('tipo_pos_y', '80'),
-                          tipo_tamanho=data.get('tipo_tamanho', '42'),
-                          subtitulo_pos_x=data.get('subtitulo_pos_x', '0'),
-                          subtitulo_pos_y=data.get('subtitulo_pos_y', '430'),
-                          subtitulo_tamanho=data.get('subtitulo_tamanho', '32'),
-                          corpo_pos_x=data.get('corpo_pos_x', '60'),
-                          corpo_pos_y=data.get('corpo_pos_y', '510'),
-                          corpo_tamanho=data.get('corpo_tamanho', '24'),
-                          corpo_alinhamento=data.get('corpo_alinhamento', 'justify'),
-                          rodape_pos_x=data.get('rodape_pos_x', '60'),
-                          rodape_pos_y=data.get('rodape_pos_y', '1000'),
-                          rodape_tamanho=data.get('rodape_tamanho', '24'),
-                          publico_alvo_pos_x=data.get('publico_alvo_pos_x', '60'),
-                          publico_alvo_pos_y=data.get('publico_alvo_pos_y', '1120'),
-                          publico_alvo_tamanho=data.get('publico_alvo_tamanho', '16'),
-                          template=template,
-                          configs=configs)
+    # Normalizar o payload: apenas os campos usados, com os padrões aplicados
+    payload = {campo: data.get(campo, padrao) for campo, padrao in CAMPOS_PREVIEW}
+    payload['template_id'] = template_id
+    chave = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    
+    html = _html_preview(chave, versao_configuracoes())
     
     return jsonify({'html': html})
 
-@app.route('/historico')
-def historico():
-    # Obter parâmetros de busca e filtro
-    tag_filtro = request.args.get('tag', '').strip()
-    busca_texto = request.args.get('busca', '').strip()
-    tipo_filtro = request.args.get('tipo', '').strip()
-    data_inicio = request.args.get('data_inicio', '').strip()
-    data_fim = request.args.get('data_fim', '').strip()
-    
-    # Obter parâmetro de página (padrão: 1)
-    try:
-        pagina_atual = int(request.args.get('page', 1))
-        if pagina_atual < 1:
-            pagina_atual = 1
-    except (ValueError, TypeError):
-        pagina_atual = 1
+# Filtro por várias tags: comunicados com qualquer uma delas ou com todas
+MODO_TAGS_QUALQUER = 'qualquer'
+MODO_TAGS_TODAS = 'todas'
+MODOS_FILTRO_TAGS = (MODO_TAGS_QUALQUER, MODO_TAGS_TODAS)
+
+def obter_filtros_historico():
+    """Lê os filtros do histórico da query string: (tags, modo_tags, busca, tipo, data_inicio, data_fim)"""
+    tags_filtro = []
+    for tag in request.args.getlist('tag'):
+        tag = tag.strip()
+        if tag and tag not in tags_filtro:
+            tags_filtro.append(tag)
     
-    # Limite de registros por página
-    registros_por_pagina = 20
+    modo_tags = request.args.get('tag_modo', '').strip()
+    return (
+        tags_filtro,
+        modo_tags if modo_tags in MODOS_FILTRO_TAGS else MODO_TAGS_QUALQUER,
+        request.args.get('busca', '').strip(),
+        request.args.get('tipo', '').strip(),
+        request.args.get('data_inicio', '').strip(),
+        request.args.get('data_fim', '').strip(),
+    )
+
+def filtrar_comunicados(tags_filtro, modo_tags, busca_texto, tipo_filtro, data_inicio, data_fim):
+    """
+    Monta a query de comunicados com os filtros do histórico.
     
+    Returns:
+        tuple: (query filtrada, lista de filtros aplicados)
+    """
     # Iniciar query base
     query = Comunicado.query
     
     # Aplicar filtros
     filtros_aplicados = []
     
-    # Filtro por tag
-    if tag_filtro:
-        query = query.filter(
-            or_(
-                Comunicado.tags.like(f'{tag_filtro},%'),
-                Comunicado.tags.like(f'%, {tag_filtro},%'),
-                Comunicado.tags.like(f'%, {tag_filtro}'),
-                Comunicado.tags == tag_filtro
-            )
+    # Filtro por tags (pela tabela de associação indexada)
+    if tags_filtro:
+        comunicados_com_tag = (
+            select(comunicado_tag.c.comunicado_id)
+            .join(Tag, Tag.id == comunicado_tag.c.tag_id)
+            .where(Tag.nome.in_(tags_filtro))
         )
-        filtros_aplicados.append(f'tag={tag_filtro}')
+        if modo_tags == MODO_TAGS_TODAS and len(tags_filtro) > 1:
+            comunicados_com_tag = comunicados_com_tag.group_by(comunicado_tag.c.comunicado_id).having(
+                func.count() == len(tags_filtro)
+            )
+        query = query.filter(Comunicado.id.in_(comunicados_com_tag))
+        separador = ' + ' if modo_tags == MODO_TAGS_TODAS else ' | '
+        filtros_aplicados.append(f'tag={separador.join(tags_filtro)}')
     
     # Filtro por tipo de comunicado (título)
     if tipo_filtro:
@@ -434,27 +1048,13 @@ def historico():
             query = query.filter(Comunicado.titulo == tipo_filtro)
         filtros_aplicados.append(f'tipo={tipo_filtro}')
     
-    # Busca por texto (título, subtítulo, corpo) - case insensitive e suporta múltiplas palavras
-    if busca_texto:
-        # Dividir em palavras e buscar cada uma
-        palavras = busca_texto.split()
-        condicoes_busca = []
-        
-        for palavra in palavras:
-            if palavra.strip():
-                busca_pattern = f'%{palavra.strip()}%'
-                condicoes_busca.append(
-                    or_(
-                        Comunicado.titulo.ilike(busca_pattern),
-                        Comunicado.subtitulo.ilike(busca_pattern),
-                        Comunicado.corpo.ilike(busca_pattern)
-                    )
-                )
-        
-        if condicoes_busca:
-            # Todas as palavras devem estar presentes (AND)
-            query = query.filter(and_(*condicoes_busca))
-            filtros_aplicados.append(f'busca={busca_texto}')
+    # Busca por texto (título, subtítulo, corpo) no índice FTS5: sem diferenciar acentos
+    # e maiúsculas, todas as palavras devem estar presentes (cada uma como prefixo)
+    consulta = indice_busca.consulta_fts(busca_texto)
+    if consulta:
+        query = query.join(indice_busca.busca, indice_busca.busca.c.rowid == Comunicado.id)
+        query = query.filter(indice_busca.filtro_busca(consulta))
+        filtros_aplicados.append(f'busca={busca_texto}')
     
     # Filtro por período de data de criação
     if data_inicio or data_fim:
@@ -475,28 +1075,147 @@ def historico():
         except ValueError:
             pass  # Ignorar data inválida
     
-    # Contar total de registros (antes da paginação)
-    total_registros = query.count()
+    return query, filtros_aplicados
+
+def codificar_cursor(comunicado):
+    """Cursor opaco da paginação por chave: (criado_em, id) do comunicado"""
+    valor = f"{comunicado.criado_em.isoformat()}|{comunicado.id}"
+    return base64.urlsafe_b64encode(valor.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor):
+    """Retorna (criado_em, id) do cursor, ou None se ele for inválido"""
+    if not cursor:
+        return None
+    try:
+        valor = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        criado_em, comunicado_id = valor.rsplit('|', 1)
+        return datetime.fromisoformat(criado_em), int(comunicado_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+def paginar_por_cursor(query, registros_por_pagina, depois=None, antes=None, ultima=False):
+    """
+    Pagina a query por (criado_em, id), do mais recente ao mais antigo.
+    
+    O custo de cada página não depende da posição: a consulta parte direto do cursor
+    pelo índice de criado_em, sem OFFSET.
+    
+    Returns:
+        tuple: (comunicados da página, tem_anterior, tem_proxima)
+    """
+    chave = tuple_(Comunicado.criado_em, Comunicado.id)
+    crescente = (Comunicado.criado_em.asc(), Comunicado.id.asc())
+    decrescente = (Comunicado.criado_em.desc(), Comunicado.id.desc())
+    
+    if antes or ultima:
+        # Página anterior (ou última): ler a partir do cursor no sentido inverso e desinverter
+        if antes:
+            query = query.filter(chave > antes)
+        itens = query.order_by(*crescente).limit(registros_por_pagina + 1).all()
+        tem_anterior = len(itens) > registros_por_pagina
+        return itens[:registros_por_pagina][::-1], tem_anterior, bool(antes)
+    
+    if depois:
+        query = query.filter(chave < depois)
+    itens = query.order_by(*decrescente).limit(registros_por_pagina + 1).all()
+    return itens[:registros_por_pagina], bool(depois), len(itens) > registros_por_pagina
+
+def contar_historico(filtros):
+    """Conta os comunicados dos filtros do histórico (executado também fora da requisição)"""
+    with app.app_context():
+        query, _ = filtrar_comunicados(*filtros)
+        return query.order_by(None).with_entities(func.count(Comunicado.id)).scalar()
+
+def _chave_contagem(filtros):
+    tags_filtro, *demais = filtros
+    return (tuple(tags_filtro), *demais)
+
+def _url_historico(**paginacao):
+    """URL do histórico com os filtros atuais e a paginação informada"""
+    params = request.args.to_dict(flat=False)
+    for campo in ('page', 'depois', 'antes', 'ultima'):
+        params.pop(campo, None)
+    params.update({campo: valor for campo, valor in paginacao.items() if valor})
+    return url_for('historico', **params)
+
+def colunas_listagem_historico():
+    """
+    Opções da query do histórico: carrega só as colunas exibidas na tabela (corpo, rodapé,
+    layout e posições ficam adiadas) e o template no mesmo SELECT, para que a página
+    faça sempre o mesmo número de consultas, sem uma carga extra por comunicado.
+    """
+    return (
+        load_only(Comunicado.id, Comunicado.codigo_unico, Comunicado.titulo, Comunicado.subtitulo,
+                  Comunicado.status, Comunicado.tags, Comunicado.criado_em, Comunicado.atualizado_em,
+                  raiseload=True),
+        joinedload(Comunicado.template).load_only(Template.id, Template.nome, Template.imagem_fundo),
+    )
+
+@app.route('/historico')
+def historico():
+    # Obter parâmetros de busca e filtro
+    filtros = obter_filtros_historico()
+    tags_filtro, modo_tags, busca_texto, tipo_filtro, data_inicio, data_fim = filtros
+    
+    # Limite de registros por página
+    registros_por_pagina = app.config['HISTORICO_PAGE_SIZE']
     
-    # Calcular total de páginas
-    total_paginas = (total_registros + registros_por_pagina - 1) // registros_por_pagina if total_registros > 0 else 1
+    query, filtros_aplicados = filtrar_comunicados(*filtros)
+    query = query.options(*colunas_listagem_historico())
+    consulta = indice_busca.consulta_fts(busca_texto)
     
-    # Ajustar página atual se necessário
-    if pagina_atual > total_paginas and total_paginas > 0:
-        pagina_atual = total_paginas
+    # Total de registros: contagem em cache, renovada em segundo plano. Sem valor ainda,
+    # a página é exibida sem o total e o navegador o busca em /historico/contagem
+    chave_contagem = _chave_contagem(filtros)
+    calcular_total = lambda: contar_historico(filtros)
     
-    # Calcular offset
-    offset = (pagina_atual - 1) * registros_por_pagina
+    pagina_atual = None
+    total_paginas = None
+    if consulta:
+        # Busca: os mais relevantes primeiro. O bm25 já pontua todos os resultados da busca,
+        # então aqui a paginação continua por número de página
+        try:
+            pagina_atual = max(1, int(request.args.get('page', 1)))
+        except (ValueError, TypeError):
+            pagina_atual = 1
+        
+        total_registros = contagens_historico.obter(chave_contagem, calcular_total)
+        total_paginas = max(1, (total_registros + registros_por_pagina - 1) // registros_por_pagina)
+        pagina_atual = min(pagina_atual, total_paginas)
+        
+        comunicados = (query.order_by(indice_busca.relevancia(), Comunicado.criado_em.desc())
+                       .offset((pagina_atual - 1) * registros_por_pagina).limit(registros_por_pagina).all())
+        
+        url_primeira = _url_historico() if pagina_atual > 1 else None
+        url_anterior = _url_historico(page=pagina_atual - 1) if pagina_atual > 1 else None
+        url_proxima = _url_historico(page=pagina_atual + 1) if pagina_atual < total_paginas else None
+        url_ultima = _url_historico(page=total_paginas) if pagina_atual < total_paginas else None
+    else:
+        # Listagem: paginação por cursor em (criado_em, id), com custo constante por página
+        total_registros = contagens_historico.obter(chave_contagem, calcular_total, aguardar=False)
+        
+        depois = decodificar_cursor(request.args.get('depois'))
+        antes = decodificar_cursor(request.args.get('antes'))
+        ultima = request.args.get('ultima') == '1' and not (depois or antes)
+        comunicados, tem_anterior, tem_proxima = paginar_por_cursor(
+            query, registros_por_pagina, depois=depois, antes=antes, ultima=ultima
+        )
+        
+        url_primeira = url_anterior = url_proxima = url_ultima = None
+        if comunicados and tem_anterior:
+            url_primeira = _url_historico()
+            url_anterior = _url_historico(antes=codificar_cursor(comunicados[0]))
+        if comunicados and tem_proxima:
+            url_proxima = _url_historico(depois=codificar_cursor(comunicados[-1]))
+            url_ultima = _url_historico(ultima='1')
     
-    # Executar query com paginação
-    comunicados = query.order_by(Comunicado.criado_em.desc()).offset(offset).limit(registros_por_pagina).all()
+    # Trechos do texto com os termos buscados destacados
+    trechos_busca = {}
+    if consulta:
+        trechos_busca = indice_busca.trechos_destacados(db.session, consulta, [c.id for c in comunicados])
     
-    # Coletar todas as tags únicas para o filtro
-    todas_tags = set()
-    for com in Comunicado.query.all():
-        if com.tags:
-            tags_list = [tag.strip() for tag in com.tags.split(',')]
-            todas_tags.update(tags_list)
+    # Tags em uso e quantos comunicados têm cada uma (totais mantidos a cada alteração)
+    todas_tags = Tag.query.with_entities(Tag.nome, Tag.total).filter(Tag.total > 0).order_by(Tag.nome).all()
     
     # Coletar tipos para o dropdown
     # Lista para comparação (usando minusculo para ser mais seguro)
@@ -520,11 +1239,18 @@ def historico():
     if has_custom:
         todos_tipos_dropdown.append('Personalizado')
     
+    # Versão de cada miniatura na URL (servidas com cache longo)
+    versao_configs = versao_configuracoes()
+    versoes_miniatura = {c.id: versao_miniatura(c, versao_configs) for c in comunicados}
+    
     return render_template('historico.html', 
                          comunicados=comunicados, 
-                         todas_tags=sorted(todas_tags),
+                         versoes_miniatura=versoes_miniatura,
+                         trechos_busca=trechos_busca,
+                         todas_tags=todas_tags,
                          todos_tipos=todos_tipos_dropdown,
-                         tag_filtro=tag_filtro,
+                         tags_filtro=tags_filtro,
+                         modo_tags=modo_tags,
                          busca_texto=busca_texto,
                          tipo_filtro=tipo_filtro,
                          data_inicio=data_inicio,
@@ -532,13 +1258,100 @@ def historico():
                          pagina_atual=pagina_atual,
                          total_paginas=total_paginas,
                          total_registros=total_registros,
-                         registros_por_pagina=registros_por_pagina)
+                         url_primeira=url_primeira,
+                         url_anterior=url_anterior,
+                         url_proxima=url_proxima,
+                         url_ultima=url_ultima,
+                         url_contagem=url_for('contagem_historico', **request.args.to_dict(flat=False)))
+
+@app.route('/historico/contagem')
+def contagem_historico():
+    """Total de comunicados dos filtros do histórico (usado quando a página abre sem o total)"""
+    filtros = obter_filtros_historico()
+    total = contagens_historico.obter(_chave_contagem(filtros), lambda: contar_historico(filtros))
+    return jsonify({'total': total})
+
+class _StreamZip(RawIOBase):
+    """Destino de escrita do ZipFile que acumula os bytes até serem enviados ao cliente"""
+    
+    def __init__(self):
+        self._partes = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+    
+    def coletar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+def _gerar_zip_imagens(comunicado_ids):
+    """Renderiza as imagens em paralelo e gera o ZIP em pedaços, à medida que cada imagem fica pronta"""
+    stream = _StreamZip()
+    erros = []
+    executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'])
+    try:
+        # PNG já é comprimido: armazenar sem compressão
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as zf:
+            futures = {executor.submit(renderizar_imagem_por_id, cid, True): cid for cid in comunicado_ids}
+            for future in as_completed(futures):
+                try:
+                    resultado = future.result()
+                    dados = resultado['bytes']
+                except Exception as e:
+                    erros.append(f'Comunicado {futures[future]}: {e}')
+                    continue
+                
+                zf.writestr(f"{resultado['codigo_unico']}_{resultado['nome_arquivo']}", dados)
+                yield stream.coletar()
+            
+            if erros:
+                zf.writestr('erros.txt', '\n'.join(erros))
+        yield stream.coletar()
+    finally:
+        # Cliente desconectou ou terminou: não renderizar o que ainda está pendente
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.route('/historico/exportar')
+@rate_limit
+def exportar_historico():
+    """Exporta em ZIP as imagens de todos os comunicados que atendem aos filtros do histórico"""
+    filtros = obter_filtros_historico()
+    query, filtros_aplicados = filtrar_comunicados(*filtros)
+    
+    limite = app.config['EXPORT_MAX_ITEMS']
+    comunicado_ids = [row[0] for row in query.order_by(Comunicado.criado_em.desc())
+                      .with_entities(Comunicado.id).limit(limite + 1).all()]
+    
+    if not comunicado_ids:
+        return jsonify({'error': 'Nenhum comunicado encontrado com os filtros informados'}), 404
+    if len(comunicado_ids) > limite:
+        return jsonify({'error': f'Exportação limitada a {limite} comunicados. Refine os filtros.'}), 400
+    
+    logger.info(f"[EXPORTAR] IP: {request.remote_addr} | Filtros: {', '.join(filtros_aplicados) or 'nenhum'} | Total: {len(comunicado_ids)}")
+    
+    nome_zip = f"comunicados_{agora_brasil().strftime('%Y%m%d_%H%M')}.zip"
+    return Response(
+        _gerar_zip_imagens(comunicado_ids),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={nome_zip}'}
+    )
 
 @app.route('/comunicado/<int:comunicado_id>')
 def obter_comunicado(comunicado_id):
     """Retorna dados de um comunicado para edição"""
     comunicado = Comunicado.query.get_or_404(comunicado_id)
-    return jsonify({
+    
+    etag = etag_comunicado(comunicado)
+    nao_modificada = resposta_nao_modificada(etag, CACHE_CONTROL_COMUNICADO)
+    if nao_modificada is not None:
+        return nao_modificada
+    
+    resposta = jsonify({
         'id': comunicado.id,
         'codigo_unico': comunicado.codigo_unico,
         'titulo': comunicado.titulo,
@@ -563,6 +1376,9 @@ def obter_comunicado(comunicado_id):
         'criado_em': comunicado.criado_em.isoformat(),
         'tags': comunicado.tags or ''
     })
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = CACHE_CONTROL_COMUNICADO
+    return resposta
 
 @app.route('/comunicado/<int:comunicado_id>', methods=['PUT'])
 @rate_limit
@@ -614,6 +1430,8 @@ def atualizar_comunicado(comunicado_id):
     comunicado.publico_alvo_tamanho = safe_int(data.get('publico_alvo_tamanho'), comunicado.publico_alvo_tamanho or 16)
     
     db.session.commit()
+    invalidar_cache_comunicado(comunicado.id)
+    pre_renderizar_imagem(comunicado)
     
     return jsonify({'success': True, 'id': comunicado.id, 'codigo': comunicado.codigo_unico})
 
@@ -632,6 +1450,9 @@ def atualizar_status(comunicado_id):
     comunicado.atualizado_por = data.get('atualizado_por', 'Sistema')
     
     db.session.commit()
+    invalidar_cache_comunicado(comunicado_id)
+    if old_status != new_status:
+        pre_renderizar_imagem(comunicado)
     
     return jsonify({'success': True, 'status': comunicado.status})
 
@@ -664,101 +1485,129 @@ def deletar_comunicado(comunicado_id):
     
     db.session.delete(comunicado)
     db.session.commit()
+    invalidar_cache_comunicado(comunicado_id)
     
     return jsonify({'success': True})
 
 
-def migrar_banco_dados():
-    """Adiciona colunas novas ao banco de dados existente"""
-    with app.app_context():
-        try:
-            # Verificar se a coluna tags existe consultando o schema do SQLite
-            result = db.session.execute(text("PRAGMA table_info(comunicado)"))
-            columns = [row[1] for row in result]  # row[1] é o nome da coluna
-            
-            if 'tags' not in columns:
-                logger.info("🔄 Adicionando coluna 'tags' à tabela 'comunicado'...")
-                db.session.execute(text("ALTER TABLE comunicado ADD COLUMN tags TEXT DEFAULT ''"))
-                db.session.commit()
-                logger.info("✅ Coluna 'tags' adicionada com sucesso!")
-            else:
-                logger.info("✅ Coluna 'tags' já existe no banco de dados")
-        except Exception as e:
-            logger.error(f"❌ Erro ao migrar banco de dados: {e}")
-            # Se der erro, tenta criar tudo do zero
-            try:
-                db.create_all()
-            except Exception as ex:
-                logger.error(f"❌ Erro ao criar tabelas: {ex}")
+def _horario_suspeito(dt):
+    """Horários entre 00:00 e 03:59 provavelmente foram gravados em UTC"""
+    return dt is not None and dt.tzinfo is None and 0 <= dt.hour < 4
 
-def corrigir_horarios_comunicados():
+def _utc_para_brasil(dt):
+    return dt.replace(tzinfo=timezone.utc).astimezone(TZ_BRASIL).replace(tzinfo=None)
+
+def corrigir_horarios_utc(conexao):
     """Corrige os horários dos comunicados existentes de UTC para horário de Brasília (UTC-3)
     Apenas corrige comunicados com horário suspeito (00:00-03:59), que provavelmente estão em UTC
+
+    Returns:
+        list: (id, criado_em original, criado_em corrigido) de cada comunicado corrigido
     """
-    try:
-        with app.app_context():
-            comunicados = Comunicado.query.all()
-            if not comunicados:
-                logger.info("ℹ️ Nenhum comunicado encontrado para corrigir")
-                return
-            
-            logger.info(f"🔄 Verificando horários de {len(comunicados)} comunicado(s)...")
-            corrigidos = 0
-            
-            for comunicado in comunicados:
-                atualizado = False
-                
-                # Corrigir criado_em apenas se o horário for suspeito (00:00-03:59)
-                # Isso indica que provavelmente está em UTC
-                if comunicado.criado_em:
-                    dt_original = comunicado.criado_em
-                    hora = dt_original.hour
-                    
-                    # Se o horário está entre 00:00 e 03:59, provavelmente está em UTC
-                    # e precisa ser convertido para UTC-3 (subtrair 3 horas)
-                    if dt_original.tzinfo is None and (hora >= 0 and hora < 4):
-                        # Adicionar timezone UTC
-                        dt_utc = dt_original.replace(tzinfo=timezone.utc)
-                        # Converter para horário de Brasília (UTC-3)
-                        dt_brasil = dt_utc.astimezone(TZ_BRASIL)
-                        # Remover timezone para salvar como naive
-                        comunicado.criado_em = dt_brasil.replace(tzinfo=None)
-                        logger.info(f"  Corrigido ID {comunicado.id}: {dt_original.strftime('%d/%m/%Y %H:%M')} → {comunicado.criado_em.strftime('%d/%m/%Y %H:%M')}")
-                        atualizado = True
-                
-                # Corrigir atualizado_em apenas se o horário for suspeito
-                if comunicado.atualizado_em:
-                    dt_original = comunicado.atualizado_em
-                    hora = dt_original.hour
-                    if dt_original.tzinfo is None and (hora >= 0 and hora < 4):
-                        dt_utc = dt_original.replace(tzinfo=timezone.utc)
-                        dt_brasil = dt_utc.astimezone(TZ_BRASIL)
-                        comunicado.atualizado_em = dt_brasil.replace(tzinfo=None)
-                        atualizado = True
-                
-                if atualizado:
-                    corrigidos += 1
-            
-            if corrigidos > 0:
-                db.session.commit()
-                logger.info(f"✅ {corrigidos} comunicado(s) corrigido(s) com sucesso!")
-            else:
-                logger.info("ℹ️ Nenhum comunicado precisou de correção (todos já estão no horário correto)")
-                
-    except Exception as e:
-        logger.error(f"❌ Erro ao corrigir horários: {e}")
-        db.session.rollback()
+    tabela = Comunicado.__table__
+    linhas = conexao.execute(select(tabela.c.id, tabela.c.criado_em, tabela.c.atualizado_em)).fetchall()
+    corrigidos = []
+    for comunicado_id, criado_em, atualizado_em in linhas:
+        if not (_horario_suspeito(criado_em) or _horario_suspeito(atualizado_em)):
+            continue
+        novo_criado_em = _utc_para_brasil(criado_em) if _horario_suspeito(criado_em) else criado_em
+        novo_atualizado_em = _utc_para_brasil(atualizado_em) if _horario_suspeito(atualizado_em) else atualizado_em
+        # atualizado_em sempre explícito, senão o onupdate da coluna o trocaria pela hora atual
+        conexao.execute(
+            tabela.update().where(tabela.c.id == comunicado_id)
+            .values(criado_em=novo_criado_em, atualizado_em=novo_atualizado_em)
+        )
+        corrigidos.append((comunicado_id, criado_em, novo_criado_em))
+    return corrigidos
+
+# Migrações do esquema, aplicadas uma única vez cada (ver scripts/migracoes.py).
+# Bancos novos já nascem com as colunas e índices pelo db.create_all(), então as
+# migrações verificam antes de alterar. Nunca renumerar nem remover uma migração publicada.
+
+def _migracao_coluna_tags(conexao):
+    if 'tags' not in colunas_tabela(conexao, 'comunicado'):
+        conexao.execute(text("ALTER TABLE comunicado ADD COLUMN tags TEXT DEFAULT ''"))
+
+def _migracao_coluna_corpo_layout(conexao):
+    if 'corpo_layout' not in colunas_tabela(conexao, 'comunicado'):
+        conexao.execute(text("ALTER TABLE comunicado ADD COLUMN corpo_layout TEXT"))
+    # Compilar o layout dos comunicados existentes
+    linhas = conexao.execute(text("SELECT id, corpo FROM comunicado WHERE corpo_layout IS NULL")).fetchall()
+    for comunicado_id, corpo in linhas:
+        conexao.execute(
+            text("UPDATE comunicado SET corpo_layout = :layout WHERE id = :id"),
+            {'layout': serializar_layout(corpo), 'id': comunicado_id}
+        )
+    logger.info(f"  {len(linhas)} layout(s) compilado(s)")
+
+def _migracao_horarios_utc(conexao):
+    for comunicado_id, antes, depois in corrigir_horarios_utc(conexao):
+        logger.info(f"  Corrigido ID {comunicado_id}: {antes.strftime('%d/%m/%Y %H:%M')} → {depois.strftime('%d/%m/%Y %H:%M')}")
+
+def _migracao_indice_busca(conexao):
+    """Cria o índice FTS5 da busca do histórico e indexa os comunicados já existentes"""
+    if not indice_busca.criar_indice(conexao):
+        return
+    linhas = conexao.execute(text("SELECT id, titulo, subtitulo, corpo, corpo_layout FROM comunicado")).fetchall()
+    for linha in linhas:
+        indice_busca.indexar(conexao, linha.id, linha.titulo, linha.subtitulo,
+                             texto_plano(obter_layout(linha)))
+    logger.info(f"  {len(linhas)} comunicado(s) indexado(s)")
+
+def _migracao_tabela_tags(conexao):
+    """Preenche as tabelas de tags com as tags dos comunicados, se ainda estiverem vazias"""
+    if conexao.execute(select(comunicado_tag.c.tag_id).limit(1)).first():
+        return
+    linhas = conexao.execute(text("SELECT id, tags FROM comunicado WHERE tags IS NOT NULL AND tags != ''")).fetchall()
+    for comunicado_id, tags in linhas:
+        sincronizar_tags(conexao, comunicado_id, tags)
+    logger.info(f"  Tags de {len(linhas)} comunicado(s) registradas")
+
+def _migracao_indices_comunicado(conexao):
+    # O índice de criado_em também atende a ordenação (criado_em, id) da paginação do
+    # histórico: no SQLite todo índice já carrega o rowid, que é o id
+    criar_indice(conexao, 'ix_comunicado_criado_em', 'comunicado', ['criado_em'])
+    criar_indice(conexao, 'ix_comunicado_titulo', 'comunicado', ['titulo'])
+    criar_indice(conexao, 'ix_comunicado_status', 'comunicado', ['status'])
+    # Normalmente já coberto pelo índice automático do UNIQUE da coluna
+    criar_indice(conexao, 'ix_comunicado_codigo_unico', 'comunicado', ['codigo_unico'], unico=True)
+
+def _migracao_recompilar_layouts(conexao):
+    """Recompila os layouts gerados por uma versão anterior do compilador e reindexa a busca
+    (reaproveitar em uma nova migração sempre que VERSAO_LAYOUT mudar)"""
+    linhas = conexao.execute(text("SELECT id, titulo, subtitulo, corpo, corpo_layout FROM comunicado")).fetchall()
+    recompilados = 0
+    for linha in linhas:
+        if linha.corpo_layout and json.loads(linha.corpo_layout).get('versao') == VERSAO_LAYOUT:
+            continue
+        layout = serializar_layout(linha.corpo)
+        conexao.execute(
+            text("UPDATE comunicado SET corpo_layout = :layout WHERE id = :id"),
+            {'layout': layout, 'id': linha.id}
+        )
+        indice_busca.indexar(conexao, linha.id, linha.titulo, linha.subtitulo,
+                             texto_plano(json.loads(layout)))
+        recompilados += 1
+    logger.info(f"  {recompilados} layout(s) recompilado(s)")
+
+MIGRACOES = (
+    Migracao(1, "Coluna 'tags' em comunicado", _migracao_coluna_tags),
+    Migracao(2, "Coluna 'corpo_layout' em comunicado", _migracao_coluna_corpo_layout),
+    Migracao(3, "Horários gravados em UTC convertidos para Brasília", _migracao_horarios_utc),
+    Migracao(4, "Índice de busca textual (FTS5)", _migracao_indice_busca),
+    Migracao(5, "Tabela de tags", _migracao_tabela_tags),
+    Migracao(6, "Índices de criado_em, titulo, status e codigo_unico", _migracao_indices_comunicado),
+    Migracao(7, "Layout do corpo recompilado (sublinhado e listas numeradas)", _migracao_recompilar_layouts),
+    Migracao(8, "Layout do corpo recompilado (espaços em branco como no navegador)", _migracao_recompilar_layouts),
+)
 
 def inicializar_dados():
     """Cria dados iniciais se não existirem"""
     with app.app_context():
-        # Primeiro, fazer migração se necessário
-        migrar_banco_dados()
-        
         db.create_all()
         
-        # Corrigir horários dos comunicados existentes
-        corrigir_horarios_comunicados()
+        # Aplicar as migrações pendentes (com o esquema atualizado, apenas uma consulta)
+        aplicar_migracoes(db.engine, MIGRACOES)
         
         # Configurações padrão
         configs_padrao = [
@@ -788,6 +1637,11 @@ def inicializar_dados():
         
         db.session.commit()
         logger.info("✅ Banco de dados inicializado")
+    
+    # Aquecer o cache de fontes do renderizador PIL
+    if app.config['PRELOAD_FONTS']:
+        from scripts.gerar_imagem import pre_carregar_fontes
+        pre_carregar_fontes()
 
 if __name__ == '__main__':
     inicializar_dados()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Benchmark e comparação de fidelidade dos renderizadores de imagem
+
+Gera um conjunto de comunicados sintéticos (todos os títulos padrão, todos os
+modelos de static/modelos, corpo curto, longo e com muita formatação), mede o
+tempo de cada etapa dos dois renderizadores (HTML/Chrome e PIL), a memória e a
+diferença entre as imagens geradas por eles.
+
+Uso:
+    python scripts/benchmark_renderizacao.py [--repeticoes 5] [--renderizador ambos|html|pil]
+                                             [--filtro texto] [--saida relatorio.json]
+                                             [--comparar base.json] [--tolerancia 0.2]
+
+Com --comparar, o script termina com código 1 se o p50 de algum caso ficou mais
+lento que o relatório base além da tolerância (para acompanhar regressões entre versões).
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from PIL import Image, ImageChops, ImageStat
+
+from scripts.gerar_imagem import desenhar_comunicado, QUALIDADE_IMAGEM
+from scripts.layout_texto import serializar_layout
+
+TITULOS_PADRAO = ['Indisponibilidade', 'Instabilidade', 'Degradação', 'Normalização', 'Manutenção Programada']
+
+CORPO_CURTO = '<div>Serviço afetado na região Sudeste. Equipes já estão atuando.</div>'
+
+CORPO_LONGO = '<div>' + ' '.join(
+    ['O serviço apresenta lentidão no acesso para parte dos usuários e as equipes responsáveis '
+     'seguem investigando a causa junto aos fornecedores envolvidos.'] * 12
+) + '</div>'
+
+CORPO_FORMATADO = (
+    '<div><b>Impacto:</b> usuários de <i>todas as praças</i> sem acesso ao <b>SAP</b> e ao <b><i>portal</i></b>.</div>'
+    '<div><br></div>'
+    '<ul>'
+    + ''.join(f'<li><b>Sistema {n}</b> com <i>falha intermitente</i> desde as {n:02d}h</li>' for n in range(1, 9))
+    + '</ul>'
+    '<div><i>Próxima atualização em 30 minutos.</i> <b>Não é necessário abrir chamado.</b></div>'
+)
+
+CORPOS = {'curto': CORPO_CURTO, 'longo': CORPO_LONGO, 'formatado': CORPO_FORMATADO}
+
+# Diferença por canal acima da qual um pixel é considerado diferente
+LIMIAR_PIXEL = 32
+
+
+def _modelos():
+    """Fundos disponíveis em static/modelos, mais o gradiente padrão (None)."""
+    pasta = os.path.join(BASE_DIR, 'static', 'modelos')
+    arquivos = sorted(f for f in os.listdir(pasta) if not f.startswith('.')) if os.path.isdir(pasta) else []
+    return [None] + [f'modelos/{f}' for f in arquivos]
+
+
+def montar_corpus():
+    """Monta os comunicados sintéticos do benchmark, com as mesmas posições padrão de criar_comunicado."""
+    casos = []
+    for titulo in TITULOS_PADRAO:
+        especial = titulo.upper() in ('INDISPONIBILIDADE', 'INSTABILIDADE', 'DEGRADAÇÃO', 'NORMALIZAÇÃO')
+        for fundo in _modelos():
+            for nome_corpo, corpo in CORPOS.items():
+                comunicado = SimpleNamespace(
+                    id=None,
+                    titulo=titulo,
+                    subtitulo='Sistema SAP - São Paulo e Rio de Janeiro',
+                    corpo=corpo,
+                    corpo_layout=serializar_layout(corpo),
+                    rodape='Dúvidas: <b>gcc@g.globo</b>',
+                    publico_alvo='Todos os colaboradores',
+                    template=SimpleNamespace(imagem_fundo=fundo) if fundo else None,
+                    tipo_pos_x=60, tipo_pos_y=120 if especial else 80, tipo_tamanho=60 if especial else 42,
+                    subtitulo_pos_x=0, subtitulo_pos_y=430, subtitulo_tamanho=32,
+                    corpo_pos_x=60, corpo_pos_y=510, corpo_tamanho=24, corpo_alinhamento='justify',
+                    rodape_pos_x=60, rodape_pos_y=1200, rodape_tamanho=24,
+                    publico_alvo_pos_x=60, publico_alvo_pos_y=1120, publico_alvo_tamanho=16,
+                )
+                nome_fundo = os.path.splitext(os.path.basename(fundo))[0] if fundo else 'gradiente'
+                casos.append((f'{titulo}/{nome_fundo}/{nome_corpo}', comunicado))
+    return casos
+
+
+def _cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def renderizar_pil(comunicado, configs):
+    """Renderizador PIL. Retorna (bytes PNG, tempos por etapa em ms)."""
+    img, t_desenho = _cronometrar(desenhar_comunicado, comunicado, configs)
+
+    def codificar():
+        saida = BytesIO()
+        img.save(saida, format='PNG', quality=QUALIDADE_IMAGEM)
+        return saida.getvalue()
+
+    png, t_codificacao = _cronometrar(codificar)
+    return png, {'desenho': t_desenho, 'codificacao': t_codificacao}
+
+
+def renderizar_html(comunicado, configs):
+    """Renderizador HTML/Chrome. Retorna (bytes PNG, tempos por etapa em ms)."""
+    from scripts.gerar_imagem_html import renderizar_html_comunicado, capturar_html, LARGURA_IMAGEM, ALTURA_IMAGEM
+
+    html, t_template = _cronometrar(renderizar_html_comunicado, comunicado, configs)
+    png, t_captura = _cronometrar(capturar_html, html, (LARGURA_IMAGEM, ALTURA_IMAGEM))
+
+    def decodificar():
+        with Image.open(BytesIO(png)) as img:
+            img.load()
+
+    _, t_decodificacao = _cronometrar(decodificar)
+    return png, {'template': t_template, 'captura': t_captura, 'decodificacao': t_decodificacao}
+
+
+RENDERIZADORES = {'html': renderizar_html, 'pil': renderizar_pil}
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def _resumo(amostras):
+    return {
+        'p50': round(statistics.median(amostras), 2),
+        'p95': round(_percentil(amostras, 95), 2),
+        'min': round(min(amostras), 2),
+    }
+
+
+def _ssim_blocos(a, b, bloco=8):
+    """SSIM médio em tons de cinza, calculado em blocos sem sobreposição (sem numpy)."""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    largura, altura = a.size
+    pa, pb = a.load(), b.load()
+    soma, total = 0.0, 0
+    n = bloco * bloco
+    for y0 in range(0, altura - bloco + 1, bloco):
+        for x0 in range(0, largura - bloco + 1, bloco):
+            va = [pa[x, y] for y in range(y0, y0 + bloco) for x in range(x0, x0 + bloco)]
+            vb = [pb[x, y] for y in range(y0, y0 + bloco) for x in range(x0, x0 + bloco)]
+            ma, mb = sum(va) / n, sum(vb) / n
+            var_a = sum((v - ma) ** 2 for v in va) / n
+            var_b = sum((v - mb) ** 2 for v in vb) / n
+            cov = sum((x - ma) * (y - mb) for x, y in zip(va, vb)) / n
+            soma += ((2 * ma * mb + c1) * (2 * cov + c2)) / ((ma ** 2 + mb ** 2 + c1) * (var_a + var_b + c2))
+            total += 1
+    return soma / total if total else 1.0
+
+
+def comparar_imagens(png_a, png_b):
+    """
+    Diferença entre duas renderizações do mesmo comunicado.
+
+    Returns:
+        dict: erro médio absoluto (0-255), % de pixels diferentes e SSIM (1 = idênticas)
+    """
+    with Image.open(BytesIO(png_a)) as img_a, Image.open(BytesIO(png_b)) as img_b:
+        # O fundo transparente do Chrome é comparado como branco
+        a = Image.alpha_composite(Image.new('RGBA', img_a.size, 'white'), img_a.convert('RGBA')).convert('RGB')
+        b = Image.alpha_composite(Image.new('RGBA', img_b.size, 'white'), img_b.convert('RGBA')).convert('RGB')
+    if b.size != a.size:
+        b = b.resize(a.size, Image.LANCZOS)
+
+    diferenca = ImageChops.difference(a, b)
+    erro_medio = sum(ImageStat.Stat(diferenca).mean) / 3
+    mascara = diferenca.convert('L').point(lambda v: 255 if v > LIMIAR_PIXEL else 0)
+    pixels_diferentes = ImageStat.Stat(mascara).mean[0] / 255 * 100
+
+    # SSIM em 1/4 da resolução, suficiente para detectar blocos de texto deslocados
+    reduzido = (a.width // 4, a.height // 4)
+    ssim = _ssim_blocos(a.convert('L').resize(reduzido, Image.BOX), b.convert('L').resize(reduzido, Image.BOX))
+
+    return {
+        'erro_medio': round(erro_medio, 2),
+        'pixels_diferentes_pct': round(pixels_diferentes, 2),
+        'ssim': round(ssim, 4),
+    }
+
+
+def medir_caso(comunicado, configs, renderizadores, repeticoes):
+    """Executa os renderizadores sobre um comunicado e retorna tempos, memória e a diferença entre eles."""
+    resultado = {}
+    imagens = {}
+    for nome in renderizadores:
+        renderizar = RENDERIZADORES[nome]
+        etapas = {}
+        totais = []
+        try:
+            # Primeira execução aquece caches (fontes, fundos, navegador) e mede a memória.
+            # tracemalloc vê só as alocações do Python; buffers de pixels do Pillow e o Chrome ficam
+            # de fora e aparecem apenas na memória máxima do processo
+            tracemalloc.start()
+            png, _ = renderizar(comunicado, configs)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                png, tempos = renderizar(comunicado, configs)
+                totais.append((time.perf_counter() - inicio) * 1000)
+                for etapa, ms in tempos.items():
+                    etapas.setdefault(etapa, []).append(ms)
+        except Exception as e:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            resultado[nome] = {'erro': str(e)}
+            continue
+
+        imagens[nome] = png
+        resultado[nome] = {
+            'total': _resumo(totais),
+            'etapas': {etapa: _resumo(ms) for etapa, ms in etapas.items()},
+            'memoria_python_kb': round(pico / 1024),
+            'tamanho_kb': round(len(png) / 1024),
+        }
+
+    if 'html' in imagens and 'pil' in imagens:
+        resultado['diferenca'] = comparar_imagens(imagens['html'], imagens['pil'])
+    return resultado
+
+
+def comparar_com_base(relatorio, base, tolerancia):
+    """Lista os casos cujo p50 piorou mais que a tolerância em relação ao relatório base."""
+    regressoes = []
+    for caso, dados in relatorio['casos'].items():
+        for nome, atual in dados.items():
+            anterior = base.get('casos', {}).get(caso, {}).get(nome, {})
+            if 'total' not in atual or 'total' not in anterior:
+                continue
+            if atual['total']['p50'] > anterior['total']['p50'] * (1 + tolerancia):
+                regressoes.append((caso, nome, anterior['total']['p50'], atual['total']['p50']))
+    return regressoes
+
+
+def _carregar_configs():
+    """Configurações de estilo do banco, ou vazias (padrões dos renderizadores) se indisponível."""
+    try:
+        from app import app, Configuracao
+        with app.app_context():
+            return {c.chave: c.valor for c in Configuracao.query.all()}
+    except Exception as e:
+        print(f"⚠️ Usando configurações padrão ({e})")
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark e fidelidade dos renderizadores de imagem')
+    parser.add_argument('--repeticoes', type=int, default=5, help='execuções medidas por caso (padrão: 5)')
+    parser.add_argument('--renderizador', choices=['ambos', 'html', 'pil'], default='ambos')
+    parser.add_argument('--filtro', help='executar apenas casos cujo nome contenha este texto')
+    parser.add_argument('--saida', help='gravar o relatório em JSON neste arquivo')
+    parser.add_argument('--comparar', help='relatório JSON de referência para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='piora aceita do p50 em relação à referência (padrão: 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    renderizadores = ['html', 'pil'] if args.renderizador == 'ambos' else [args.renderizador]
+    configs = _carregar_configs()
+    casos = [(nome, c) for nome, c in montar_corpus() if not args.filtro or args.filtro.lower() in nome.lower()]
+
+    print(f"🔄 {len(casos)} caso(s), {args.repeticoes} repetição(ões), renderizador(es): {', '.join(renderizadores)}\n")
+
+    relatorio = {'repeticoes': args.repeticoes, 'renderizadores': renderizadores, 'casos': {}}
+    for nome, comunicado in casos:
+        dados = medir_caso(comunicado, configs, renderizadores, args.repeticoes)
+        relatorio['casos'][nome] = dados
+
+        linha = [f"{nome:<50}"]
+        for renderizador in renderizadores:
+            r = dados[renderizador]
+            if 'erro' in r:
+                linha.append(f"{renderizador}: erro")
+            else:
+                linha.append(f"{renderizador}: p50 {r['total']['p50']:>7.1f}ms p95 {r['total']['p95']:>7.1f}ms "
+                             f"mem py {r['memoria_python_kb']:>5}KB")
+        if 'diferenca' in dados:
+            d = dados['diferenca']
+            linha.append(f"dif {d['pixels_diferentes_pct']:>5.1f}% ssim {d['ssim']:.3f}")
+        print(' | '.join(linha))
+
+    relatorio['memoria_max_processo_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    erros = {n: d[r]['erro'] for n, d in relatorio['casos'].items() for r in renderizadores if 'erro' in d[r]}
+    if erros:
+        print(f"\n⚠️ {len(erros)} caso(s) com erro. Primeiro: {next(iter(erros.values()))}")
+
+    print(f"\n📊 Memória máxima do processo: {relatorio['memoria_max_processo_kb'] // 1024} MB")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"✅ Relatório gravado em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regressoes = comparar_com_base(relatorio, base, args.tolerancia)
+        if regressoes:
+            print(f"\n❌ {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}:")
+            for caso, renderizador, antes, depois in regressoes:
+                print(f"  {caso} [{renderizador}]: {antes:.1f}ms → {depois:.1f}ms")
+            sys.exit(1)
+        print("\n✅ Nenhuma regressão em relação à referência")
+
+
+if __name__ == '__main__':
+    main()
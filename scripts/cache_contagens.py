@@ -0,0 +1,94 @@
+"""
+Cache das contagens de registros do histórico
+
+Contar os comunicados de um filtro percorre todas as linhas que o atendem. As
+contagens ficam em memória e, quando vencem (ou algum comunicado é criado ou
+excluído), o valor anterior continua sendo servido enquanto uma thread calcula o novo.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+class CacheContagens:
+    """
+    Contagens por chave de filtro, renovadas em segundo plano (stale-while-revalidate).
+
+    Args:
+        ttl: Segundos até uma contagem ser recalculada
+        max_itens: Quantidade de filtros diferentes guardados (os menos usados saem primeiro)
+    """
+
+    def __init__(self, ttl=60, max_itens=256):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._itens = OrderedDict()  # chave -> (valor, calculado_em, geracao)
+        self._atualizando = set()
+        self._geracao = 0
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        """Marca todas as contagens como desatualizadas (continuam servidas até serem recalculadas)."""
+        with self._lock:
+            self._geracao += 1
+
+    def obter(self, chave, calcular, aguardar=True):
+        """
+        Retorna a contagem da chave.
+
+        Args:
+            chave: Identificação do filtro (hashable)
+            calcular: Função sem argumentos que conta os registros
+            aguardar: Sem valor em cache, True calcula agora; False agenda o cálculo e retorna None
+
+        Returns:
+            int | None: Contagem (possivelmente desatualizada em até `ttl` segundos)
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+            geracao = self._geracao
+
+        if item is None:
+            if aguardar:
+                return self._calcular(chave, calcular)
+            self._atualizar_em_segundo_plano(chave, calcular)
+            return None
+
+        valor, calculado_em, geracao_item = item
+        if time.monotonic() - calculado_em > self.ttl or geracao_item != geracao:
+            self._atualizar_em_segundo_plano(chave, calcular)
+        return valor
+
+    def _calcular(self, chave, calcular):
+        with self._lock:
+            geracao = self._geracao
+        valor = calcular()
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic(), geracao)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+        return valor
+
+    def _atualizar_em_segundo_plano(self, chave, calcular):
+        with self._lock:
+            if chave in self._atualizando:
+                return
+            self._atualizando.add(chave)
+
+        def tarefa():
+            try:
+                self._calcular(chave, calcular)
+            except Exception as e:
+                logger.error(f'Erro ao atualizar contagem do histórico: {e}')
+            finally:
+                with self._lock:
+                    self._atualizando.discard(chave)
+
+        threading.Thread(target=tarefa, name='contagem-historico', daemon=True).start()
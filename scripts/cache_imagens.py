@@ -0,0 +1,203 @@
+"""
+Cache em disco das imagens renderizadas dos comunicados
+
+Cada imagem é endereçada por um hash de tudo que afeta a renderização (campos do
+comunicado, configurações e arquivo de fundo do template). Os arquivos ficam em
+disco para serem compartilhados entre workers e o cache é limitado em tamanho,
+removendo primeiro as imagens acessadas há mais tempo (LRU).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Diretório base do projeto (um nível acima do diretório scripts/)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Constantes de configuração (sobrescrevíveis via variáveis de ambiente)
+DIRETORIO_CACHE = os.getenv('RENDER_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'imagens'))
+TAMANHO_MAXIMO_CACHE = int(os.getenv('RENDER_CACHE_MAX_MB', '256')) * 1024 * 1024
+# O tamanho do cache é somado a cada gravação e só medido de novo no disco a cada N gravações
+# (os outros workers também gravam e removem) ou quando a soma passa do limite
+GRAVACOES_POR_VERIFICACAO = int(os.getenv('RENDER_CACHE_CHECK_EVERY', '100'))
+# Ao passar do limite, remover até essa fração dele, para não varrer o cache a cada gravação
+FRACAO_APOS_LIMPEZA = 0.9
+
+# Incrementar quando a lógica de renderização mudar, para não servir imagens antigas
+VERSAO_RENDER = 4
+
+# Colunas do comunicado que influenciam a imagem gerada
+CAMPOS_RENDER = (
+    'titulo', 'subtitulo', 'corpo', 'rodape', 'publico_alvo', 'template_id',
+    'tipo_pos_x', 'tipo_pos_y', 'tipo_tamanho',
+    'subtitulo_pos_x', 'subtitulo_pos_y', 'subtitulo_tamanho',
+    'corpo_pos_x', 'corpo_pos_y', 'corpo_tamanho', 'corpo_alinhamento',
+    'rodape_pos_x', 'rodape_pos_y', 'rodape_tamanho',
+    'publico_alvo_pos_x', 'publico_alvo_pos_y', 'publico_alvo_tamanho',
+)
+
+# Estimativa do tamanho do cache neste processo (None até a primeira medição)
+_lock_tamanho = threading.Lock()
+_tamanho_estimado = None
+_gravacoes_sem_verificar = 0
+
+
+def _assinatura_fundo(comunicado):
+    """Identifica o arquivo de fundo do template pelo caminho, tamanho e data de modificação."""
+    template = comunicado.template
+    if not template or not template.imagem_fundo:
+        return None
+    caminho = os.path.join(BASE_DIR, 'static', template.imagem_fundo)
+    try:
+        stat = os.stat(caminho)
+        return [template.imagem_fundo, stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return [template.imagem_fundo, None, None]
+
+
+def chave_render(comunicado, configs):
+    """Calcula o hash que identifica a imagem renderizada de um comunicado."""
+    dados = {campo: getattr(comunicado, campo, None) for campo in CAMPOS_RENDER}
+    dados['configs'] = dict(configs)
+    dados['fundo'] = _assinatura_fundo(comunicado)
+    dados['versao'] = VERSAO_RENDER
+    serializado = json.dumps(dados, sort_keys=True, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+def chave_alternativa(chave, validade):
+    """
+    Chave das imagens geradas pelo renderizador alternativo (PIL) quando o Chrome falha.
+
+    Ela não coincide com a chave da renderização HTML e muda a cada `validade` segundos,
+    então a próxima requisição após o Chrome voltar (ou a chave mudar) renderiza pelo HTML.
+    """
+    return f'{chave}-pil{int(time.time() // validade)}'
+
+
+def versao_miniatura(comunicado, versao_configs):
+    """
+    Versão da miniatura usada na URL do histórico (servida com cache longo).
+
+    Muda quando o comunicado é editado, as configurações ou templates mudam
+    (versao_configs), o arquivo de fundo é trocado ou a lógica de renderização muda,
+    sem precisar carregar todos os campos usados em chave_render.
+    """
+    atualizado_em = getattr(comunicado, 'atualizado_em', None)
+    dados = [str(atualizado_em), versao_configs, _assinatura_fundo(comunicado), VERSAO_RENDER]
+    return hashlib.sha256(json.dumps(dados, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def _caminho_cache(comunicado_id, chave, sufixo):
+    return os.path.join(DIRETORIO_CACHE, str(comunicado_id), f'{chave}{sufixo}')
+
+
+def obter_imagem_cache(comunicado_id, chave, sufixo='.png'):
+    """
+    Retorna o caminho da imagem em cache, ou None se não existir.
+
+    O acesso atualiza a data de modificação do arquivo, usada como ordem do LRU.
+    """
+    caminho = _caminho_cache(comunicado_id, chave, sufixo)
+    try:
+        os.utime(caminho)
+    except OSError:
+        return None
+    return caminho
+
+
+def salvar_imagem_cache(comunicado_id, chave, dados, sufixo='.png'):
+    """
+    Grava a imagem no cache de forma atômica e aplica o limite de tamanho.
+
+    Returns:
+        str: Caminho do arquivo gravado, ou None se não foi possível gravar
+    """
+    caminho = _caminho_cache(comunicado_id, chave, sufixo)
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # Gravar em arquivo temporário e renomear, para outros workers nunca lerem arquivo parcial
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(dados)
+            os.replace(temp_path, caminho)
+        except Exception:
+            os.remove(temp_path)
+            raise
+    except OSError as e:
+        logger.error(f'Erro ao gravar imagem no cache: {e}')
+        return None
+
+    _registrar_gravacao(len(dados))
+    return caminho
+
+
+def invalidar_cache_comunicado(comunicado_id):
+    """Remove todas as imagens em cache de um comunicado."""
+    shutil.rmtree(os.path.join(DIRETORIO_CACHE, str(comunicado_id)), ignore_errors=True)
+
+
+def _registrar_gravacao(tamanho):
+    """
+    Soma a gravação ao tamanho estimado do cache e aplica o limite quando necessário.
+
+    A varredura do diretório só acontece na primeira gravação, a cada
+    GRAVACOES_POR_VERIFICACAO gravações ou quando a estimativa passa do limite.
+    Remoções (invalidações) não são descontadas: a estimativa só erra para mais.
+    """
+    global _tamanho_estimado, _gravacoes_sem_verificar
+    with _lock_tamanho:
+        if (_tamanho_estimado is not None
+                and _gravacoes_sem_verificar < GRAVACOES_POR_VERIFICACAO
+                and _tamanho_estimado + tamanho <= TAMANHO_MAXIMO_CACHE):
+            _tamanho_estimado += tamanho
+            _gravacoes_sem_verificar += 1
+            return
+        _tamanho_estimado = _aplicar_limite_cache()
+        _gravacoes_sem_verificar = 0
+
+
+def _aplicar_limite_cache():
+    """
+    Mede o cache e, se passou do limite, remove as imagens menos usadas recentemente
+    até FRACAO_APOS_LIMPEZA do limite.
+
+    Returns:
+        int: Tamanho do cache em bytes após a limpeza
+    """
+    arquivos = []
+    total = 0
+    for raiz, _, nomes in os.walk(DIRETORIO_CACHE):
+        for nome in nomes:
+            if nome.endswith('.tmp'):
+                continue
+            caminho = os.path.join(raiz, nome)
+            try:
+                stat = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((stat.st_mtime, stat.st_size, caminho))
+            total += stat.st_size
+
+    if total <= TAMANHO_MAXIMO_CACHE:
+        return total
+
+    alvo = TAMANHO_MAXIMO_CACHE * FRACAO_APOS_LIMPEZA
+    arquivos.sort()
+    for _, tamanho, caminho in arquivos:
+        if total <= alvo:
+            break
+        try:
+            os.remove(caminho)
+            total -= tamanho
+        except OSError:
+            pass
+    return total
@@ -0,0 +1,129 @@
+"""
+Imagens derivadas da renderização principal do comunicado (miniaturas e formatos de envio)
+
+Todas as variantes saem do mesmo pipeline: a imagem PNG renderizada (mestre) é
+redimensionada para a largura pedida e codificada com parâmetros próprios de cada formato.
+"""
+from PIL import Image, features
+from io import BytesIO
+
+# Miniaturas exibidas no histórico
+LARGURA_MINIATURA = 240
+QUALIDADE_MINIATURA = 75
+
+# Marcador exibido enquanto a miniatura é gerada em segundo plano. É bem menor que uma
+# miniatura real (o histórico reconhece pela largura e volta a pedir a imagem)
+LARGURA_MINIATURA_PROVISORIA = 24
+MINIATURA_PROVISORIA_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="24" height="31" viewBox="0 0 24 31">'
+    '<rect width="24" height="31" fill="#f1f5f9"/></svg>'
+)
+
+# Faixa de largura aceita para download (a imagem mestre nunca é ampliada)
+LARGURA_MINIMA = 100
+LARGURA_MAXIMA = 2000
+
+SUPORTE_WEBP = features.check('webp')
+
+# Formatos de download: extensão, mimetype e parâmetros do Pillow ajustados para cada um
+FORMATOS_SAIDA = {
+    # PNG sem perdas, igual à imagem mestre
+    'png': {'extensao': 'png', 'mimetype': 'image/png', 'formato': 'PNG',
+            'params': {'compress_level': 6}},
+    # PNG com paleta de 256 cores: bem menor, adequado a artes com poucas cores
+    'png8': {'extensao': 'png', 'mimetype': 'image/png', 'formato': 'PNG',
+             'params': {'optimize': True}, 'cores': 256},
+    # JPEG progressivo sem subamostragem de cor, para não borrar texto colorido
+    'jpeg': {'extensao': 'jpg', 'mimetype': 'image/jpeg', 'formato': 'JPEG',
+             'params': {'quality': 85, 'progressive': True, 'optimize': True, 'subsampling': 0}},
+}
+if SUPORTE_WEBP:
+    FORMATOS_SAIDA['webp'] = {'extensao': 'webp', 'mimetype': 'image/webp', 'formato': 'WEBP',
+                              'params': {'quality': 82, 'method': 4}}
+
+# Miniatura em WebP quando o Pillow tiver suporte, senão JPEG
+if SUPORTE_WEBP:
+    FORMATO_MINIATURA = 'WEBP'
+    SUFIXO_MINIATURA = '_mini.webp'
+    MIMETYPE_MINIATURA = 'image/webp'
+else:
+    FORMATO_MINIATURA = 'JPEG'
+    SUFIXO_MINIATURA = '_mini.jpg'
+    MIMETYPE_MINIATURA = 'image/jpeg'
+
+
+def _redimensionar(img, largura):
+    """Reduz a imagem para a largura pedida mantendo a proporção (nunca amplia)."""
+    if not largura or largura >= img.width:
+        return img
+    altura = max(1, round(img.height * largura / img.width))
+    # reducing_gap reduz a imagem por fatores inteiros antes do filtro (bem mais rápido)
+    return img.resize((largura, altura), Image.LANCZOS, reducing_gap=3.0)
+
+
+def _sem_transparencia(img):
+    """Compõe a imagem sobre fundo branco (formatos sem canal alfa, como JPEG)."""
+    if img.mode == 'RGB':
+        return img
+    fundo = Image.new('RGB', img.size, (255, 255, 255))
+    if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+        img = img.convert('RGBA')
+        fundo.paste(img, mask=img.getchannel('A'))
+    else:
+        fundo.paste(img.convert('RGB'))
+    return fundo
+
+
+def _codificar(img, formato, params, cores=None):
+    if formato == 'JPEG':
+        img = _sem_transparencia(img)
+    elif cores:
+        # FASTOCTREE é o quantizador do Pillow que aceita RGBA
+        modo = 'RGBA' if img.mode in ('RGBA', 'LA', 'PA') else 'RGB'
+        metodo = Image.Quantize.FASTOCTREE if modo == 'RGBA' else Image.Quantize.MEDIANCUT
+        img = img.convert(modo).quantize(colors=cores, method=metodo, dither=Image.Dither.FLOYDSTEINBERG)
+
+    saida = BytesIO()
+    img.save(saida, format=formato, **params)
+    return saida.getvalue()
+
+
+def sufixo_variante(formato, largura=None):
+    """Sufixo do arquivo da variante no cache de imagens (ex: '_800_jpeg.jpg')."""
+    return f'_{largura or "orig"}_{formato}.{FORMATOS_SAIDA[formato]["extensao"]}'
+
+
+def gerar_variante(img_bytes, formato='png', largura=None):
+    """
+    Gera uma variante da imagem renderizada para download.
+
+    Args:
+        img_bytes: Imagem mestre (PNG) em bytes
+        formato: Chave de FORMATOS_SAIDA
+        largura: Largura desejada; None mantém o tamanho original
+
+    Returns:
+        bytes: Imagem redimensionada e codificada
+    """
+    config = FORMATOS_SAIDA[formato]
+    with Image.open(BytesIO(img_bytes)) as img:
+        img.load()
+        img = _redimensionar(img, largura)
+        return _codificar(img, config['formato'], config['params'], config.get('cores'))
+
+
+def gerar_miniatura(img_bytes, largura=LARGURA_MINIATURA):
+    """
+    Gera a miniatura de uma imagem renderizada.
+
+    Args:
+        img_bytes: Imagem completa (PNG) em bytes
+        largura: Largura da miniatura; a altura mantém a proporção
+
+    Returns:
+        bytes: Miniatura no formato FORMATO_MINIATURA
+    """
+    with Image.open(BytesIO(img_bytes)) as img:
+        img.load()
+        miniatura = _redimensionar(img, largura)
+        return _codificar(miniatura, FORMATO_MINIATURA, {'quality': QUALIDADE_MINIATURA})
@@ -0,0 +1,107 @@
+"""
+Disjuntor (circuit breaker) para operações que podem falhar de forma persistente
+
+Após `limite_falhas` falhas consecutivas o disjuntor abre e as chamadas são desviadas
+direto para o caminho alternativo durante `tempo_espera` segundos. Passado esse tempo,
+uma única chamada de teste é liberada: se funcionar o disjuntor fecha, senão abre de novo.
+"""
+import logging
+import threading
+import time
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+ESTADO_FECHADO = 'fechado'
+ESTADO_ABERTO = 'aberto'
+ESTADO_MEIO_ABERTO = 'meio_aberto'
+
+
+class Disjuntor:
+    """
+    Disjuntor de um processo (cada worker do gunicorn mantém o seu).
+
+    Args:
+        nome: Identificação usada nos logs
+        limite_falhas: Falhas consecutivas que abrem o disjuntor
+        tempo_espera: Segundos com o disjuntor aberto antes de testar novamente
+    """
+
+    def __init__(self, nome, limite_falhas=3, tempo_espera=60):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_espera = tempo_espera
+        self.estado = ESTADO_FECHADO
+        self.falhas_consecutivas = 0
+        self.sucessos = 0
+        self.falhas = 0
+        self.desvios = 0
+        self.ultimo_erro = None
+        self.aberto_em = None
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Indica se a operação protegida deve ser tentada (False = usar o caminho alternativo)."""
+        with self._lock:
+            if self.estado == ESTADO_FECHADO:
+                return True
+
+            if self.estado == ESTADO_ABERTO and time.time() - self.aberto_em >= self.tempo_espera:
+                self.estado = ESTADO_MEIO_ABERTO
+                self._teste_em_andamento = False
+
+            # Meio aberto: apenas uma chamada de teste por vez
+            if self.estado == ESTADO_MEIO_ABERTO and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                logger.info(f'Disjuntor {self.nome}: testando se voltou a funcionar')
+                return True
+
+            self.desvios += 1
+            return False
+
+    def fechado(self):
+        """Indica se a operação protegida está funcionando normalmente (sem alterar o estado)."""
+        with self._lock:
+            return self.estado == ESTADO_FECHADO
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.sucessos += 1
+            self.falhas_consecutivas = 0
+            if self.estado != ESTADO_FECHADO:
+                logger.info(f'Disjuntor {self.nome}: fechado, operação normalizada')
+            self.estado = ESTADO_FECHADO
+            self.aberto_em = None
+            self._teste_em_andamento = False
+
+    def registrar_falha(self, erro):
+        with self._lock:
+            self.falhas += 1
+            self.falhas_consecutivas += 1
+            self.ultimo_erro = str(erro)
+            self._teste_em_andamento = False
+            if self.estado == ESTADO_MEIO_ABERTO or self.falhas_consecutivas >= self.limite_falhas:
+                if self.estado != ESTADO_ABERTO:
+                    logger.warning(f'Disjuntor {self.nome}: aberto por {self.tempo_espera}s '
+                                   f'após {self.falhas_consecutivas} falha(s): {erro}')
+                self.estado = ESTADO_ABERTO
+                self.aberto_em = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            reabre_em = None
+            if self.estado == ESTADO_ABERTO:
+                reabre_em = max(0.0, round(self.aberto_em + self.tempo_espera - time.time(), 1))
+            return {
+                'nome': self.nome,
+                'estado': self.estado,
+                'falhas_consecutivas': self.falhas_consecutivas,
+                'limite_falhas': self.limite_falhas,
+                'tempo_espera': self.tempo_espera,
+                'segundos_para_teste': reabre_em,
+                'sucessos': self.sucessos,
+                'falhas': self.falhas,
+                'desvios': self.desvios,
+                'ultimo_erro': self.ultimo_erro,
+            }
@@ -0,0 +1,215 @@
+"""
+Fila de renderização assíncrona de imagens
+
+Os pedidos de renderização entram em uma fila limitada e são processados por um
+conjunto de threads em segundo plano, liberando a requisição HTTP. Cada job tem
+um prazo máximo; ao estourar, ele é marcado como erro e o worker segue para o
+próximo (a renderização em andamento termina sozinha e seu resultado é descartado).
+As renderizações abandonadas continuam ocupando uma das `max_execucoes` vagas de
+execução até terminarem, então o número de threads vivas nunca passa desse limite.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de um job
+ESTADO_NA_FILA = 'na_fila'
+ESTADO_PROCESSANDO = 'processando'
+ESTADO_CONCLUIDO = 'concluido'
+ESTADO_ERRO = 'erro'
+
+
+class FilaCheiaError(Exception):
+    """A fila atingiu o limite de jobs aguardando."""
+
+
+class JobRenderizacao:
+    """Um pedido de renderização e seu estado."""
+
+    def __init__(self, comunicado_id):
+        self.id = uuid.uuid4().hex
+        self.comunicado_id = comunicado_id
+        self.estado = ESTADO_NA_FILA
+        self.erro = None
+        self.resultado = None
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.concluido_em = None
+        self._finalizado = threading.Event()
+
+    @property
+    def finalizado(self):
+        return self.estado in (ESTADO_CONCLUIDO, ESTADO_ERRO)
+
+    def aguardar(self, timeout=None):
+        """Bloqueia até o job terminar (ou o timeout expirar). Retorna True se terminou."""
+        return self._finalizado.wait(timeout)
+
+    def _finalizar(self, estado, resultado=None, erro=None):
+        self.estado = estado
+        self.resultado = resultado
+        self.erro = erro
+        self.concluido_em = time.time()
+        self._finalizado.set()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'comunicado_id': self.comunicado_id,
+            'status': self.estado,
+            'erro': self.erro,
+            'criado_em': self.criado_em,
+            'iniciado_em': self.iniciado_em,
+            'concluido_em': self.concluido_em,
+        }
+
+
+class FilaRenderizacao:
+    """
+    Fila limitada de jobs de renderização processada por threads em segundo plano.
+
+    Args:
+        executar: Função chamada com o job; seu retorno vira `job.resultado`
+        num_workers: Número de threads que processam a fila
+        tamanho_maximo: Jobs que podem aguardar na fila antes de recusar novos
+        timeout: Tempo máximo (s) de um job, contado a partir da entrada na fila
+        retencao: Tempo (s) que jobs finalizados ficam disponíveis para consulta
+        max_execucoes: Threads de renderização vivas, incluindo as de jobs que estouraram
+            o prazo e ainda não terminaram (padrão: o dobro de num_workers)
+    """
+
+    def __init__(self, executar, num_workers=2, tamanho_maximo=20, timeout=60, retencao=600,
+                 max_execucoes=None):
+        self._executar = executar
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.retencao = retencao
+        self.max_execucoes = max_execucoes or num_workers * 2
+        self._execucoes = threading.BoundedSemaphore(self.max_execucoes)
+        self._execucoes_ativas = 0
+        self._fila = queue.Queue(maxsize=tamanho_maximo)
+        self._jobs = {}
+        self._jobs_ativos = {}  # comunicado_id -> job na fila ou em processamento
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _iniciar_workers(self):
+        # Threads criadas sob demanda, para existirem no processo que atende as requisições
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.num_workers:
+            worker = threading.Thread(target=self._loop_worker, name='render-worker', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _limpar_expirados(self):
+        limite = time.time() - self.retencao
+        for job_id in [j.id for j in self._jobs.values() if j.finalizado and j.concluido_em < limite]:
+            del self._jobs[job_id]
+
+    def submeter(self, comunicado_id):
+        """
+        Enfileira a renderização de um comunicado.
+
+        Se já houver um job na fila ou em processamento para o mesmo comunicado,
+        retorna esse job em vez de criar outro.
+
+        Raises:
+            FilaCheiaError: Se a fila estiver cheia
+        """
+        with self._lock:
+            self._limpar_expirados()
+            self._iniciar_workers()
+
+            job = self._jobs_ativos.get(comunicado_id)
+            if job is not None and not job.finalizado:
+                return job
+
+            job = JobRenderizacao(comunicado_id)
+            try:
+                self._fila.put_nowait(job)
+            except queue.Full:
+                raise FilaCheiaError('Fila de renderização cheia')
+            self._jobs[job.id] = job
+            self._jobs_ativos[comunicado_id] = job
+            return job
+
+    def obter(self, job_id):
+        """Retorna o job pelo id, ou None se não existir (ou já tiver expirado)."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def job_ativo(self, comunicado_id):
+        """Retorna o job na fila ou em processamento para o comunicado, se houver."""
+        with self._lock:
+            job = self._jobs_ativos.get(comunicado_id)
+            return job if job is not None and not job.finalizado else None
+
+    def tamanho_fila(self):
+        return self._fila.qsize()
+
+    def execucoes_ativas(self):
+        """Threads de renderização vivas (inclui as de jobs que já estouraram o prazo)."""
+        with self._lock:
+            return self._execucoes_ativas
+
+    def _finalizar(self, job, estado, resultado=None, erro=None):
+        with self._lock:
+            if job.finalizado:
+                return
+            job._finalizar(estado, resultado, erro)
+            if self._jobs_ativos.get(job.comunicado_id) is job:
+                del self._jobs_ativos[job.comunicado_id]
+
+    def _loop_worker(self):
+        while True:
+            job = self._fila.get()
+            try:
+                self._processar(job)
+            except Exception as e:
+                logger.error(f'Erro inesperado no worker de renderização: {e}', exc_info=True)
+            finally:
+                self._fila.task_done()
+
+    def _processar(self, job):
+        restante = job.criado_em + self.timeout - time.time()
+        if restante <= 0:
+            self._finalizar(job, ESTADO_ERRO, erro='Tempo esgotado aguardando na fila')
+            return
+
+        # Vaga de execução: só falta se renderizações abandonadas ainda estiverem rodando
+        if not self._execucoes.acquire(timeout=restante):
+            self._finalizar(job, ESTADO_ERRO, erro='Tempo esgotado aguardando renderizações anteriores')
+            return
+        restante = job.criado_em + self.timeout - time.time()
+        with self._lock:
+            self._execucoes_ativas += 1
+
+        job.estado = ESTADO_PROCESSANDO
+        job.iniciado_em = time.time()
+
+        def executar():
+            try:
+                resultado = self._executar(job)
+            except Exception as e:
+                logger.error(f'Erro ao renderizar comunicado {job.comunicado_id} (job {job.id}): {e}')
+                self._finalizar(job, ESTADO_ERRO, erro=str(e))
+            else:
+                self._finalizar(job, ESTADO_CONCLUIDO, resultado=resultado)
+            finally:
+                with self._lock:
+                    self._execucoes_ativas -= 1
+                self._execucoes.release()
+
+        # Executar em thread própria para que o worker não fique preso além do prazo
+        execucao = threading.Thread(target=executar, name=f'render-job-{job.id}', daemon=True)
+        execucao.start()
+        execucao.join(restante)
+
+        if execucao.is_alive():
+            logger.warning(f'Job de renderização {job.id} excedeu {self.timeout}s')
+            self._finalizar(job, ESTADO_ERRO, erro='Tempo esgotado na renderização')
@@ -1,13 +1,17 @@
 """
 Módulo para gerar imagens PNG/JPG a partir dos comunicados
 """
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 from io import BytesIO
 import os
-import re
 import random
 import logging
-from html import unescape
+from functools import lru_cache
+
+from scripts.layout_texto import (
+    limpar_html, obter_layout, trechos_renderizados, estilos,
+    ESTILO_NORMAL, ESTILO_NEGRITO, ESTILO_ITALICO, ESTILO_SUBLINHADO, PARAGRAFO_VAZIO
+)
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -39,6 +43,19 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FONTE_GLOBO_REGULAR = os.path.join(BASE_DIR, 'static/fonts/GlobotipoCorporativa-Regular.ttf')
 FONTE_GLOBO_BOLD = os.path.join(BASE_DIR, 'static/fonts/GlobotipoCorporativa-Bold.ttf')
 
+# Cache de fontes carregadas (por caminho e tamanho)
+MAX_FONTES_CACHE = 64
+# Tamanhos mais usados nos comunicados (títulos especiais, título, subtítulo, corpo/rodapé, público-alvo)
+TAMANHOS_FONTE_COMUNS = (60, 42, 32, 24, 16)
+# Cache de larguras de palavras medidas (por fonte e texto)
+MAX_LARGURAS_CACHE = 16384
+# Cache de imagens de fundo dos templates já decodificadas
+MAX_FUNDOS_CACHE = 8
+# Cache das camadas que se repetem entre comunicados (título, rodapé + público-alvo).
+# Cada camada é só a área com texto em RGBA (um título de duas linhas na largura de
+# 1080px ocupa ~0,5 MB), não a imagem inteira: no máximo ~16 MB por processo
+MAX_CAMADAS_CACHE = 32
+
 # Títulos especiais que devem ser quebrados em duas linhas
 TITULOS_ESPECIAIS = {
     'INDISPONIBILIDADE': ['INDISPONIBILIDADE', 'DETECTADA'],
@@ -47,47 +64,56 @@ TITULOS_ESPECIAIS = {
     'NORMALIZAÇÃO': ['AMBIENTE', 'NORMALIZADO']
 }
 
-def _detectar_formato_texto(parte):
-    """
-    Detecta o formato de uma parte de texto (negrito, itálico ou normal).
-    
-    Returns:
-        tuple: (texto_limpo, marcador, tipo) onde tipo é 'bold', 'italic' ou 'normal'
-    """
-    if parte.startswith('**') and parte.endswith('**'):
-        return parte[2:-2], '**', 'bold'
-    elif parte.startswith('_') and parte.endswith('_'):
-        return parte[1:-1], '_', 'italic'
-    else:
-        return parte, None, 'normal'
-
-
 def _obter_fonte_formatada(fonte_corpo, fonte_corpo_bold, fonte_corpo_italic, tipo):
-    """Retorna a fonte apropriada baseada no tipo de formatação."""
-    if tipo == 'bold':
+    """Retorna a fonte apropriada baseada no tipo de formatação (negrito prevalece sobre itálico)."""
+    marcas = estilos(tipo)
+    if ESTILO_NEGRITO in marcas:
         return fonte_corpo_bold
-    elif tipo == 'italic':
+    elif ESTILO_ITALICO in marcas:
         return fonte_corpo_italic
     else:
         return fonte_corpo
 
 
+@lru_cache(maxsize=MAX_LARGURAS_CACHE)
+def _largura_texto(fonte, texto):
+    """
+    Largura de um trecho de texto na fonte, medida uma única vez por (fonte, texto).
+    
+    As fontes vêm do cache de _obter_fonte, então o mesmo objeto é reutilizado entre
+    renderizações e as larguras de palavras já medidas não passam de novo pelo FreeType.
+    """
+    try:
+        bbox = fonte.getbbox(texto)
+        return bbox[2] - bbox[0]
+    except Exception:
+        return len(texto) * 10  # Fallback
+
+
 def _calcular_largura_texto(partes, fonte_corpo, fonte_corpo_bold, fonte_corpo_italic):
-    """Calcula a largura total de uma lista de partes formatadas."""
+    """Calcula a largura total de uma lista de partes formatadas (texto, estilo)."""
     largura_total = 0
     for parte in partes:
-        if not parte:
-            continue
-        texto, _, tipo = _detectar_formato_texto(parte)
+        texto, tipo = parte
         if texto.strip():
             fonte = _obter_fonte_formatada(fonte_corpo, fonte_corpo_bold, fonte_corpo_italic, tipo)
-            bbox = fonte.getbbox(texto)
-            largura_total += bbox[2] - bbox[0]
+            largura_total += _largura_texto(fonte, texto)
             if parte != partes[-1]:
                 largura_total += 2  # Espaçamento entre partes
     return largura_total
 
 
+def _sublinhar(draw, fonte, x, y, largura, cor):
+    """Desenha o sublinhado de um trecho logo abaixo da linha de base do texto."""
+    try:
+        ascendente, descendente = fonte.getmetrics()
+    except Exception:
+        ascendente, descendente = getattr(fonte, 'size', 10), 2
+    espessura = max(1, getattr(fonte, 'size', 15) // 15)
+    y_linha = y + ascendente + max(1, descendente // 3)
+    draw.line((x, y_linha, x + largura, y_linha), fill=cor, width=espessura)
+
+
 def _calcular_posicao_x_alinhada(texto_pos_x, corpo_width, largura_total, alinhamento):
     """Calcula a posição X baseada no alinhamento."""
     if alinhamento == 'center':
@@ -102,8 +128,11 @@ def quebrar_linha_auto(partes_linha, largura_max, fonte_corpo, fonte_corpo_bold,
     """
     Quebra uma linha automaticamente se exceder largura máxima.
     
+    A largura da linha é acumulada somando as larguras em cache de cada palavra e
+    espaço, sem medir a linha inteira novamente a cada palavra adicionada.
+    
     Args:
-        partes_linha: Lista de partes da linha (com formatação)
+        partes_linha: Lista de partes da linha (texto, estilo)
         largura_max: Largura máxima permitida
         fonte_corpo: Fonte normal
         fonte_corpo_bold: Fonte negrito
@@ -114,74 +143,52 @@ def quebrar_linha_auto(partes_linha, largura_max, fonte_corpo, fonte_corpo_bold,
     """
     linhas_result = []
     linha_atual = []
+    largura_linha = 0
     
-    for parte in partes_linha:
-        if not parte:
-            continue
-        
-        texto, marcador, tipo = _detectar_formato_texto(parte)
+    for texto, tipo in partes_linha:
         fonte = _obter_fonte_formatada(fonte_corpo, fonte_corpo_bold, fonte_corpo_italic, tipo)
         
         if not texto.strip():
-            if marcador:
-                linha_atual.append(parte)
+            if tipo != ESTILO_NORMAL:
+                linha_atual.append((texto, tipo))
+                largura_linha += _largura_texto(fonte, texto)
             continue
         
+        largura_espaco = _largura_texto(fonte, ' ')
+        
         # Quebrar por palavras
         palavras = texto.split(' ')
         for i, palavra in enumerate(palavras):
             if not palavra:  # Espaço vazio (espaço múltiplo)
                 if linha_atual:
-                    ultima_parte = linha_atual[-1]
-                    if marcador and ultima_parte.startswith(marcador) and ultima_parte.endswith(marcador):
-                        texto_ultima = ultima_parte[len(marcador):-len(marcador)]
-                        linha_atual[-1] = marcador + texto_ultima + ' ' + marcador
-                    elif not marcador:
-                        if ultima_parte.startswith('**') and ultima_parte.endswith('**'):
-                            texto_ultima = ultima_parte[2:-2]
-                            linha_atual[-1] = '**' + texto_ultima + ' ' + '**'
-                        elif ultima_parte.startswith('_') and ultima_parte.endswith('_'):
-                            texto_ultima = ultima_parte[1:-1]
-                            linha_atual[-1] = '_' + texto_ultima + ' ' + '_'
-                        else:
-                            linha_atual[-1] = ultima_parte + ' '
+                    # Acrescentar o espaço à parte anterior, no estilo dela
+                    texto_ultima, tipo_ultima = linha_atual[-1]
+                    if tipo == ESTILO_NORMAL or tipo_ultima == tipo:
+                        linha_atual[-1] = (texto_ultima + ' ', tipo_ultima)
+                        largura_linha += largura_espaco
                 continue
             
-            # Construir texto da linha atual para medir
-            texto_linha = ''
-            for p in linha_atual:
-                texto_p, _, _ = _detectar_formato_texto(p)
-                texto_linha += texto_p
+            # Largura da linha com a nova palavra (soma das medidas em cache)
+            largura_palavra = _largura_texto(fonte, palavra)
+            largura_teste = largura_linha + largura_palavra
             if linha_atual:
-                texto_linha += ' '
-            texto_linha += palavra
-            
-            # Medir largura
-            bbox = fonte.getbbox(texto_linha)
-            largura_teste = bbox[2] - bbox[0]
+                largura_teste += largura_espaco
             
             if largura_teste <= largura_max:
                 # Cabe na linha atual
                 if linha_atual:
-                    linha_atual.append(' ')
-                if marcador:
-                    linha_atual.append(marcador + palavra + marcador)
-                else:
-                    linha_atual.append(palavra)
+                    linha_atual.append((' ', ESTILO_NORMAL))
+                linha_atual.append((palavra, tipo))
+                largura_linha = largura_teste
             else:
                 # Não cabe, quebrar linha
                 if linha_atual:
                     linhas_result.append(linha_atual)
-                linha_atual = []
-                if marcador:
-                    linha_atual.append(marcador + palavra + marcador)
-                else:
-                    linha_atual.append(palavra)
+                linha_atual = [(palavra, tipo)]
+                largura_linha = largura_palavra
                 if i < len(palavras) - 1:
-                    if marcador:
-                        linha_atual.append(marcador + ' ' + marcador)
-                    else:
-                        linha_atual.append(' ')
+                    linha_atual.append((' ', tipo))
+                    largura_linha += largura_espaco
     
     # Adicionar última linha
     if linha_atual:
@@ -190,6 +197,22 @@ def quebrar_linha_auto(partes_linha, largura_max, fonte_corpo, fonte_corpo_bold,
     return linhas_result if linhas_result else [partes_linha]
 
 
+@lru_cache(maxsize=MAX_FONTES_CACHE)
+def _obter_fonte(caminho, tamanho):
+    """Carrega a fonte TrueType uma única vez por processo para cada (caminho, tamanho)."""
+    return ImageFont.truetype(caminho, tamanho)
+
+
+def pre_carregar_fontes(tamanhos=TAMANHOS_FONTE_COMUNS):
+    """Aquece o cache de fontes com os tamanhos mais usados (chamado na inicialização)."""
+    try:
+        for tamanho in tamanhos:
+            _obter_fonte(FONTE_GLOBO_REGULAR, tamanho)
+            _obter_fonte(FONTE_GLOBO_BOLD, tamanho)
+    except Exception as e:
+        logger.warning(f'Erro ao pré-carregar fontes Globo Corporativa: {e}')
+
+
 def _carregar_fontes(tamanhos):
     """
     Carrega todas as fontes necessárias.
@@ -202,13 +225,13 @@ def _carregar_fontes(tamanhos):
     """
     fontes = {}
     try:
-        fontes['titulo'] = ImageFont.truetype(FONTE_GLOBO_BOLD, tamanhos['titulo'])
-        fontes['subtitulo'] = ImageFont.truetype(FONTE_GLOBO_BOLD, tamanhos['subtitulo'])
-        fontes['corpo'] = ImageFont.truetype(FONTE_GLOBO_REGULAR, tamanhos['corpo'])
-        fontes['corpo_bold'] = ImageFont.truetype(FONTE_GLOBO_BOLD, tamanhos['corpo'])
-        fontes['corpo_italic'] = ImageFont.truetype(FONTE_GLOBO_REGULAR, tamanhos['corpo'])
-        fontes['rodape'] = ImageFont.truetype(FONTE_GLOBO_REGULAR, tamanhos['rodape'])
-        fontes['publico_alvo'] = ImageFont.truetype(FONTE_GLOBO_REGULAR, tamanhos['publico_alvo'])
+        fontes['titulo'] = _obter_fonte(FONTE_GLOBO_BOLD, tamanhos['titulo'])
+        fontes['subtitulo'] = _obter_fonte(FONTE_GLOBO_BOLD, tamanhos['subtitulo'])
+        fontes['corpo'] = _obter_fonte(FONTE_GLOBO_REGULAR, tamanhos['corpo'])
+        fontes['corpo_bold'] = _obter_fonte(FONTE_GLOBO_BOLD, tamanhos['corpo'])
+        fontes['corpo_italic'] = _obter_fonte(FONTE_GLOBO_REGULAR, tamanhos['corpo'])
+        fontes['rodape'] = _obter_fonte(FONTE_GLOBO_REGULAR, tamanhos['rodape'])
+        fontes['publico_alvo'] = _obter_fonte(FONTE_GLOBO_REGULAR, tamanhos['publico_alvo'])
     except Exception as e:
         logger.warning(f'Erro ao carregar fonte Globo Corporativa, usando fontes padrão: {e}')
         # Fallback para fontes padrão
@@ -226,19 +249,53 @@ def _carregar_fontes(tamanhos):
     return fontes
 
 
-def _criar_imagem_base(comunicado):
+def _carregar_fundo(img_path):
+    """
+    Retorna o fundo do template decodificado em RGB.
+    
+    A imagem decodificada é reaproveitada enquanto o arquivo não for modificado
+    (a data de modificação faz parte da chave do cache). Não deve ser alterada:
+    quem for desenhar sobre ela precisa trabalhar em uma cópia.
+    """
+    return _decodificar_fundo(img_path, os.stat(img_path).st_mtime_ns)
+
+
+@lru_cache(maxsize=MAX_FUNDOS_CACHE)
+def _decodificar_fundo(img_path, mtime_ns):
+    """Decodifica o arquivo de fundo uma única vez por (caminho, data de modificação)."""
+    with Image.open(img_path) as img:
+        img.load()
+        if img.mode != 'RGB':
+            return img.convert('RGB')
+        return img.copy()
+
+
+def _assinatura_fundo(comunicado):
+    """
+    Identifica o fundo do comunicado pelo caminho e data de modificação do arquivo.
+    
+    Returns:
+        tuple: (caminho, mtime_ns), ou None para o gradiente padrão
+    """
+    if comunicado.template and comunicado.template.imagem_fundo:
+        img_path = os.path.join(BASE_DIR, 'static', comunicado.template.imagem_fundo)
+        try:
+            return img_path, os.stat(img_path).st_mtime_ns
+        except OSError as e:
+            logger.error(f'Erro ao carregar template de fundo: {e}', exc_info=True)
+    return None
+
+
+def _criar_imagem_base(assinatura_fundo):
     """
     Cria a imagem base (template ou gradiente padrão).
     
     Returns:
         tuple: (Image, width, height)
     """
-    if comunicado.template and comunicado.template.imagem_fundo:
+    if assinatura_fundo is not None:
         try:
-            img_path = os.path.join(BASE_DIR, 'static', comunicado.template.imagem_fundo)
-            img = Image.open(img_path)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+            img = _decodificar_fundo(*assinatura_fundo).copy()
             width, height = img.size
             return img, width, height
         except Exception as e:
@@ -250,6 +307,89 @@ def _criar_imagem_base(comunicado):
     return img, width, height
 
 
+@lru_cache(maxsize=MAX_CAMADAS_CACHE)
+def _camada_titulo(tamanho_imagem, titulo, tipo_pos_x, tipo_pos_y, tamanho, fonte_titulo, cor_titulo):
+    """
+    Título (tipo) desenhado em uma camada transparente, recortada à área com texto,
+    compartilhada entre os comunicados do mesmo tipo.
+    
+    Returns:
+        tuple: (Image RGBA, caixa (x0, y0, x1, y1) na imagem final), ou None se não houver texto
+    """
+    width, height = tamanho_imagem
+    camada = Image.new('RGBA', tamanho_imagem, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(camada)
+    
+    # Desenhar título (tipo) em NEGRITO E MAIÚSCULAS
+    titulo_upper = titulo.upper()
+    
+    # Verificar se é um título especial que deve ser quebrado em duas linhas
+    titulo_linhas = TITULOS_ESPECIAIS.get(titulo_upper, None)
+    if titulo_linhas is None:
+        titulo_linhas = quebrar_texto(titulo_upper, fonte_titulo, width - (MARGEM_X_PADRAO * 2))
+    
+    y_position = tipo_pos_y
+    for linha in titulo_linhas:
+        draw.text((tipo_pos_x, y_position), linha, font=fonte_titulo, fill=cor_titulo)
+        y_position += tamanho + ESPACAMENTO_TITULO
+    
+    caixa = camada.getbbox()
+    if caixa is None:
+        return None
+    return camada.crop(caixa), caixa
+
+
+@lru_cache(maxsize=MAX_CAMADAS_CACHE)
+def _camada_rodape(tamanho_imagem, rodape, rodape_pos_y, tamanho_rodape, fonte_rodape,
+                   publico_alvo, publico_alvo_pos_x, publico_alvo_pos_y, tamanho_publico_alvo, fonte_publico_alvo):
+    """
+    Rodapé e público-alvo desenhados em uma camada transparente, recortada à área com texto.
+    
+    Returns:
+        tuple: (Image RGBA, caixa (x0, y0, x1, y1) na imagem final), ou None se não houver texto
+    """
+    width, height = tamanho_imagem
+    camada = Image.new('RGBA', tamanho_imagem, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(camada)
+    
+    # Desenhar rodapé (centralizado, preto)
+    if rodape:
+        rodape_limpo = limpar_html(rodape)
+        # Usar largura maior para o rodapé para garantir que caiba em uma linha
+        max_width_rodape = width - int(MARGEM_X_PADRAO * 0.8)  # Apenas 48px de margem total
+        rodape_linhas = quebrar_texto(rodape_limpo, fonte_rodape, max_width_rodape)
+        y_position = rodape_pos_y
+        
+        for linha in rodape_linhas:
+            # Centralizar o rodapé
+            bbox = fonte_rodape.getbbox(linha)
+            text_width = bbox[2] - bbox[0]
+            x_centered = (width - text_width) // 2
+            draw.text((x_centered, y_position), linha, font=fonte_rodape, fill=COR_PRETO)
+            y_position += tamanho_rodape + ESPACAMENTO_RODAPE
+    
+    # Desenhar público alvo
+    if publico_alvo:
+        max_width_publico_alvo = width - (publico_alvo_pos_x * 2)
+        publico_alvo_linhas = quebrar_texto(publico_alvo, fonte_publico_alvo, max_width_publico_alvo)
+        
+        y_position = publico_alvo_pos_y
+        for linha in publico_alvo_linhas:
+            draw.text((publico_alvo_pos_x, y_position), linha, font=fonte_publico_alvo, fill=COR_PRETO)
+            y_position += tamanho_publico_alvo + ESPACAMENTO_PUBLICO_ALVO
+    
+    caixa = camada.getbbox()
+    if caixa is None:
+        return None
+    return camada.crop(caixa), caixa
+
+
+def _compor_regiao(img, camada, caixa):
+    """Aplica uma camada RGBA sobre a região `caixa` da imagem RGB (só a região é convertida)."""
+    regiao = img.crop(caixa).convert('RGBA')
+    img.paste(Image.alpha_composite(regiao, camada).convert('RGB'), caixa[:2])
+
+
 def gerar_png(comunicado, configs, formato='PNG'):
     """
     Gera uma imagem PNG do comunicado
@@ -262,10 +402,23 @@ def gerar_png(comunicado, configs, formato='PNG'):
     Returns:
         bytes: Imagem em formato de bytes
     """
-    # Criar imagem base
-    img, width, height = _criar_imagem_base(comunicado)
-    draw = ImageDraw.Draw(img)
+    img = desenhar_comunicado(comunicado, configs)
     
+    # Converter para bytes
+    img_bytes = BytesIO()
+    img.save(img_bytes, format=formato, quality=QUALIDADE_IMAGEM)
+    img_bytes.seek(0)
+    
+    return img_bytes.getvalue()
+
+
+def desenhar_comunicado(comunicado, configs):
+    """
+    Desenha o comunicado sobre o fundo, sem codificar a imagem
+    
+    Returns:
+        Image: Imagem PIL do comunicado
+    """
     # Tamanhos das fontes
     tamanhos = {
         'titulo': getattr(comunicado, 'tipo_tamanho', 42),
@@ -289,7 +442,6 @@ def gerar_png(comunicado, configs, formato='PNG'):
     cor_titulo = configs.get('cor_titulo', COR_BRANCO)
     cor_subtitulo = COR_PRETO
     cor_corpo = COR_PRETO
-    cor_rodape = COR_PRETO
     
     # Posições personalizadas
     tipo_pos_x = getattr(comunicado, 'tipo_pos_x', MARGEM_X_PADRAO)
@@ -304,22 +456,20 @@ def gerar_png(comunicado, configs, formato='PNG'):
     publico_alvo_pos_x = getattr(comunicado, 'publico_alvo_pos_x', MARGEM_X_PADRAO)
     publico_alvo_pos_y = getattr(comunicado, 'publico_alvo_pos_y', 1120)
     
-    # Largura máxima para textos
-    max_width = width - (MARGEM_X_PADRAO * 2)
+    img, width, height = _criar_imagem_base(_assinatura_fundo(comunicado))
     
-    # Desenhar título (tipo) em NEGRITO E MAIÚSCULAS
+    # Camada do título (reaproveitada entre comunicados do mesmo tipo)
     if comunicado.titulo:
-        titulo_upper = comunicado.titulo.upper()
-        
-        # Verificar se é um título especial que deve ser quebrado em duas linhas
-        titulo_linhas = TITULOS_ESPECIAIS.get(titulo_upper, None)
-        if titulo_linhas is None:
-            titulo_linhas = quebrar_texto(titulo_upper, fonte_titulo, max_width)
-        
-        y_position = tipo_pos_y
-        for linha in titulo_linhas:
-            draw.text((tipo_pos_x, y_position), linha, font=fonte_titulo, fill=cor_titulo)
-            y_position += tamanhos['titulo'] + ESPACAMENTO_TITULO
+        camada_titulo = _camada_titulo(
+            (width, height), comunicado.titulo, tipo_pos_x, tipo_pos_y,
+            tamanhos['titulo'], fonte_titulo, cor_titulo
+        )
+        if camada_titulo is not None:
+            _compor_regiao(img, *camada_titulo)
+    draw = ImageDraw.Draw(img)
+    
+    # Largura máxima para textos
+    max_width = width - (MARGEM_X_PADRAO * 2)
     
     # Desenhar subtítulo (centralizado e negrito se pos_x = 0, senão alinhado à esquerda)
     if comunicado.subtitulo:
@@ -340,15 +490,14 @@ def gerar_png(comunicado, configs, formato='PNG'):
     
     # Desenhar corpo (área central branca)
     if comunicado.corpo:
-        # Desenhar texto do corpo com formatação PRIMEIRO para calcular altura necessária
-        corpo_limpo = limpar_html(comunicado.corpo)
+        # Layout do corpo compilado ao salvar o comunicado (parágrafos com trechos formatados)
+        paragrafos = obter_layout(comunicado)['paragrafos']
         
         # Calcular espaçamento entre linhas baseado no line-height
         espacamento_linha = int(round(tamanhos['corpo'] * LINE_HEIGHT_RATIO))
         
         # Calcular altura dinâmica do container baseado no conteúdo
-        linhas_temp = corpo_limpo.split('\n')
-        num_linhas_estimado = len([l for l in linhas_temp if l.strip()])
+        num_linhas_estimado = len([p for p in paragrafos if p['tipo'] != PARAGRAFO_VAZIO])
         
         # Calcular altura necessária: padding superior + padding inferior + linhas * espaçamento
         corpo_height = (CORPO_PADDING * 2) + (num_linhas_estimado * espacamento_linha) + CORPO_PADDING
@@ -357,16 +506,15 @@ def gerar_png(comunicado, configs, formato='PNG'):
         # Criar retângulo branco semi-transparente para o corpo
         corpo_y_start = corpo_pos_y - CORPO_PADDING
         
-        # Criar camada semi-transparente
-        overlay = Image.new('RGBA', (width, height), (255, 255, 255, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
-        overlay_draw.rectangle(
-            [corpo_pos_x - CORPO_PADDING, corpo_y_start, 
-             corpo_pos_x + CORPO_WIDTH, corpo_y_start + corpo_height],
-            fill=(255, 255, 255, CORPO_OVERLAY_ALPHA)
+        # Aplicar o retângulo semi-transparente apenas na sua região da imagem
+        caixa_corpo = (
+            max(0, corpo_pos_x - CORPO_PADDING), max(0, corpo_y_start),
+            min(width, corpo_pos_x + CORPO_WIDTH + 1), min(height, corpo_y_start + corpo_height + 1)
         )
-        img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-        draw = ImageDraw.Draw(img)
+        if caixa_corpo[0] < caixa_corpo[2] and caixa_corpo[1] < caixa_corpo[3]:
+            tamanho_caixa = (caixa_corpo[2] - caixa_corpo[0], caixa_corpo[3] - caixa_corpo[1])
+            overlay = Image.new('RGBA', tamanho_caixa, (255, 255, 255, CORPO_OVERLAY_ALPHA))
+            _compor_regiao(img, overlay, caixa_corpo)
         
         # Posição inicial do texto
         y_position = corpo_pos_y + CORPO_PADDING
@@ -376,31 +524,22 @@ def gerar_png(comunicado, configs, formato='PNG'):
         # Calcular limite do rodapé uma única vez
         limite_rodape = rodape_pos_y - MARGEM_RODAPE
         
-        # Processar cada linha do texto (respeitando quebras de linha manuais)
-        linhas_originais = corpo_limpo.split('\n')
-        
-        for linha_manual in linhas_originais:
+        # Processar cada parágrafo (respeitando quebras de linha manuais)
+        for paragrafo in paragrafos:
             # Verificar se ultrapassou o limite da imagem ou se está muito próximo do rodapé
             if y_position > limite_rodape or y_position > height - MARGEM_IMAGEM:
                 break
             
-            # Remover espaços em branco no final da linha (mas preservar linha vazia)
-            linha_manual = linha_manual.rstrip(' \t\r')
-                
             # Linha vazia = quebra de linha manual
-            if not linha_manual.strip():
+            if paragrafo['tipo'] == PARAGRAFO_VAZIO:
                 y_position += espacamento_linha
                 continue
             
-            # Processar formatação de negrito e itálico nesta linha manual
-            partes_formatadas = re.split(r'(\*\*.*?\*\*|_.*?_)', linha_manual)
-            partes_formatadas = [p for p in partes_formatadas if p]
+            # Partes (texto, estilo) já separadas na compilação do layout
+            partes_formatadas = trechos_renderizados(paragrafo)
             
-            # Construir texto completo removendo marcadores de formatação para medir
-            texto_linha_completa = ''
-            for parte in partes_formatadas:
-                texto, _, _ = _detectar_formato_texto(parte)
-                texto_linha_completa += texto
+            # Texto completo da linha, sem formatação, para medir
+            texto_linha_completa = ''.join(texto for texto, _ in partes_formatadas)
             
             # Verificar se a linha cabe inteira ou precisa ser quebrada
             bbox_teste = fonte_corpo.getbbox(texto_linha_completa)
@@ -436,45 +575,35 @@ def gerar_png(comunicado, configs, formato='PNG'):
                 )
                 
                 # Desenhar cada parte da linha
-                for i, parte in enumerate(linha_parts):
-                    if not parte:
-                        continue
-                    
-                    texto_parte, marcador, tipo = _detectar_formato_texto(parte)
+                for i, (texto_parte, tipo) in enumerate(linha_parts):
                     fonte_atual = _obter_fonte_formatada(fonte_corpo, fonte_corpo_bold, fonte_corpo_italic, tipo)
                     
                     # Verificar se precisa adicionar espaço antes desta parte
                     if i > 0 and texto_parte and texto_parte.strip():
-                        parte_anterior = linha_parts[i-1]
-                        if parte_anterior:
-                            texto_anterior, _, _ = _detectar_formato_texto(parte_anterior)
-                            # Se ambas têm conteúdo, verificar se há espaço entre elas
-                            if texto_anterior and texto_anterior.strip():
-                                # Verificar se há espaço no final da parte anterior ou início da atual
-                                anterior_termina_espaco = texto_anterior.endswith(' ')
-                                atual_comeca_espaco = texto_parte.startswith(' ')
-                                
-                                # Se não há espaço em nenhuma das bordas, adicionar um espaço
-                                if not anterior_termina_espaco and not atual_comeca_espaco:
-                                    bbox_espaco = fonte_atual.getbbox(' ')
-                                    x_position += bbox_espaco[2] - bbox_espaco[0]
+                        texto_anterior = linha_parts[i - 1][0]
+                        # Se ambas têm conteúdo, verificar se há espaço entre elas
+                        if texto_anterior and texto_anterior.strip():
+                            # Verificar se há espaço no final da parte anterior ou início da atual
+                            anterior_termina_espaco = texto_anterior.endswith(' ')
+                            atual_comeca_espaco = texto_parte.startswith(' ')
+                            
+                            # Se não há espaço em nenhuma das bordas, adicionar um espaço
+                            if not anterior_termina_espaco and not atual_comeca_espaco:
+                                x_position += _largura_texto(fonte_atual, ' ')
                     
                     # Desenhar o texto da parte
                     if texto_parte == ' ':
-                        bbox_espaco = fonte_atual.getbbox(' ')
-                        x_position += bbox_espaco[2] - bbox_espaco[0]
+                        x_position += _largura_texto(fonte_atual, ' ')
                     elif texto_parte.strip():
                         # Determinar se devemos preservar o espaço no final
                         # Preservar se a próxima parte não começar com espaço
                         preservar_espaco_final = False
                         if i < len(linha_parts) - 1:
-                            proxima_parte = linha_parts[i + 1]
-                            if proxima_parte:
-                                texto_proximo, _, _ = _detectar_formato_texto(proxima_parte)
-                                if texto_proximo and texto_proximo.strip() and not texto_proximo.startswith(' '):
-                                    # Próxima parte tem conteúdo e não começa com espaço
-                                    # Preservar espaço no final desta parte se houver
-                                    preservar_espaco_final = texto_parte.endswith(' ')
+                            texto_proximo = linha_parts[i + 1][0]
+                            if texto_proximo and texto_proximo.strip() and not texto_proximo.startswith(' '):
+                                # Próxima parte tem conteúdo e não começa com espaço
+                                # Preservar espaço no final desta parte se houver
+                                preservar_espaco_final = texto_parte.endswith(' ')
                         
                         # Renderizar o texto
                         if preservar_espaco_final:
@@ -487,97 +616,97 @@ def gerar_png(comunicado, configs, formato='PNG'):
                         if texto_para_renderizar:
                             draw.text((x_position, y_position), texto_para_renderizar, 
                                      font=fonte_atual, fill=cor_corpo)
-                            bbox = fonte_atual.getbbox(texto_para_renderizar)
-                            x_position += bbox[2] - bbox[0]
+                            largura_parte = _largura_texto(fonte_atual, texto_para_renderizar)
+                            if ESTILO_SUBLINHADO in estilos(tipo):
+                                _sublinhar(draw, fonte_atual, x_position, y_position, largura_parte, cor_corpo)
+                            x_position += largura_parte
                 
                 # Próxima linha
                 y_position += espacamento_linha
     
-    # Desenhar rodapé (centralizado, preto)
-    if comunicado.rodape:
-        rodape_limpo = limpar_html(comunicado.rodape)
-        # Usar largura maior para o rodapé para garantir que caiba em uma linha
-        max_width_rodape = width - int(MARGEM_X_PADRAO * 0.8)  # Apenas 48px de margem total
-        rodape_linhas = quebrar_texto(rodape_limpo, fonte_rodape, max_width_rodape)
-        y_position = rodape_pos_y
-        
-        for linha in rodape_linhas:
-            # Centralizar o rodapé
-            bbox = fonte_rodape.getbbox(linha)
-            text_width = bbox[2] - bbox[0]
-            x_centered = (width - text_width) // 2
-            draw.text((x_centered, y_position), linha, font=fonte_rodape, fill=cor_rodape)
-            y_position += tamanhos['rodape'] + ESPACAMENTO_RODAPE
-    
-    # Desenhar público alvo
-    if comunicado.publico_alvo:
-        max_width_publico_alvo = width - (publico_alvo_pos_x * 2)
-        publico_alvo_linhas = quebrar_texto(comunicado.publico_alvo, fonte_publico_alvo, max_width_publico_alvo)
-        
-        y_position = publico_alvo_pos_y
-        for linha in publico_alvo_linhas:
-            draw.text((publico_alvo_pos_x, y_position), linha, font=fonte_publico_alvo, fill=cor_corpo)
-            y_position += tamanhos['publico_alvo'] + ESPACAMENTO_PUBLICO_ALVO
+    # Camada de rodapé + público-alvo (em geral igual entre comunicados), aplicada por cima
+    camada_rodape = _camada_rodape(
+        (width, height), comunicado.rodape, rodape_pos_y, tamanhos['rodape'], fonte_rodape,
+        comunicado.publico_alvo, publico_alvo_pos_x, publico_alvo_pos_y,
+        tamanhos['publico_alvo'], fonte_publico_alvo
+    )
+    if camada_rodape is not None:
+        _compor_regiao(img, *camada_rodape)
     
-    # Converter para bytes
-    img_bytes = BytesIO()
-    img.save(img_bytes, format=formato, quality=QUALIDADE_IMAGEM)
-    img_bytes.seek(0)
+    return img
+
+
+def _cor_gradiente(ratio):
+    """
+    Cor do gradiente horizontal na posição `ratio` (0 a 1).
     
-    return img_bytes.getvalue()
+    Gradiente: azul claro (#00bfff) -> azul (#1e90ff) -> roxo (#6a5acd) -> roxo claro (#8b5cf6)
+    """
+    if ratio < 0.25:
+        # Primeiro quartil: azul claro para azul
+        local_ratio = ratio / 0.25
+        r = int(0 + (30 * local_ratio))
+        g = int(191 - (47 * local_ratio))
+        b = 255
+    elif ratio < 0.75:
+        # Segundo e terceiro quartis: azul para roxo
+        local_ratio = (ratio - 0.25) / 0.5
+        r = int(30 + (76 * local_ratio))
+        g = int(144 - (54 * local_ratio))
+        b = int(255 - (50 * local_ratio))
+    else:
+        # Último quartil: roxo para roxo claro
+        local_ratio = (ratio - 0.75) / 0.25
+        r = int(106 + (33 * local_ratio))
+        g = int(90 + (2 * local_ratio))
+        b = int(205 + (41 * local_ratio))
+    return (r, g, b)
 
 
 def criar_gradiente_padrao(width, height):
     """
     Cria um fundo azul com textura similar à imagem fornecida.
     
-    Otimizado para melhor performance usando operações em lote quando possível.
+    O fundo é gerado uma única vez por tamanho; cada chamada recebe uma cópia,
+    pois a imagem é desenhada por cima durante a renderização.
     """
-    img = Image.new('RGB', (width, height))
-    pixels = img.load()
-    
-    # Gradiente horizontal de azul claro para roxo
-    for x in range(width):
-        ratio = x / width
-        
-        # Gradiente: azul claro (#00bfff) -> azul (#1e90ff) -> roxo (#6a5acd) -> roxo claro (#8b5cf6)
-        if ratio < 0.25:
-            # Primeiro quartil: azul claro para azul
-            local_ratio = ratio / 0.25
-            r = int(0 + (30 * local_ratio))
-            g = int(191 - (47 * local_ratio))
-            b = 255
-        elif ratio < 0.75:
-            # Segundo e terceiro quartis: azul para roxo
-            local_ratio = (ratio - 0.25) / 0.5
-            r = int(30 + (76 * local_ratio))
-            g = int(144 - (54 * local_ratio))
-            b = int(255 - (50 * local_ratio))
-        else:
-            # Último quartil: roxo para roxo claro
-            local_ratio = (ratio - 0.75) / 0.25
-            r = int(106 + (33 * local_ratio))
-            g = int(90 + (2 * local_ratio))
-            b = int(205 + (41 * local_ratio))
-        
-        # Preencher coluna inteira de uma vez (mais eficiente que linha por linha)
-        cor = (r, g, b)
-        for y in range(height):
-            pixels[x, y] = cor
+    return _gerar_gradiente_padrao(width, height).copy()
+
+
+@lru_cache(maxsize=4)
+def _gerar_gradiente_padrao(width, height):
+    """Gera o gradiente e a textura com operações sobre a imagem inteira."""
+    # Gradiente horizontal: calcular uma única linha e replicá-la na altura toda
+    linha = Image.new('RGB', (width, 1))
+    linha.putdata([_cor_gradiente(x / width) for x in range(width)])
+    img = linha.resize((width, height), Image.NEAREST)
     
     # Adicionar textura de pontos para simular o efeito da imagem
-    random.seed(42)  # Para consistência
+    rng = random.Random(42)  # Para consistência
     num_pontos = width * height // 50  # Densidade de pontos
-    draw = ImageDraw.Draw(img)
-    
+    deltas = {}
     for _ in range(num_pontos):
-        x = random.randint(0, width - 1)
-        y = random.randint(0, height - 1)
+        x = rng.randint(0, width - 1)
+        y = rng.randint(0, height - 1)
         # Pontos mais escuros para textura
-        brightness = random.randint(-15, 5)
-        pixel = pixels[x, y]
-        new_pixel = tuple(max(0, min(255, c + brightness)) for c in pixel)
-        draw.point((x, y), fill=new_pixel)
+        brightness = rng.randint(-15, 5)
+        indice = y * width + x
+        deltas[indice] = deltas.get(indice, 0) + brightness
+    
+    # Separar em máscaras de escurecimento e clareamento e aplicar de uma vez
+    # (ImageChops satura em 0 e 255, como o ajuste ponto a ponto fazia)
+    escurecer = bytearray(width * height)
+    clarear = bytearray(width * height)
+    for indice, delta in deltas.items():
+        if delta < 0:
+            escurecer[indice] = min(255, -delta)
+        else:
+            clarear[indice] = min(255, delta)
+    
+    mascara_escurecer = Image.frombytes('L', (width, height), bytes(escurecer))
+    mascara_clarear = Image.frombytes('L', (width, height), bytes(clarear))
+    img = ImageChops.subtract(img, Image.merge('RGB', (mascara_escurecer,) * 3))
+    img = ImageChops.add(img, Image.merge('RGB', (mascara_clarear,) * 3))
     
     return img
 
@@ -586,85 +715,29 @@ def quebrar_texto(texto, fonte, max_width):
     """Quebra o texto em linhas que cabem na largura máxima"""
     linhas = []
     palavras = texto.split()
+    largura_espaco = _largura_texto(fonte, ' ')
     
     linha_atual = []
+    largura_linha = 0
     for palavra in palavras:
-        teste_linha = ' '.join(linha_atual + [palavra])
-        
-        # Verificar largura (usando aproximação)
-        try:
-            bbox = fonte.getbbox(teste_linha)
-            largura = bbox[2] - bbox[0]
-        except Exception:
-            largura = len(teste_linha) * 10  # Fallback
+        # Somar a largura da palavra (medida uma única vez) à largura acumulada da linha
+        largura_palavra = _largura_texto(fonte, palavra)
+        if linha_atual:
+            largura = largura_linha + largura_espaco + largura_palavra
+        else:
+            largura = largura_palavra
         
         if largura <= max_width:
             linha_atual.append(palavra)
+            largura_linha = largura
         else:
             if linha_atual:
                 linhas.append(' '.join(linha_atual))
             linha_atual = [palavra]
+            largura_linha = largura_palavra
     
     if linha_atual:
         linhas.append(' '.join(linha_atual))
     
     return linhas
 
-
-def limpar_html(texto):
-    """Processa tags HTML e converte para texto formatado"""
-    if not texto:
-        return ''
-    
-    # IMPORTANTE: Ordem das operações é crucial!
-    # Primeiro, converter quebras de linha HTML para \n ANTES de remover outras tags
-    
-    # Converter diferentes tipos de quebras de linha HTML para \n
-    # Tratar blocos (div, p) que criam quebras de linha
-    texto = re.sub(r'</div>', '\n', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</p>', '\n', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'<div[^>]*>', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'<p[^>]*>', '', texto, flags=re.IGNORECASE)
-    
-    # Converter quebras de linha explícitas (<br>, <br/>, <br />)
-    texto = re.sub(r'<br\s*/?>', '\n', texto, flags=re.IGNORECASE)
-    
-    # Processar listas (também criam quebras)
-    texto = re.sub(r'<li[^>]*>', '• ', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</li>', '\n', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'<ul[^>]*>', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</ul>', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'<ol[^>]*>', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</ol>', '', texto, flags=re.IGNORECASE)
-    
-    # Manter marcadores de formatação temporariamente (ANTES de remover outras tags)
-    texto = re.sub(r'<b[^>]*>', '**', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</b>', '**', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'<strong[^>]*>', '**', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</strong>', '**', texto, flags=re.IGNORECASE)
-    
-    texto = re.sub(r'<i[^>]*>', '_', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</i>', '_', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'<em[^>]*>', '_', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</em>', '_', texto, flags=re.IGNORECASE)
-    
-    texto = re.sub(r'<u[^>]*>', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'</u>', '', texto, flags=re.IGNORECASE)
-    
-    # AGORA remover outras tags HTML (mas preservar os \n que já foram inseridos)
-    texto = re.sub(r'<[^>]+>', '', texto)
-    
-    # Decodificar entidades HTML
-    texto = unescape(texto)
-    texto = texto.replace('&nbsp;', ' ')
-    
-    # IMPORTANTE: NÃO limpar quebras de linha consecutivas
-    # Cada <br> deve gerar uma quebra de linha, mesmo que sejam consecutivas
-    # Isso garante que quebras manuais sejam sempre respeitadas
-    
-    # Remover apenas espaços em branco nas extremidades, mas PRESERVAR quebras de linha
-    # strip() remove \n também, então precisamos fazer manualmente
-    texto = texto.lstrip(' \t\r')  # Remove espaços/tabs no início, mas preserva \n
-    texto = texto.rstrip(' \t\r')  # Remove espaços/tabs no final, mas preserva \n
-    
-    return texto
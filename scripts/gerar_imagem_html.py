@@ -7,6 +7,12 @@ from io import BytesIO
 import os
 from flask import render_template
 
+from scripts.pool_navegadores import TAMANHO_POOL, obter_pool
+
+# Tamanho da imagem (1000x1300 como na prévia)
+LARGURA_IMAGEM = 1000
+ALTURA_IMAGEM = 1300
+
 def gerar_png_html(comunicado, configs, formato='PNG'):
     """
     Gera uma imagem PNG do comunicado renderizando o HTML da prévia diretamente
@@ -20,6 +26,12 @@ def gerar_png_html(comunicado, configs, formato='PNG'):
     Returns:
         bytes: Imagem em formato de bytes
     """
+    html_content = renderizar_html_comunicado(comunicado, configs)
+    return capturar_html(html_content, (LARGURA_IMAGEM, ALTURA_IMAGEM))
+
+
+def renderizar_html_comunicado(comunicado, configs):
+    """Renderiza o HTML da prévia do comunicado (o mesmo exibido na tela)"""
     from app import app
     
     # Renderizar o HTML da prévia
@@ -52,13 +64,21 @@ def gerar_png_html(comunicado, configs, formato='PNG'):
             publico_alvo_tamanho=getattr(comunicado, 'publico_alvo_tamanho', 16)
         )
     
+    return html_content
+
+
+def capturar_html(html_content, tamanho):
+    """Captura o HTML como imagem PNG no Chrome headless"""
+    width, height = tamanho
+    
+    if TAMANHO_POOL > 0:
+        # Renderizar em um navegador já aquecido do pool (sem custo de inicialização)
+        return _capturar_com_pool(html_content, (width, height))
+    
+    # Pool desabilitado (HTML_RENDER_POOL_SIZE=0): um Chrome novo por renderização
     # Criar instância do Html2Image
     hti = Html2Image()
     
-    # Configurar tamanho da imagem (1000x1300 como na prévia)
-    width = 1000
-    height = 1300
-    
     # Criar arquivo temporário único
     import tempfile
     import uuid
@@ -86,3 +106,21 @@ def gerar_png_html(comunicado, configs, formato='PNG'):
         except:
             pass
 
+
+def _capturar_com_pool(html_content, tamanho):
+    """Renderiza o HTML em um navegador do pool, carregado a partir de um arquivo temporário"""
+    import tempfile
+    import uuid
+    temp_html = os.path.join(tempfile.gettempdir(), f'comunicado_{uuid.uuid4().hex}.html')
+    
+    try:
+        with open(temp_html, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        return obter_pool().renderizar(temp_html, tamanho)
+    finally:
+        # Remover arquivo temporário
+        try:
+            if os.path.exists(temp_html):
+                os.remove(temp_html)
+        except:
+            pass
@@ -0,0 +1,115 @@
+"""
+Índice de busca textual dos comunicados (SQLite FTS5)
+
+O texto puro do título, subtítulo e corpo de cada comunicado fica em uma tabela
+virtual FTS5, com o id do comunicado como rowid. O tokenizador unicode61 ignora
+acentos e maiúsculas, cada palavra digitada é buscada como prefixo ("manut" encontra
+"Manutenção") e os resultados são ordenados por relevância (bm25).
+"""
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import column, func, literal_column, select, table, text
+
+TABELA_BUSCA = 'comunicado_busca'
+
+# Pesos do bm25 por coluna: título, subtítulo, corpo
+PESOS_BM25 = (10.0, 5.0, 1.0)
+
+# Tamanho (em palavras) do trecho destacado exibido no histórico
+PALAVRAS_TRECHO = 16
+
+# Marcadores do destaque no snippet, trocados por <mark> depois de escapar o texto
+_INICIO_DESTAQUE = '\x02'
+_FIM_DESTAQUE = '\x03'
+
+# Mesmas regras do tokenizador unicode61: letras e números, o resto separa palavras
+_REGEX_TERMOS = re.compile(r'[^\W_]+')
+
+busca = table(TABELA_BUSCA, column('rowid'))
+_tabela = literal_column(TABELA_BUSCA)
+
+
+def criar_indice(conexao):
+    """
+    Cria a tabela FTS5, se ainda não existir.
+
+    Returns:
+        bool: True se a tabela foi criada agora (e precisa ser populada)
+    """
+    existe = conexao.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+        {'nome': TABELA_BUSCA}
+    ).first()
+    if existe:
+        return False
+
+    conexao.execute(text(
+        f"CREATE VIRTUAL TABLE {TABELA_BUSCA} USING fts5("
+        "titulo, subtitulo, corpo, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    return True
+
+
+def indexar(conexao, comunicado_id, titulo, subtitulo, corpo):
+    """Insere ou substitui o texto de um comunicado no índice (corpo em texto puro)."""
+    remover(conexao, comunicado_id)
+    conexao.execute(
+        text(f"INSERT INTO {TABELA_BUSCA} (rowid, titulo, subtitulo, corpo) "
+             "VALUES (:id, :titulo, :subtitulo, :corpo)"),
+        {'id': comunicado_id, 'titulo': titulo or '', 'subtitulo': subtitulo or '', 'corpo': corpo or ''}
+    )
+
+
+def remover(conexao, comunicado_id):
+    conexao.execute(text(f"DELETE FROM {TABELA_BUSCA} WHERE rowid = :id"), {'id': comunicado_id})
+
+
+def consulta_fts(busca_texto):
+    """
+    Converte o texto digitado em uma consulta FTS5: todas as palavras, cada uma como prefixo.
+
+    Returns:
+        str: Consulta para o MATCH, ou None se não houver palavras buscáveis
+    """
+    termos = _REGEX_TERMOS.findall(busca_texto or '')
+    if not termos:
+        return None
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def filtro_busca(consulta):
+    """Condição MATCH sobre a tabela de busca (usar junto com um join em `busca`)."""
+    return _tabela.op('MATCH')(consulta)
+
+
+def relevancia():
+    """Expressão bm25 da consulta (menor = mais relevante)."""
+    return func.bm25(_tabela, *PESOS_BM25)
+
+
+def trechos_destacados(sessao, consulta, ids):
+    """
+    Trechos do texto com os termos encontrados destacados em <mark>.
+
+    Args:
+        sessao: Sessão (ou conexão) do banco
+        consulta: Consulta retornada por consulta_fts
+        ids: Ids dos comunicados exibidos na página
+
+    Returns:
+        dict: {id: Markup com o trecho destacado}
+    """
+    if not ids:
+        return {}
+
+    trecho = func.snippet(_tabela, -1, _INICIO_DESTAQUE, _FIM_DESTAQUE, '…', PALAVRAS_TRECHO)
+    linhas = sessao.execute(
+        select(busca.c.rowid, trecho).where(filtro_busca(consulta)).where(busca.c.rowid.in_(ids))
+    )
+    return {comunicado_id: _destacar(texto) for comunicado_id, texto in linhas if texto}
+
+
+def _destacar(texto):
+    html = str(escape(texto))
+    return Markup(html.replace(_INICIO_DESTAQUE, '<mark>').replace(_FIM_DESTAQUE, '</mark>'))
@@ -0,0 +1,267 @@
+"""
+Modelo de layout do corpo dos comunicados
+
+O HTML do corpo é interpretado uma única vez, quando o comunicado é salvo, e guardado
+como JSON junto do registro: uma lista de parágrafos (texto, item de lista ou linha
+vazia), cada um com trechos de texto e estilo. O renderizador PIL usa esse modelo
+diretamente, sem reprocessar o HTML a cada renderização (a prévia e o Chrome seguem
+exibindo o próprio HTML).
+
+O HTML é lido tag a tag: negrito, itálico e sublinhado podem se combinar no estilo
+de um trecho ("bold underline"), e os itens de listas numeradas (<ol>) guardam o
+número como marcador. Os espaços em branco seguem a regra do navegador: quebras de
+linha e espaços seguidos no texto viram um único espaço, e só as tags quebram linhas.
+
+Formato:
+    {'versao': 3, 'paragrafos': [
+        {'tipo': 'paragrafo', 'trechos': [['Impacto:', 'bold'], [' usuários de ', 'normal']]},
+        {'tipo': 'item', 'marcador': '• ', 'trechos': [['Sistema 1', 'bold underline']]},
+        {'tipo': 'item', 'marcador': '2. ', 'trechos': [['log_de_erro_1', 'normal']]},
+        {'tipo': 'vazio', 'trechos': []},
+    ]}
+"""
+import json
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+# Incrementar quando a interpretação do HTML mudar, para recompilar os layouts salvos
+VERSAO_LAYOUT = 3
+
+# Tipos de parágrafo
+PARAGRAFO_TEXTO = 'paragrafo'
+PARAGRAFO_ITEM = 'item'
+PARAGRAFO_VAZIO = 'vazio'
+
+# Estilos dos trechos (combináveis, separados por espaço: "bold italic underline")
+ESTILO_NORMAL = 'normal'
+ESTILO_NEGRITO = 'bold'
+ESTILO_ITALICO = 'italic'
+ESTILO_SUBLINHADO = 'underline'
+
+# Marcador dos itens de lista não numerada (<ul>) no texto renderizado
+MARCADOR_ITEM = '• '
+
+# Tags que marcam cada estilo
+_TAGS_ESTILO = {
+    'b': ESTILO_NEGRITO, 'strong': ESTILO_NEGRITO,
+    'i': ESTILO_ITALICO, 'em': ESTILO_ITALICO,
+    'u': ESTILO_SUBLINHADO,
+}
+# Tags cujo fechamento (ou a própria tag, no caso do <br>) quebra a linha
+_TAGS_BLOCO = {'div', 'p'}
+# Espaços em branco que o navegador junta em um só (o &nbsp; é preservado)
+_ESPACOS = re.compile(r'[ \t\n\r\f]+')
+
+
+def limpar_html(texto):
+    """Processa tags HTML e converte para texto formatado"""
+    if not texto:
+        return ''
+
+    # IMPORTANTE: Ordem das operações é crucial!
+    # Primeiro, converter quebras de linha HTML para \n ANTES de remover outras tags
+
+    # Converter diferentes tipos de quebras de linha HTML para \n
+    # Tratar blocos (div, p) que criam quebras de linha
+    texto = re.sub(r'</div>', '\n', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</p>', '\n', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'<div[^>]*>', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'<p[^>]*>', '', texto, flags=re.IGNORECASE)
+
+    # Converter quebras de linha explícitas (<br>, <br/>, <br />)
+    texto = re.sub(r'<br\s*/?>', '\n', texto, flags=re.IGNORECASE)
+
+    # Processar listas (também criam quebras)
+    texto = re.sub(r'<li[^>]*>', MARCADOR_ITEM, texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</li>', '\n', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'<ul[^>]*>', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</ul>', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'<ol[^>]*>', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</ol>', '', texto, flags=re.IGNORECASE)
+
+    # Manter marcadores de formatação temporariamente (ANTES de remover outras tags)
+    texto = re.sub(r'<b[^>]*>', '**', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</b>', '**', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'<strong[^>]*>', '**', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</strong>', '**', texto, flags=re.IGNORECASE)
+
+    texto = re.sub(r'<i[^>]*>', '_', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</i>', '_', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'<em[^>]*>', '_', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</em>', '_', texto, flags=re.IGNORECASE)
+
+    texto = re.sub(r'<u[^>]*>', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'</u>', '', texto, flags=re.IGNORECASE)
+
+    # AGORA remover outras tags HTML (mas preservar os \n que já foram inseridos)
+    texto = re.sub(r'<[^>]+>', '', texto)
+
+    # Decodificar entidades HTML
+    texto = unescape(texto)
+    texto = texto.replace('&nbsp;', ' ')
+
+    # IMPORTANTE: NÃO limpar quebras de linha consecutivas
+    # Cada <br> deve gerar uma quebra de linha, mesmo que sejam consecutivas
+    # Isso garante que quebras manuais sejam sempre respeitadas
+
+    # Remover apenas espaços em branco nas extremidades, mas PRESERVAR quebras de linha
+    # strip() remove \n também, então precisamos fazer manualmente
+    texto = texto.lstrip(' \t\r')  # Remove espaços/tabs no início, mas preserva \n
+    texto = texto.rstrip(' \t\r')  # Remove espaços/tabs no final, mas preserva \n
+
+    return texto
+
+
+def estilos(estilo):
+    """Conjunto de estilos de um trecho (vazio para o estilo normal)."""
+    return set(estilo.split()) - {ESTILO_NORMAL}
+
+
+def _compor_estilo(ativos):
+    nomes = [nome for nome in (ESTILO_NEGRITO, ESTILO_ITALICO, ESTILO_SUBLINHADO) if ativos[nome]]
+    return ' '.join(nomes) or ESTILO_NORMAL
+
+
+class _LeitorCorpo(HTMLParser):
+    """Percorre o HTML do corpo montando os parágrafos do layout."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragrafos = []
+        self._ativos = {ESTILO_NEGRITO: 0, ESTILO_ITALICO: 0, ESTILO_SUBLINHADO: 0}
+        self._listas = []  # [numerada, contador] de cada lista aberta
+        self._trechos = []
+        self._marcador = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _TAGS_ESTILO:
+            self._ativos[_TAGS_ESTILO[tag]] += 1
+        elif tag == 'br':
+            self._quebrar_linha()
+        elif tag in ('ul', 'ol'):
+            inicio = dict(attrs).get('start') or '1'
+            self._listas.append([tag == 'ol', int(inicio) - 1 if inicio.isdigit() else 0])
+        elif tag == 'li':
+            # O item sempre começa em uma linha própria
+            if self._trechos or self._marcador:
+                self._quebrar_linha()
+            lista = self._listas[-1] if self._listas else [False, 0]
+            lista[1] += 1
+            self._marcador = f'{lista[1]}. ' if lista[0] else MARCADOR_ITEM
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'br':
+            self._quebrar_linha()
+
+    def handle_endtag(self, tag):
+        if tag in _TAGS_ESTILO:
+            estilo = _TAGS_ESTILO[tag]
+            self._ativos[estilo] = max(0, self._ativos[estilo] - 1)
+        elif tag in _TAGS_BLOCO:
+            self._quebrar_linha()
+        elif tag == 'li':
+            # Sem linha em aberto (ex: o item terminou em uma sublista), não há o que quebrar
+            if self._trechos or self._marcador:
+                self._quebrar_linha()
+        elif tag in ('ul', 'ol') and self._listas:
+            self._listas.pop()
+
+    def handle_data(self, dados):
+        texto = _ESPACOS.sub(' ', dados)
+        # Espaço no início da linha ou logo após outro espaço não aparece no navegador
+        if texto.startswith(' ') and (not self._trechos or self._trechos[-1][0].endswith(' ')):
+            texto = texto[1:]
+        if texto:
+            self._adicionar(texto)
+
+    def _adicionar(self, texto):
+        estilo = _compor_estilo(self._ativos)
+        if self._trechos and self._trechos[-1][1] == estilo:
+            self._trechos[-1][0] += texto
+        else:
+            self._trechos.append([texto, estilo])
+
+    def _quebrar_linha(self):
+        trechos = self._trechos
+        # Remover espaços em branco no final da linha (mas preservar linha vazia)
+        while trechos:
+            trechos[-1][0] = trechos[-1][0].rstrip(' \t\r')
+            if trechos[-1][0]:
+                break
+            trechos.pop()
+
+        if self._marcador:
+            self.paragrafos.append({'tipo': PARAGRAFO_ITEM, 'marcador': self._marcador, 'trechos': trechos})
+        elif any(texto.strip() for texto, _ in trechos):
+            self.paragrafos.append({'tipo': PARAGRAFO_TEXTO, 'trechos': trechos})
+        else:
+            self.paragrafos.append({'tipo': PARAGRAFO_VAZIO, 'trechos': []})
+        self._trechos = []
+        self._marcador = None
+
+    def close(self):
+        super().close()
+        self._quebrar_linha()
+
+
+def compilar_layout(html):
+    """
+    Interpreta o HTML do corpo e monta o modelo de layout.
+
+    Args:
+        html: Corpo do comunicado (HTML já sanitizado)
+
+    Returns:
+        dict: Modelo de layout (ver docstring do módulo)
+    """
+    leitor = _LeitorCorpo()
+    if html:
+        leitor.feed(html)
+        leitor.close()
+    else:
+        leitor.paragrafos.append({'tipo': PARAGRAFO_VAZIO, 'trechos': []})
+    return {'versao': VERSAO_LAYOUT, 'paragrafos': leitor.paragrafos}
+
+
+def serializar_layout(html):
+    """Compila o layout do corpo e retorna o JSON salvo na coluna corpo_layout."""
+    return json.dumps(compilar_layout(html), ensure_ascii=False, separators=(',', ':'))
+
+
+def obter_layout(comunicado):
+    """
+    Retorna o layout do corpo do comunicado.
+
+    Usa o layout salvo no registro; só interpreta o HTML de novo se ele não existir
+    ou tiver sido gerado por uma versão anterior do compilador.
+    """
+    salvo = getattr(comunicado, 'corpo_layout', None)
+    if salvo:
+        layout = json.loads(salvo) if isinstance(salvo, str) else salvo
+        if layout.get('versao') == VERSAO_LAYOUT:
+            return layout
+    return compilar_layout(comunicado.corpo)
+
+
+def trechos_renderizados(paragrafo):
+    """
+    Trechos de um parágrafo como serão desenhados: (texto, estilo), com o marcador
+    dos itens de lista (• ou o número) incorporado ao primeiro trecho quando ele não tiver estilo.
+    """
+    trechos = [tuple(trecho) for trecho in paragrafo['trechos']]
+    if paragrafo['tipo'] == PARAGRAFO_ITEM:
+        marcador = paragrafo.get('marcador', MARCADOR_ITEM)
+        if trechos and trechos[0][1] == ESTILO_NORMAL:
+            trechos[0] = (marcador + trechos[0][0], ESTILO_NORMAL)
+        else:
+            trechos.insert(0, (marcador, ESTILO_NORMAL))
+    return trechos
+
+
+def texto_plano(layout):
+    """Texto do corpo sem formatação, um parágrafo por linha (usado no índice de busca)."""
+    return '\n'.join(
+        ''.join(texto for texto, _ in paragrafo['trechos'])
+        for paragrafo in layout['paragrafos'] if paragrafo['tipo'] != PARAGRAFO_VAZIO
+    )
@@ -0,0 +1,107 @@
+"""
+Limite de renderizações simultâneas de imagens
+
+Cada renderização (Chrome ou PIL) ocupa uma vaga. Quem chega com todas as vagas
+ocupadas aguarda em uma fila curta; com a fila cheia (ou a espera longa demais) o
+pedido é recusado para que a requisição responda 503 em vez de acumular trabalho.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Quantidade de tempos de espera guardados para calcular p50/p95
+AMOSTRAS_ESPERA = 500
+
+
+class LimiteRenderizacaoError(Exception):
+    """Não há vaga para renderizar agora; o cliente deve tentar novamente depois."""
+
+
+class LimitadorRenderizacao:
+    """
+    Semáforo com fila de espera limitada e métricas de ocupação.
+
+    Args:
+        max_simultaneas: Renderizações executando ao mesmo tempo
+        max_aguardando: Pedidos que podem esperar por uma vaga
+        timeout_espera: Tempo máximo (s) de espera por uma vaga
+    """
+
+    def __init__(self, max_simultaneas=2, max_aguardando=10, timeout_espera=30):
+        self.max_simultaneas = max_simultaneas
+        self.max_aguardando = max_aguardando
+        self.timeout_espera = timeout_espera
+        self._vagas = threading.BoundedSemaphore(max_simultaneas)
+        self._lock = threading.Lock()
+        self.em_execucao = 0
+        self.aguardando = 0
+        self.pico_aguardando = 0
+        self.executadas = 0
+        self.recusadas = 0
+        self._esperas = deque(maxlen=AMOSTRAS_ESPERA)
+
+    @contextmanager
+    def vaga(self, limitar_fila=True, timeout=None):
+        """
+        Ocupa uma vaga de renderização durante o bloco `with`.
+
+        Args:
+            limitar_fila: False para chamadas de segundo plano (jobs, exportação), que já são
+                limitadas pelos próprios workers: aguardam sem contar para a fila.
+            timeout: Tempo máximo (s) de espera por uma vaga (padrão: timeout_espera)
+
+        Raises:
+            LimiteRenderizacaoError: Fila cheia ou tempo de espera esgotado
+        """
+        inicio = time.monotonic()
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                if limitar_fila and self.aguardando >= self.max_aguardando:
+                    self.recusadas += 1
+                    raise LimiteRenderizacaoError('Fila de renderização cheia')
+                self.aguardando += 1
+                self.pico_aguardando = max(self.pico_aguardando, self.aguardando)
+            try:
+                obteve = self._vagas.acquire(timeout=self.timeout_espera if timeout is None else timeout)
+            finally:
+                with self._lock:
+                    self.aguardando -= 1
+            if not obteve:
+                with self._lock:
+                    self.recusadas += 1
+                raise LimiteRenderizacaoError('Tempo esgotado aguardando vaga para renderizar')
+
+        with self._lock:
+            self.em_execucao += 1
+            self._esperas.append(time.monotonic() - inicio)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.em_execucao -= 1
+                self.executadas += 1
+            self._vagas.release()
+
+    def to_dict(self):
+        with self._lock:
+            esperas = sorted(self._esperas)
+            em_execucao, aguardando = self.em_execucao, self.aguardando
+            pico, executadas, recusadas = self.pico_aguardando, self.executadas, self.recusadas
+
+        def percentil(p):
+            if not esperas:
+                return None
+            return round(esperas[min(len(esperas) - 1, int(p / 100 * len(esperas)))] * 1000, 1)
+
+        return {
+            'max_simultaneas': self.max_simultaneas,
+            'max_aguardando': self.max_aguardando,
+            'em_execucao': em_execucao,
+            'aguardando': aguardando,
+            'pico_aguardando': pico,
+            'executadas': executadas,
+            'recusadas': recusadas,
+            'espera_p50_ms': percentil(50),
+            'espera_p95_ms': percentil(95),
+        }
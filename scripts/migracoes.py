@@ -0,0 +1,102 @@
+"""
+Migrações versionadas do esquema do banco de dados
+
+Cada migração tem um número de versão e roda uma única vez: ao ser aplicada, a versão
+é registrada na tabela schema_version. Na inicialização basta uma consulta a essa
+tabela para saber que o esquema está atualizado.
+
+As migrações devem ser idempotentes (verificar antes de criar), pois no SQLite parte
+do DDL não é desfeito por rollback e um banco antigo pode já ter parte das mudanças.
+"""
+import logging
+from collections import namedtuple
+
+from sqlalchemy import text
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+TABELA_VERSOES = 'schema_version'
+
+# versao: número inteiro crescente; aplicar: função que recebe a conexão (já em transação)
+Migracao = namedtuple('Migracao', 'versao descricao aplicar')
+
+
+def versoes_aplicadas(conexao):
+    """Cria a tabela de versões, se necessário, e retorna as versões já aplicadas."""
+    conexao.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {TABELA_VERSOES} ("
+        "versao INTEGER PRIMARY KEY, descricao TEXT, aplicada_em TEXT DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    return {linha[0] for linha in conexao.execute(text(f"SELECT versao FROM {TABELA_VERSOES}"))}
+
+
+def migracoes_pendentes(engine, migracoes):
+    """Retorna as migrações ainda não aplicadas, em ordem de versão."""
+    with engine.begin() as conexao:
+        aplicadas = versoes_aplicadas(conexao)
+    return [migracao for migracao in sorted(migracoes, key=lambda m: m.versao)
+            if migracao.versao not in aplicadas]
+
+
+def aplicar_migracoes(engine, migracoes):
+    """
+    Aplica as migrações pendentes, cada uma em sua própria transação.
+
+    Args:
+        engine: Engine do SQLAlchemy
+        migracoes: Sequência de Migracao
+
+    Returns:
+        int: Quantidade de migrações aplicadas
+
+    Raises:
+        Exception: Erro da migração que falhou (as seguintes não são aplicadas)
+    """
+    pendentes = migracoes_pendentes(engine, migracoes)
+    for migracao in pendentes:
+        logger.info(f"🔄 Migração {migracao.versao}: {migracao.descricao}...")
+        try:
+            with engine.begin() as conexao:
+                migracao.aplicar(conexao)
+                conexao.execute(
+                    text(f"INSERT INTO {TABELA_VERSOES} (versao, descricao) VALUES (:versao, :descricao)"),
+                    {'versao': migracao.versao, 'descricao': migracao.descricao}
+                )
+        except Exception as e:
+            logger.error(f"❌ Erro na migração {migracao.versao} ({migracao.descricao}): {e}")
+            raise
+        logger.info(f"✅ Migração {migracao.versao} aplicada")
+    return len(pendentes)
+
+
+def colunas_tabela(conexao, tabela):
+    """Nomes das colunas da tabela."""
+    return [linha[1] for linha in conexao.execute(text(f"PRAGMA table_info({tabela})"))]
+
+
+def _indice_cobre(conexao, tabela, colunas, unico):
+    """True se algum índice da tabela já começa pelas colunas (e é único, se exigido)."""
+    for indice in conexao.execute(text(f"PRAGMA index_list({tabela})")).fetchall():
+        nome, indice_unico = indice[1], indice[2]
+        if unico and not indice_unico:
+            continue
+        colunas_indice = [linha[2] for linha in conexao.execute(text(f"PRAGMA index_info('{nome}')"))]
+        if colunas_indice[:len(colunas)] == list(colunas):
+            return True
+    return False
+
+
+def criar_indice(conexao, nome, tabela, colunas, unico=False):
+    """
+    Cria um índice, a menos que a tabela já tenha um equivalente
+    (ex: o índice automático de uma coluna UNIQUE).
+
+    Returns:
+        bool: True se o índice foi criado
+    """
+    if _indice_cobre(conexao, tabela, colunas, unico):
+        return False
+    tipo = 'UNIQUE INDEX' if unico else 'INDEX'
+    conexao.execute(text(f"CREATE {tipo} IF NOT EXISTS {nome} ON {tabela} ({', '.join(colunas)})"))
+    return True
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script para aplicar as migrações pendentes do banco de dados
+(as mesmas aplicadas automaticamente ao iniciar o app.py)
+
+Uso:
+    python3 scripts/migrar_banco.py            # Aplica as migrações pendentes
+    python3 scripts/migrar_banco.py --listar   # Apenas lista as pendentes
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, MIGRACOES
+from scripts.migracoes import aplicar_migracoes, migracoes_pendentes
+
+def migrar(apenas_listar=False):
+    with app.app_context():
+        db.create_all()
+        pendentes = migracoes_pendentes(db.engine, MIGRACOES)
+        if not pendentes:
+            print("✅ Banco de dados já está na versão mais recente")
+            return
+        
+        for migracao in pendentes:
+            print(f"  {migracao.versao}: {migracao.descricao}")
+        if apenas_listar:
+            print(f"ℹ️ {len(pendentes)} migração(ões) pendente(s)")
+            return
+        
+        aplicadas = aplicar_migracoes(db.engine, MIGRACOES)
+        print(f"✅ {aplicadas} migração(ões) aplicada(s)")
+
+if __name__ == '__main__':
+    try:
+        migrar(apenas_listar='--listar' in sys.argv[1:])
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        sys.exit(1)
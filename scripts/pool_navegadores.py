@@ -0,0 +1,344 @@
+"""
+Pool de navegadores headless mantidos aquecidos para a renderização HTML
+
+Cada instância é um Chrome headless controlado pelo Chrome DevTools Protocol (CDP)
+através de --remote-debugging-pipe, sem dependências além do html2image (usado
+apenas para localizar o executável do Chrome).
+"""
+import atexit
+import base64
+import fcntl
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from html2image.browsers.search_utils import find_chrome
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes de configuração (sobrescrevíveis via variáveis de ambiente)
+TAMANHO_POOL = int(os.getenv('HTML_RENDER_POOL_SIZE', '2'))
+RENDERS_POR_NAVEGADOR = int(os.getenv('HTML_RENDER_MAX_RENDERS', '200'))
+TIMEOUT_RENDER = float(os.getenv('HTML_RENDER_TIMEOUT', '20'))
+TIMEOUT_AQUISICAO = float(os.getenv('HTML_RENDER_ACQUIRE_TIMEOUT', '30'))
+TIMEOUT_SAUDE = 2.0
+
+FLAGS_CHROME = [
+    '--headless=new',
+    '--remote-debugging-pipe',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-gpu',
+    '--hide-scrollbars',
+    '--mute-audio',
+]
+
+# Colocado na fila de livres quando um navegador é descartado, para acordar quem
+# aguarda e deixá-lo criar o substituto na vaga liberada
+_VAGA_LIBERADA = None
+
+
+class FalhaNavegacao(RuntimeError):
+    """O Chrome não conseguiu carregar a página (o navegador continua utilizável)."""
+
+
+# O Chrome lê comandos CDP do fd 3 e escreve respostas no fd 4. Este lançador
+# mínimo posiciona os pipes nesses descritores antes de executar o Chrome,
+# sem depender de preexec_fn (que não é seguro em servidores com threads).
+_LANCADOR = (
+    'import os, sys\n'
+    'entrada, saida = int(sys.argv[1]), int(sys.argv[2])\n'
+    'os.dup2(entrada, 3)\n'
+    'os.dup2(saida, 4)\n'
+    'os.close(entrada)\n'
+    'os.close(saida)\n'
+    'os.execv(sys.argv[3], sys.argv[3:])\n'
+)
+
+
+class NavegadorHeadless:
+    """Chrome headless com uma aba dedicada, reutilizada entre renderizações."""
+
+    def __init__(self, executavel):
+        self.executavel = executavel
+        self.renders = 0
+        self._proximo_id = 0
+        self._buffer = bytearray()
+        self._eventos = []
+        self._sessao = None
+        self._perfil = tempfile.mkdtemp(prefix='gccreporter_chrome_')
+
+        # Descritores acima de 4 para não colidirem com os fds 3/4 no processo filho
+        leitura_chrome, self._escrita = os.pipe()
+        self._leitura, escrita_chrome = os.pipe()
+        entrada = fcntl.fcntl(leitura_chrome, fcntl.F_DUPFD_CLOEXEC, 5)
+        saida = fcntl.fcntl(escrita_chrome, fcntl.F_DUPFD_CLOEXEC, 5)
+        os.close(leitura_chrome)
+        os.close(escrita_chrome)
+
+        try:
+            self._processo = subprocess.Popen(
+                [sys.executable, '-c', _LANCADOR, str(entrada), str(saida),
+                 executavel, f'--user-data-dir={self._perfil}', *FLAGS_CHROME],
+                pass_fds=(entrada, saida),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception:
+            os.close(self._leitura)
+            os.close(self._escrita)
+            shutil.rmtree(self._perfil, ignore_errors=True)
+            raise
+        finally:
+            os.close(entrada)
+            os.close(saida)
+
+        try:
+            prazo = time.monotonic() + TIMEOUT_RENDER
+            alvo = self._comando('Target.createTarget', prazo, url='about:blank')['targetId']
+            self._sessao = self._comando('Target.attachToTarget', prazo, targetId=alvo, flatten=True)['sessionId']
+            self._comando('Page.enable', prazo, self._sessao)
+            # Fundo transparente, como o html2image faz com --default-background-color
+            self._comando('Emulation.setDefaultBackgroundColorOverride', prazo, self._sessao,
+                          color={'r': 0, 'g': 0, 'b': 0, 'a': 0})
+        except Exception:
+            self.encerrar()
+            raise
+
+    def _escrever(self, dados):
+        while dados:
+            escritos = os.write(self._escrita, dados)
+            dados = dados[escritos:]
+
+    def _ler_mensagem(self, prazo):
+        """Lê uma mensagem CDP (JSON terminado em \\0) respeitando o prazo."""
+        inicio_busca = 0
+        while True:
+            fim = self._buffer.find(b'\0', inicio_busca)
+            if fim != -1:
+                mensagem = bytes(self._buffer[:fim])
+                del self._buffer[:fim + 1]
+                return json.loads(mensagem)
+            inicio_busca = len(self._buffer)
+
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                raise TimeoutError('Chrome não respondeu dentro do prazo')
+            prontos, _, _ = select.select([self._leitura], [], [], restante)
+            if prontos:
+                bloco = os.read(self._leitura, 1 << 16)
+                if not bloco:
+                    raise ConnectionError('Chrome encerrou a conexão CDP')
+                self._buffer += bloco
+
+    def _comando(self, metodo, prazo, sessao=None, **params):
+        """Envia um comando CDP e aguarda a resposta, guardando eventos recebidos no caminho."""
+        self._proximo_id += 1
+        id_comando = self._proximo_id
+        mensagem = {'id': id_comando, 'method': metodo, 'params': params}
+        if sessao:
+            mensagem['sessionId'] = sessao
+        self._escrever(json.dumps(mensagem).encode('utf-8') + b'\0')
+
+        while True:
+            resposta = self._ler_mensagem(prazo)
+            if resposta.get('id') == id_comando:
+                if 'error' in resposta:
+                    raise RuntimeError(f"CDP {metodo}: {resposta['error'].get('message')}")
+                return resposta.get('result', {})
+            if 'method' in resposta:
+                self._eventos.append(resposta)
+
+    def _aguardar_evento(self, metodo, prazo):
+        for evento in self._eventos:
+            if evento['method'] == metodo and evento.get('sessionId') == self._sessao:
+                self._eventos.clear()
+                return evento
+        self._eventos.clear()
+
+        while True:
+            mensagem = self._ler_mensagem(prazo)
+            if mensagem.get('method') == metodo and mensagem.get('sessionId') == self._sessao:
+                return mensagem
+
+    def saudavel(self):
+        """Verifica se o processo está vivo e respondendo ao CDP."""
+        if self._processo.poll() is not None:
+            return False
+        try:
+            self._comando('Browser.getVersion', time.monotonic() + TIMEOUT_SAUDE)
+            return True
+        except Exception:
+            return False
+
+    def capturar(self, caminho_html, tamanho):
+        """Carrega o arquivo HTML na aba e retorna o screenshot PNG em bytes."""
+        largura, altura = tamanho
+        prazo = time.monotonic() + TIMEOUT_RENDER
+        self._eventos.clear()
+
+        self._comando('Emulation.setDeviceMetricsOverride', prazo, self._sessao,
+                      width=largura, height=altura, deviceScaleFactor=1, mobile=False)
+        navegacao = self._comando('Page.navigate', prazo, self._sessao, url=Path(caminho_html).as_uri())
+        if navegacao.get('errorText'):
+            raise FalhaNavegacao(f"Falha ao carregar a página: {navegacao['errorText']}")
+        self._aguardar_evento('Page.loadEventFired', prazo)
+        resultado = self._comando('Page.captureScreenshot', prazo, self._sessao, format='png',
+                                  clip={'x': 0, 'y': 0, 'width': largura, 'height': altura, 'scale': 1})
+        self.renders += 1
+        return base64.b64decode(resultado['data'])
+
+    def encerrar(self):
+        """Fecha o Chrome e libera pipes e perfil temporário."""
+        if self._processo.poll() is None:
+            try:
+                self._comando('Browser.close', time.monotonic() + TIMEOUT_SAUDE)
+            except Exception:
+                pass
+            try:
+                self._processo.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._processo.kill()
+                self._processo.wait()
+
+        for fd in (self._leitura, self._escrita):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        shutil.rmtree(self._perfil, ignore_errors=True)
+
+
+class PoolNavegadores:
+    """
+    Pool de navegadores aquecidos compartilhado pelo processo.
+
+    Os navegadores são criados sob demanda até `tamanho`, verificados antes de cada
+    uso e reciclados após `renders_por_navegador` renderizações.
+    """
+
+    def __init__(self, tamanho=TAMANHO_POOL, renders_por_navegador=RENDERS_POR_NAVEGADOR, executavel=None):
+        self.tamanho = tamanho
+        self.renders_por_navegador = renders_por_navegador
+        self._executavel = executavel
+        self._livres = queue.LifoQueue()
+        self._criados = 0
+        self._encerrado = False
+        self._lock = threading.Lock()
+
+    def _novo_navegador(self):
+        if self._executavel is None:
+            self._executavel = find_chrome()
+        logger.info('Iniciando navegador headless para o pool de renderização')
+        return NavegadorHeadless(self._executavel)
+
+    def _liberar_vaga(self):
+        with self._lock:
+            self._criados -= 1
+        self._livres.put(_VAGA_LIBERADA)
+
+    def _descartar(self, navegador):
+        self._liberar_vaga()
+        try:
+            navegador.encerrar()
+        except Exception as e:
+            logger.warning(f'Erro ao encerrar navegador do pool: {e}')
+
+    def _adquirir(self):
+        prazo = time.monotonic() + TIMEOUT_AQUISICAO
+        while True:
+            try:
+                navegador = self._livres.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    pode_criar = self._criados < self.tamanho
+                    if pode_criar:
+                        self._criados += 1
+                if pode_criar:
+                    try:
+                        return self._novo_navegador()
+                    except Exception:
+                        self._liberar_vaga()
+                        raise
+                try:
+                    navegador = self._livres.get(timeout=max(0, prazo - time.monotonic()))
+                except queue.Empty:
+                    raise TimeoutError('Nenhum navegador do pool ficou disponível a tempo')
+
+            if navegador is _VAGA_LIBERADA:
+                # Um navegador foi descartado: tentar criar o substituto
+                continue
+            if navegador.saudavel():
+                return navegador
+            logger.warning('Navegador do pool não respondeu ao health check, substituindo')
+            self._descartar(navegador)
+
+    def _devolver(self, navegador):
+        if self._encerrado or navegador.renders >= self.renders_por_navegador:
+            self._descartar(navegador)
+        else:
+            self._livres.put(navegador)
+
+    def renderizar(self, caminho_html, tamanho):
+        """Renderiza o arquivo HTML em um navegador do pool e retorna os bytes PNG."""
+        if self._encerrado:
+            raise RuntimeError('Pool de navegadores encerrado')
+        navegador = self._adquirir()
+        try:
+            png = navegador.capturar(caminho_html, tamanho)
+        except FalhaNavegacao:
+            self._devolver(navegador)
+            raise
+        except Exception:
+            self._descartar(navegador)
+            raise
+        self._devolver(navegador)
+        return png
+
+    def encerrar(self):
+        """Encerra todos os navegadores ociosos; os em uso são fechados ao serem devolvidos."""
+        self._encerrado = True
+        while True:
+            try:
+                navegador = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            if navegador is not _VAGA_LIBERADA:
+                self._descartar(navegador)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def obter_pool():
+    """Retorna o pool do processo atual (recriado após fork, ex: workers do gunicorn)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = PoolNavegadores()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def encerrar_pool():
+    """Encerra o pool do processo atual, se existir."""
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.encerrar()
+
+
+atexit.register(encerrar_pool)
@@ -0,0 +1,120 @@
+"""
+Renderização PIL em um pool de processos
+
+O desenho com o PIL é CPU puro e, dentro da thread da requisição, fica preso ao GIL.
+Com PIL_PROCESS_WORKERS > 0 a renderização é enviada a processos auxiliares, que
+carregam fontes, fundos e o gradiente uma única vez ao iniciar e recebem apenas um
+retrato serializável do comunicado (sem objetos do SQLAlchemy).
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+from scripts.cache_imagens import BASE_DIR, CAMPOS_RENDER
+from scripts.gerar_imagem import (
+    gerar_png, pre_carregar_fontes, _carregar_fundo, _gerar_gradiente_padrao, DIMENSOES_PADRAO
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes de configuração (sobrescrevíveis via variáveis de ambiente)
+NUM_PROCESSOS_PIL = int(os.getenv('PIL_PROCESS_WORKERS', '0'))
+TIMEOUT_PROCESSO_PIL = float(os.getenv('PIL_PROCESS_TIMEOUT', '30'))
+
+PASTA_MODELOS = os.path.join(BASE_DIR, 'static', 'modelos')
+
+
+def retrato_comunicado(comunicado):
+    """Copia os campos usados pelo renderizador para um dicionário serializável."""
+    dados = {campo: getattr(comunicado, campo, None) for campo in CAMPOS_RENDER}
+    template = comunicado.template
+    dados['imagem_fundo'] = template.imagem_fundo if template else None
+    dados['corpo_layout'] = getattr(comunicado, 'corpo_layout', None)
+    return dados
+
+
+def _comunicado_do_retrato(dados):
+    dados = dict(dados)
+    imagem_fundo = dados.pop('imagem_fundo')
+    template = SimpleNamespace(imagem_fundo=imagem_fundo) if imagem_fundo else None
+    return SimpleNamespace(template=template, **dados)
+
+
+def _inicializar_processo():
+    """Aquece fontes, fundos de static/modelos e o gradiente padrão no processo auxiliar."""
+    pre_carregar_fontes()
+    _gerar_gradiente_padrao(*DIMENSOES_PADRAO)
+    if os.path.isdir(PASTA_MODELOS):
+        for nome in os.listdir(PASTA_MODELOS):
+            try:
+                _carregar_fundo(os.path.join(PASTA_MODELOS, nome))
+            except Exception as e:
+                logger.warning(f'Erro ao pré-carregar fundo {nome}: {e}')
+
+
+def _renderizar_retrato(dados, configs, formato):
+    return gerar_png(_comunicado_do_retrato(dados), configs, formato)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _obter_executor():
+    """Retorna o pool do processo atual (recriado após fork, ex: workers do gunicorn)."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn: o servidor tem threads, e fork com threads ativas não é seguro
+            _executor = ProcessPoolExecutor(
+                max_workers=NUM_PROCESSOS_PIL,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_inicializar_processo,
+            )
+            _executor_pid = os.getpid()
+            logger.info(f'Pool de {NUM_PROCESSOS_PIL} processo(s) PIL iniciado')
+        return _executor
+
+
+def gerar_png_processo(comunicado, configs, formato='PNG'):
+    """
+    Gera a imagem com o renderizador PIL, em um processo auxiliar quando o pool estiver ativo.
+
+    Args:
+        comunicado: Objeto Comunicado do banco de dados
+        configs: Dicionário com configurações de estilo
+        formato: 'PNG' ou 'JPEG'
+
+    Returns:
+        bytes: Imagem em formato de bytes
+    """
+    global _executor
+    if NUM_PROCESSOS_PIL <= 0:
+        return gerar_png(comunicado, configs, formato)
+
+    executor = _obter_executor()
+    try:
+        futuro = executor.submit(_renderizar_retrato, retrato_comunicado(comunicado), dict(configs), formato)
+        return futuro.result(timeout=TIMEOUT_PROCESSO_PIL)
+    except BrokenProcessPool:
+        # Um processo auxiliar morreu (ex: falta de memória): descartar o pool para recriá-lo
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        raise
+
+
+def encerrar_pool_pil():
+    """Encerra o pool do processo atual, se existir."""
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(encerrar_pool_pil)
@@ -0,0 +1,18 @@
+"""
+Testes do GCC Reporter
+
+Banco, cache de imagens e versão das configurações ficam em um diretório temporário,
+definido aqui (antes de qualquer módulo de teste importar o app) e removido ao final.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+DIRETORIO_TESTES = tempfile.mkdtemp(prefix='gcc-testes-')
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(DIRETORIO_TESTES, 'comunicados.db')
+os.environ['CONFIG_VERSION_FILE'] = os.path.join(DIRETORIO_TESTES, 'configuracoes.versao')
+os.environ['RENDER_CACHE_DIR'] = os.path.join(DIRETORIO_TESTES, 'imagens')
+os.environ['RENDER_ON_SAVE'] = 'false'
+
+atexit.register(shutil.rmtree, DIRETORIO_TESTES, ignore_errors=True)
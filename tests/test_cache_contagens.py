@@ -0,0 +1,113 @@
+"""
+Cache das contagens do histórico (stale-while-revalidate)
+
+Dentro do ttl a contagem vem do cache; vencida ou invalidada, o valor anterior
+continua sendo servido enquanto uma thread calcula o novo.
+"""
+import threading
+import time
+import unittest
+
+from scripts.cache_contagens import CacheContagens
+
+ESPERA_MAXIMA = 5
+
+
+class Contador:
+    """Função de contagem que registra quantas vezes foi chamada."""
+
+    def __init__(self, valor=10):
+        self.valor = valor
+        self.chamadas = 0
+
+    def __call__(self):
+        self.chamadas += 1
+        return self.valor
+
+
+class CacheContagensTest(unittest.TestCase):
+
+    def aguardar_valor(self, cache, chave, contar, esperado):
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            if cache.obter(chave, contar) == esperado:
+                return
+            time.sleep(0.01)
+        self.fail(f'Contagem não chegou a {esperado}')
+
+    def test_calcula_uma_vez_dentro_do_ttl(self):
+        cache = CacheContagens(ttl=60)
+        contar = Contador()
+        self.assertEqual(cache.obter('todos', contar), 10)
+        contar.valor = 11
+        self.assertEqual(cache.obter('todos', contar), 10)
+        self.assertEqual(contar.chamadas, 1)
+
+    def test_vencida_serve_valor_antigo_e_atualiza(self):
+        cache = CacheContagens(ttl=0)
+        contar = Contador()
+        cache.obter('todos', contar)
+        time.sleep(0.01)
+        contar.valor = 11
+        # O valor antigo volta na hora; o novo é calculado em segundo plano
+        self.assertEqual(cache.obter('todos', contar), 10)
+        self.aguardar_valor(cache, 'todos', contar, 11)
+
+    def test_invalidar_recalcula_em_segundo_plano(self):
+        cache = CacheContagens(ttl=60)
+        contar = Contador()
+        cache.obter('todos', contar)
+        contar.valor = 11
+        cache.invalidar()
+        self.assertEqual(cache.obter('todos', contar), 10)
+        self.aguardar_valor(cache, 'todos', contar, 11)
+        chamadas = contar.chamadas
+        self.assertEqual(cache.obter('todos', contar), 11)
+        self.assertEqual(contar.chamadas, chamadas)
+
+    def test_sem_aguardar_agenda_o_calculo(self):
+        cache = CacheContagens(ttl=60)
+        liberar = threading.Event()
+
+        def contar():
+            liberar.wait(ESPERA_MAXIMA)
+            return 7
+
+        self.assertIsNone(cache.obter('busca', contar, aguardar=False))
+        liberar.set()
+        self.aguardar_valor(cache, 'busca', contar, 7)
+
+    def test_um_calculo_por_chave_por_vez(self):
+        cache = CacheContagens(ttl=0)
+        cache.obter('todos', Contador())
+        time.sleep(0.01)
+        liberar = threading.Event()
+        iniciados = []
+
+        def contar_devagar():
+            iniciados.append(time.monotonic())
+            liberar.wait(ESPERA_MAXIMA)
+            return 11
+
+        try:
+            for _ in range(5):
+                self.assertEqual(cache.obter('todos', contar_devagar), 10)
+            time.sleep(0.05)
+            self.assertEqual(len(iniciados), 1)
+        finally:
+            liberar.set()
+
+    def test_remove_os_filtros_menos_usados(self):
+        cache = CacheContagens(ttl=60, max_itens=2)
+        contar = Contador()
+        for chave in ('a', 'b', 'a', 'c'):
+            cache.obter(chave, contar)
+        self.assertEqual(contar.chamadas, 3)
+        cache.obter('a', contar)
+        self.assertEqual(contar.chamadas, 3)
+        cache.obter('b', contar)
+        self.assertEqual(contar.chamadas, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
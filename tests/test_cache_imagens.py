@@ -0,0 +1,90 @@
+"""
+Limite de tamanho do cache de imagens em disco
+
+Ao passar do limite, as imagens acessadas há mais tempo saem primeiro, até o cache
+ficar em FRACAO_APOS_LIMPEZA do limite; o diretório só é medido de novo a cada
+GRAVACOES_POR_VERIFICACAO gravações ou quando a estimativa passa do limite.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from scripts import cache_imagens
+
+LIMITE = 1000
+
+
+class LimiteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp(prefix='gcc-cache-')
+        for nome, valor in (('DIRETORIO_CACHE', self.diretorio), ('TAMANHO_MAXIMO_CACHE', LIMITE),
+                            ('GRAVACOES_POR_VERIFICACAO', 3),
+                            ('_tamanho_estimado', None), ('_gravacoes_sem_verificar', 0)):
+            patcher = mock.patch.object(cache_imagens, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+
+    def gravar(self, comunicado_id, chave, tamanho, idade):
+        """Grava uma imagem no cache com o último acesso `idade` segundos atrás (sem aplicar o limite)."""
+        caminho = cache_imagens._caminho_cache(comunicado_id, chave, '.png')
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'wb') as f:
+            f.write(b'x' * tamanho)
+        instante = time.time() - idade
+        os.utime(caminho, (instante, instante))
+        return caminho
+
+    def test_remove_menos_usadas_ate_a_fracao_do_limite(self):
+        caminhos = [self.gravar(i, f'chave{i}', 300, idade=100 - i) for i in range(5)]
+        total = cache_imagens._aplicar_limite_cache()
+        self.assertEqual(total, 900)
+        self.assertLessEqual(total, LIMITE * cache_imagens.FRACAO_APOS_LIMPEZA)
+        self.assertEqual([os.path.exists(c) for c in caminhos], [False, False, True, True, True])
+
+    def test_acesso_atualiza_a_ordem(self):
+        caminhos = [self.gravar(i, f'chave{i}', 300, idade=100 - i) for i in range(4)]
+        # A imagem mais antiga volta a ser usada e passa a ser a última a sair
+        self.assertEqual(cache_imagens.obter_imagem_cache(0, 'chave0'), caminhos[0])
+        cache_imagens._aplicar_limite_cache()
+        self.assertEqual([os.path.exists(c) for c in caminhos], [True, False, True, True])
+
+    def test_dentro_do_limite_nada_e_removido(self):
+        caminhos = [self.gravar(i, f'chave{i}', 300, idade=10) for i in range(3)]
+        self.assertEqual(cache_imagens._aplicar_limite_cache(), 900)
+        self.assertTrue(all(os.path.exists(c) for c in caminhos))
+
+    def test_mede_o_diretorio_apenas_a_cada_n_gravacoes(self):
+        with mock.patch.object(cache_imagens, '_aplicar_limite_cache',
+                               wraps=cache_imagens._aplicar_limite_cache) as medir:
+            for i in range(7):
+                self.assertIsNotNone(cache_imagens.salvar_imagem_cache(i, 'chave', b'x' * 10))
+        # Primeira gravação e depois de 3 gravações sem medir
+        self.assertEqual(medir.call_count, 2)
+
+    def test_estimativa_acima_do_limite_aplica_o_limite(self):
+        with mock.patch.object(cache_imagens, '_aplicar_limite_cache',
+                               wraps=cache_imagens._aplicar_limite_cache) as medir:
+            for i in range(4):
+                cache_imagens.salvar_imagem_cache(i, 'chave', b'x' * 300)
+        # 1ª gravação mede; 2ª e 3ª somam (600, 900); a 4ª passaria de 1000 e mede/limpa
+        self.assertEqual(medir.call_count, 2)
+        restantes = sum(len(arquivos) for _, _, arquivos in os.walk(self.diretorio))
+        self.assertEqual(restantes, 3)
+
+    def test_chave_alternativa_separada_e_renovada(self):
+        with mock.patch.object(cache_imagens.time, 'time', return_value=1000.0):
+            chave = cache_imagens.chave_alternativa('abc', 60)
+        with mock.patch.object(cache_imagens.time, 'time', return_value=1019.0):
+            self.assertEqual(cache_imagens.chave_alternativa('abc', 60), chave)
+        with mock.patch.object(cache_imagens.time, 'time', return_value=1021.0):
+            self.assertNotEqual(cache_imagens.chave_alternativa('abc', 60), chave)
+        self.assertNotEqual(chave, 'abc')
+
+
+if __name__ == '__main__':
+    unittest.main()
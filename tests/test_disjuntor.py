@@ -0,0 +1,76 @@
+"""
+Transições de estado do disjuntor do renderizador HTML
+
+Fechado → aberto após `limite_falhas` falhas seguidas; aberto → meio aberto passado
+`tempo_espera`, com uma única chamada de teste; o teste fecha ou reabre o disjuntor.
+"""
+import unittest
+
+from scripts.disjuntor import Disjuntor, ESTADO_FECHADO, ESTADO_ABERTO, ESTADO_MEIO_ABERTO
+
+
+class DisjuntorTest(unittest.TestCase):
+
+    def abrir(self, disjuntor):
+        for _ in range(disjuntor.limite_falhas):
+            self.assertTrue(disjuntor.permitir())
+            disjuntor.registrar_falha(RuntimeError('Chrome indisponível'))
+
+    def test_abre_apos_falhas_seguidas(self):
+        disjuntor = Disjuntor('teste', limite_falhas=3, tempo_espera=60)
+        disjuntor.registrar_falha(RuntimeError('falha'))
+        disjuntor.registrar_falha(RuntimeError('falha'))
+        self.assertEqual(disjuntor.estado, ESTADO_FECHADO)
+        disjuntor.registrar_falha(RuntimeError('falha'))
+        self.assertEqual(disjuntor.estado, ESTADO_ABERTO)
+        self.assertFalse(disjuntor.fechado())
+        self.assertFalse(disjuntor.permitir())
+        self.assertEqual(disjuntor.to_dict()['desvios'], 1)
+
+    def test_sucesso_zera_falhas_consecutivas(self):
+        disjuntor = Disjuntor('teste', limite_falhas=2, tempo_espera=60)
+        disjuntor.registrar_falha(RuntimeError('falha'))
+        disjuntor.registrar_sucesso()
+        disjuntor.registrar_falha(RuntimeError('falha'))
+        self.assertEqual(disjuntor.estado, ESTADO_FECHADO)
+        self.assertTrue(disjuntor.fechado())
+
+    def test_meio_aberto_libera_uma_chamada_de_teste(self):
+        disjuntor = Disjuntor('teste', limite_falhas=1, tempo_espera=0)
+        self.abrir(disjuntor)
+        self.assertTrue(disjuntor.permitir())
+        self.assertEqual(disjuntor.estado, ESTADO_MEIO_ABERTO)
+        # Enquanto o teste não termina, as demais chamadas seguem o caminho alternativo
+        self.assertFalse(disjuntor.permitir())
+        self.assertFalse(disjuntor.fechado())
+
+    def test_teste_com_sucesso_fecha(self):
+        disjuntor = Disjuntor('teste', limite_falhas=1, tempo_espera=0)
+        self.abrir(disjuntor)
+        self.assertTrue(disjuntor.permitir())
+        disjuntor.registrar_sucesso()
+        self.assertEqual(disjuntor.estado, ESTADO_FECHADO)
+        self.assertTrue(disjuntor.permitir())
+        self.assertTrue(disjuntor.permitir())
+
+    def test_teste_com_falha_reabre(self):
+        disjuntor = Disjuntor('teste', limite_falhas=3, tempo_espera=0)
+        self.abrir(disjuntor)
+        self.assertTrue(disjuntor.permitir())
+        disjuntor.tempo_espera = 60
+        # Uma única falha no teste basta para reabrir
+        disjuntor.registrar_falha(RuntimeError('ainda fora'))
+        self.assertEqual(disjuntor.estado, ESTADO_ABERTO)
+        self.assertFalse(disjuntor.permitir())
+
+    def test_aberto_antes_do_tempo_de_espera(self):
+        disjuntor = Disjuntor('teste', limite_falhas=1, tempo_espera=60)
+        self.abrir(disjuntor)
+        for _ in range(3):
+            self.assertFalse(disjuntor.permitir())
+        self.assertEqual(disjuntor.estado, ESTADO_ABERTO)
+        self.assertGreater(disjuntor.to_dict()['segundos_para_teste'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
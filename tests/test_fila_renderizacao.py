@@ -0,0 +1,105 @@
+"""
+Fila de renderização em segundo plano
+
+Jobs do mesmo comunicado são reaproveitados, a fila recusa pedidos quando cheia e
+o prazo de cada job vale tanto para a espera na fila quanto para a execução, sem
+que renderizações abandonadas passem do limite de execuções.
+"""
+import threading
+import time
+import unittest
+
+from scripts.fila_renderizacao import (
+    FilaRenderizacao, FilaCheiaError, ESTADO_PROCESSANDO, ESTADO_CONCLUIDO, ESTADO_ERRO,
+)
+
+ESPERA_MAXIMA = 5
+
+
+class FilaRenderizacaoTest(unittest.TestCase):
+
+    def setUp(self):
+        # Comunicados com id negativo ficam presos até o fim do teste
+        self.liberar = threading.Event()
+
+    def tearDown(self):
+        self.liberar.set()
+
+    def executar(self, job):
+        if job.comunicado_id < 0:
+            self.liberar.wait(ESPERA_MAXIMA)
+        return {'comunicado': job.comunicado_id}
+
+    def aguardar_processando(self, job):
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while job.estado != ESTADO_PROCESSANDO and time.monotonic() < limite:
+            time.sleep(0.01)
+        self.assertEqual(job.estado, ESTADO_PROCESSANDO)
+
+    def test_conclui_job(self):
+        fila = FilaRenderizacao(self.executar, num_workers=1, timeout=ESPERA_MAXIMA)
+        job = fila.submeter(1)
+        self.assertTrue(job.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(job.estado, ESTADO_CONCLUIDO)
+        self.assertEqual(job.resultado, {'comunicado': 1})
+        self.assertIs(fila.obter(job.id), job)
+        self.assertIsNone(fila.job_ativo(1))
+
+    def test_reaproveita_job_ativo_do_mesmo_comunicado(self):
+        fila = FilaRenderizacao(self.executar, num_workers=1, timeout=ESPERA_MAXIMA)
+        job = fila.submeter(-1)
+        self.assertIs(fila.submeter(-1), job)
+        self.assertIs(fila.job_ativo(-1), job)
+        self.liberar.set()
+        self.assertTrue(job.aguardar(ESPERA_MAXIMA))
+        # Finalizado, o próximo pedido cria outro job
+        self.assertIsNot(fila.submeter(-1), job)
+
+    def test_fila_cheia(self):
+        fila = FilaRenderizacao(self.executar, num_workers=1, tamanho_maximo=1, timeout=ESPERA_MAXIMA)
+        self.aguardar_processando(fila.submeter(-1))
+        fila.submeter(2)
+        with self.assertRaises(FilaCheiaError):
+            fila.submeter(3)
+
+    def test_prazo_esgotado_na_execucao(self):
+        fila = FilaRenderizacao(self.executar, num_workers=1, timeout=0.2)
+        preso = fila.submeter(-1)
+        self.assertTrue(preso.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(preso.estado, ESTADO_ERRO)
+        self.assertEqual(preso.erro, 'Tempo esgotado na renderização')
+        # O worker segue para os próximos jobs enquanto a renderização abandonada termina
+        job = fila.submeter(2)
+        self.assertTrue(job.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(job.estado, ESTADO_CONCLUIDO)
+
+    def test_prazo_esgotado_na_fila(self):
+        fila = FilaRenderizacao(self.executar, num_workers=1, timeout=0.2)
+        fila.submeter(-1)
+        atrasado = fila.submeter(2)
+        self.assertTrue(atrasado.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(atrasado.estado, ESTADO_ERRO)
+        self.assertEqual(atrasado.erro, 'Tempo esgotado aguardando na fila')
+
+    def test_renderizacoes_abandonadas_limitadas(self):
+        fila = FilaRenderizacao(self.executar, num_workers=1, timeout=0.2, max_execucoes=1)
+        preso = fila.submeter(-1)
+        self.assertTrue(preso.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(fila.execucoes_ativas(), 1)
+        # A única vaga de execução segue com a renderização abandonada
+        job = fila.submeter(2)
+        self.assertTrue(job.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(job.estado, ESTADO_ERRO)
+        self.assertEqual(job.erro, 'Tempo esgotado aguardando renderizações anteriores')
+        # Quando ela termina, a vaga volta
+        self.liberar.set()
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while fila.execucoes_ativas() and time.monotonic() < limite:
+            time.sleep(0.01)
+        job = fila.submeter(3)
+        self.assertTrue(job.aguardar(ESPERA_MAXIMA))
+        self.assertEqual(job.estado, ESTADO_CONCLUIDO)
+
+
+if __name__ == '__main__':
+    unittest.main()
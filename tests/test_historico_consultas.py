@@ -0,0 +1,103 @@
+"""
+Número de consultas SQL das páginas do histórico
+
+A listagem deve carregar apenas as colunas exibidas, com o template no mesmo SELECT:
+o número de consultas por página é fixo, não importa quantos comunicados ela mostre.
+"""
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import tests  # noqa: F401  Ambiente temporário (tests/__init__.py) antes de importar o app
+import app as gcc
+
+TOTAL_COMUNICADOS = 60
+TITULOS = ['Indisponibilidade', 'Instabilidade', 'Degradação', 'Normalização', 'Manutenção programada']
+TAGS = ['SAP', 'Oracle', 'MySQL']
+
+# Consultas esperadas por página: comunicados da página, tags do filtro e tipos do filtro
+# (a busca faz também a consulta dos trechos destacados; o total vem do cache de contagens)
+CONSULTAS_ESPERADAS = {
+    '/historico': 3,
+    '/historico?ultima=1': 3,
+    '/historico?tag=SAP': 3,
+    '/historico?tag=SAP&tag=Oracle&tag_modo=todas': 3,
+    '/historico?tipo=Instabilidade': 3,
+    '/historico?busca=manutencao': 4,
+}
+
+
+def setUpModule():
+    gcc.inicializar_dados()
+    with gcc.app.app_context():
+        inicio = datetime(2025, 1, 1, 8, 0)
+        for i in range(TOTAL_COMUNICADOS):
+            gcc.db.session.add(gcc.Comunicado(
+                codigo_unico=f'COM-TESTE{i:03d}',
+                titulo=TITULOS[i % len(TITULOS)],
+                subtitulo=f'Subtítulo {i}',
+                corpo=f'<p><b>Impacto:</b> manutenção do sistema {i}</p>' * 20,
+                rodape='<p>Equipe GCC</p>',
+                template_id=gcc.Template.query.first().id,
+                status='enviado' if i % 2 else 'rascunho',
+                tags=', '.join(TAGS[:i % len(TAGS) + 1]),
+                criado_em=inicio + timedelta(hours=i),
+            ))
+        gcc.db.session.commit()
+
+
+class ConsultasHistoricoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cliente = gcc.app.test_client()
+        self.tamanho_original = gcc.app.config['HISTORICO_PAGE_SIZE']
+
+    def tearDown(self):
+        gcc.app.config['HISTORICO_PAGE_SIZE'] = self.tamanho_original
+
+    def consultas(self, url):
+        """Executa a requisição e retorna as consultas SQL feitas na thread dela."""
+        thread = threading.get_ident()
+        consultas = []
+
+        def registrar(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == thread:
+                consultas.append(statement)
+
+        with gcc.app.app_context():
+            engine = gcc.db.engine
+        event.listen(engine, 'before_cursor_execute', registrar)
+        try:
+            resposta = self.cliente.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', registrar)
+        self.assertEqual(resposta.status_code, 200, url)
+        return consultas
+
+    def test_numero_fixo_de_consultas(self):
+        for url, esperadas in CONSULTAS_ESPERADAS.items():
+            with self.subTest(url=url):
+                # Primeira requisição aquece as configurações e as contagens em cache
+                self.consultas(url)
+                self.assertEqual(len(self.consultas(url)), esperadas)
+
+    def test_consultas_nao_dependem_do_tamanho_da_pagina(self):
+        for tamanho in (5, 50):
+            gcc.app.config['HISTORICO_PAGE_SIZE'] = tamanho
+            with self.subTest(tamanho=tamanho):
+                self.consultas('/historico')
+                self.assertEqual(len(self.consultas('/historico')), CONSULTAS_ESPERADAS['/historico'])
+
+    def test_listagem_nao_carrega_colunas_pesadas(self):
+        listagem = [sql for sql in self.consultas('/historico') if 'LIMIT' in sql and 'FROM comunicado' in sql]
+        self.assertEqual(len(listagem), 1)
+        colunas = listagem[0].split(' FROM ')[0]
+        for coluna in ('corpo', 'rodape', 'corpo_layout', 'corpo_pos_x', 'publico_alvo_tamanho'):
+            self.assertNotIn(f'comunicado.{coluna} ', colunas)
+        self.assertIn('JOIN template', listagem[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Fidelidade do layout do corpo à prévia
+
+O renderizador PIL desenha o modelo de layout (compilar_layout), enquanto a prévia e o
+Chrome exibem o próprio HTML. Para os corpos formatados abaixo, o texto de cada linha,
+o marcador dos itens de lista e o estilo de cada trecho do layout devem ser os mesmos
+que o navegador mostra na prévia.
+"""
+import json
+import re
+import unittest
+from html.parser import HTMLParser
+
+import tests  # noqa: F401  Ambiente temporário (tests/__init__.py) antes de importar o app
+import app as gcc
+from scripts.layout_texto import (
+    PARAGRAFO_ITEM, PARAGRAFO_VAZIO, ESTILO_NEGRITO, ESTILO_ITALICO, ESTILO_SUBLINHADO, ESTILO_NORMAL,
+    compilar_layout, texto_plano,
+)
+
+CORPOS_FORMATADOS = {
+    'paragrafos': '<p><b>Impacto:</b> usuários do <i>SAP</i> e do <u>Portal RH</u>.</p>'
+                  '<p>Previsão: <b><i>10h</i></b></p>',
+    'quebras': 'Linha 1<br>Linha 2<br/><b>Linha <u>3</u></b>',
+    'lista': '<div>Sistemas afetados:</div><ul><li><b>SAP</b> ECC</li><li>Portal <u>RH</u></li></ul>'
+             '<div>Equipe GCC</div>',
+    'lista_numerada': '<ol><li>Abrir chamado</li><li>Aguardar <b>retorno</b></li></ol>'
+                      '<ol start="5"><li>Quinto passo</li></ol>',
+    'sublista': '<ul><li>Grupo<ul><li>Item A</li><li>Item B</li></ul></li><li>Outro</li></ul>',
+    'entidades': '<p>Custo &lt; 5 &amp; prazo&nbsp;curto</p>',
+    'espacos': '<div>Olá,\r\nnotamos   que <b> o acesso </b> voltou.\n</div><div><br></div>',
+    'editor': '<div><br></div><div><br></div><br><div>Informamos que o recurso&nbsp;<b>"Resumo de IA"</b>'
+              ' voltou a operar com normalidade.\n</div><div><br></div>',
+    'sanitizado': '<p>Texto com <span>span</span> e <script>alert(1)</script>fim</p>',
+}
+
+_TAGS_ESTILO = {'b': ESTILO_NEGRITO, 'strong': ESTILO_NEGRITO, 'i': ESTILO_ITALICO, 'em': ESTILO_ITALICO,
+                'u': ESTILO_SUBLINHADO}
+_TAGS_BLOCO = {'div', 'p', 'ul', 'ol', 'li'}
+
+
+class _TextoPrevia(HTMLParser):
+    """
+    Linhas do corpo da prévia como o navegador as exibe: blocos e <br> quebram a linha,
+    espaços em branco seguidos viram um só e linhas sem texto não contam.
+
+    Cada linha é (marcador do item de lista, [(texto, estilo), ...]).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.linhas = []
+        self._divs = 0  # Profundidade dentro do div .corpo-texto (0 = fora dele)
+        self._estilos = {nome: 0 for nome in (ESTILO_NEGRITO, ESTILO_ITALICO, ESTILO_SUBLINHADO)}
+        self._listas = []
+        self._marcador = ''
+        self._trechos = []
+
+    def handle_starttag(self, tag, attrs):
+        if not self._divs:
+            if tag == 'div' and 'corpo-texto' in (dict(attrs).get('class') or ''):
+                self._divs = 1
+            return
+        if tag == 'div':
+            self._divs += 1
+        if tag in _TAGS_ESTILO:
+            self._estilos[_TAGS_ESTILO[tag]] += 1
+        elif tag in _TAGS_BLOCO or tag == 'br':
+            self._quebrar()
+        if tag in ('ul', 'ol'):
+            inicio = dict(attrs).get('start')
+            self._listas.append([tag == 'ol', int(inicio) - 1 if inicio else 0])
+        elif tag == 'li':
+            lista = self._listas[-1]
+            lista[1] += 1
+            self._marcador = f'{lista[1]}. ' if lista[0] else '• '
+
+    def handle_endtag(self, tag):
+        if not self._divs:
+            return
+        if tag in _TAGS_ESTILO:
+            self._estilos[_TAGS_ESTILO[tag]] -= 1
+        elif tag in _TAGS_BLOCO:
+            self._quebrar()
+        if tag in ('ul', 'ol'):
+            self._listas.pop()
+        elif tag == 'div':
+            self._divs -= 1
+
+    def handle_data(self, dados):
+        if self._divs:
+            estilo = ' '.join(n for n in (ESTILO_NEGRITO, ESTILO_ITALICO, ESTILO_SUBLINHADO) if self._estilos[n])
+            self._trechos.append([re.sub(r'[ \t\n\r\f]+', ' ', dados), estilo or ESTILO_NORMAL])
+
+    def _quebrar(self):
+        # Espaços no início e no fim da linha e logo após outro espaço não aparecem
+        trechos = []
+        for texto, estilo in self._trechos:
+            if texto.startswith(' ') and (not trechos or trechos[-1][0].endswith(' ')):
+                texto = texto[1:]
+            if not texto:
+                continue
+            if trechos and trechos[-1][1] == estilo:
+                trechos[-1][0] += texto
+            else:
+                trechos.append([texto, estilo])
+        if trechos:
+            trechos[-1][0] = trechos[-1][0].rstrip(' ')
+            if not trechos[-1][0]:
+                trechos.pop()
+        if trechos:
+            self.linhas.append((self._marcador, [tuple(trecho) for trecho in trechos]))
+        self._trechos = []
+        self._marcador = ''
+
+
+def linhas_layout(layout):
+    """Linhas com texto do layout, no mesmo formato de _TextoPrevia."""
+    return [
+        (paragrafo.get('marcador', '') if paragrafo['tipo'] == PARAGRAFO_ITEM else '',
+         [tuple(trecho) for trecho in paragrafo['trechos']])
+        for paragrafo in layout['paragrafos']
+        if paragrafo['tipo'] != PARAGRAFO_VAZIO
+    ]
+
+
+class LayoutFielAPreviaTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        gcc.inicializar_dados()
+
+    def setUp(self):
+        gcc.request_history.clear()  # /preview tem limite de requisições por minuto
+        self.cliente = gcc.app.test_client()
+
+    def linhas_previa(self, corpo):
+        resposta = self.cliente.post('/preview', json={'corpo': corpo})
+        self.assertEqual(resposta.status_code, 200)
+        leitor = _TextoPrevia()
+        leitor.feed(json.loads(resposta.data)['html'])
+        leitor.close()
+        return leitor.linhas
+
+    def test_texto_plano_igual_ao_da_previa(self):
+        for nome, corpo in CORPOS_FORMATADOS.items():
+            with self.subTest(corpo=nome):
+                # Ao salvar, o layout é compilado a partir do corpo sanitizado, o mesmo exibido na prévia
+                layout = compilar_layout(gcc.sanitize_html(corpo))
+                textos_previa = [''.join(texto for texto, _ in trechos) for _, trechos in self.linhas_previa(corpo)]
+                self.assertEqual(texto_plano(layout).split('\n'), textos_previa)
+
+    def test_marcadores_e_estilos_iguais_aos_da_previa(self):
+        for nome, corpo in CORPOS_FORMATADOS.items():
+            with self.subTest(corpo=nome):
+                layout = compilar_layout(gcc.sanitize_html(corpo))
+                self.assertEqual(linhas_layout(layout), self.linhas_previa(corpo))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Migrações versionadas do esquema
+
+Cada migração roda uma única vez e em ordem; a que falha não é registrada e as
+seguintes ficam pendentes. As migrações do app podem ser reaplicadas sobre um banco
+que já tem as mudanças (o SQLite não desfaz parte do DDL em um rollback).
+"""
+import os
+import tempfile
+import shutil
+import unittest
+
+from sqlalchemy import create_engine, text
+
+import tests  # noqa: F401  Ambiente temporário (tests/__init__.py) antes de importar o app
+import app as gcc
+from scripts.migracoes import (
+    Migracao, aplicar_migracoes, migracoes_pendentes, versoes_aplicadas, colunas_tabela, criar_indice,
+)
+
+
+class AplicarMigracoesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp(prefix='gcc-migracoes-')
+        self.engine = create_engine('sqlite:///' + os.path.join(self.diretorio, 'banco.db'))
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+        self.addCleanup(self.engine.dispose)
+        self.aplicadas = []
+
+    def migracao(self, versao, sql):
+        def aplicar(conexao):
+            self.aplicadas.append(versao)
+            conexao.execute(text(sql))
+        return Migracao(versao, f'Migração {versao}', aplicar)
+
+    def versoes(self):
+        with self.engine.begin() as conexao:
+            return versoes_aplicadas(conexao)
+
+    def test_aplica_em_ordem_uma_unica_vez(self):
+        migracoes = [
+            self.migracao(2, 'ALTER TABLE item ADD COLUMN nome TEXT'),
+            self.migracao(1, 'CREATE TABLE item (id INTEGER PRIMARY KEY)'),
+        ]
+        self.assertEqual(aplicar_migracoes(self.engine, migracoes), 2)
+        self.assertEqual(self.aplicadas, [1, 2])
+        self.assertEqual(self.versoes(), {1, 2})
+
+        self.assertEqual(aplicar_migracoes(self.engine, migracoes), 0)
+        self.assertEqual(self.aplicadas, [1, 2])
+        self.assertEqual(migracoes_pendentes(self.engine, migracoes), [])
+
+    def test_falha_interrompe_e_fica_pendente(self):
+        migracoes = [
+            self.migracao(1, 'CREATE TABLE item (id INTEGER PRIMARY KEY)'),
+            self.migracao(2, 'ALTER TABLE tabela_inexistente ADD COLUMN nome TEXT'),
+            self.migracao(3, 'CREATE TABLE outro (id INTEGER PRIMARY KEY)'),
+        ]
+        with self.assertRaises(Exception):
+            aplicar_migracoes(self.engine, migracoes)
+        self.assertEqual(self.versoes(), {1})
+        self.assertEqual([m.versao for m in migracoes_pendentes(self.engine, migracoes)], [2, 3])
+
+        # Corrigida, a migração roda a partir de onde parou
+        migracoes[1] = self.migracao(2, 'ALTER TABLE item ADD COLUMN nome TEXT')
+        self.aplicadas.clear()
+        self.assertEqual(aplicar_migracoes(self.engine, migracoes), 2)
+        self.assertEqual(self.aplicadas, [2, 3])
+        with self.engine.begin() as conexao:
+            self.assertEqual(colunas_tabela(conexao, 'item'), ['id', 'nome'])
+
+    def test_criar_indice_reaproveita_equivalente(self):
+        with self.engine.begin() as conexao:
+            conexao.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY, codigo TEXT UNIQUE, nome TEXT)'))
+            # O índice automático da coluna UNIQUE já atende
+            self.assertFalse(criar_indice(conexao, 'ix_item_codigo', 'item', ['codigo'], unico=True))
+            self.assertTrue(criar_indice(conexao, 'ix_item_nome', 'item', ['nome']))
+            self.assertFalse(criar_indice(conexao, 'ix_item_nome_2', 'item', ['nome']))
+            # Um índice comum não atende a um índice único
+            self.assertTrue(criar_indice(conexao, 'ux_item_nome', 'item', ['nome'], unico=True))
+
+
+class MigracoesDoAppTest(unittest.TestCase):
+
+    def test_migracoes_idempotentes(self):
+        gcc.inicializar_dados()
+        with gcc.app.app_context():
+            engine = gcc.db.engine
+        self.assertEqual(aplicar_migracoes(engine, gcc.MIGRACOES), 0)
+        for migracao in gcc.MIGRACOES:
+            with self.subTest(versao=migracao.versao):
+                with engine.begin() as conexao:
+                    migracao.aplicar(conexao)
+
+    def test_versoes_unicas_e_crescentes(self):
+        versoes = [migracao.versao for migracao in gcc.MIGRACOES]
+        self.assertEqual(versoes, sorted(set(versoes)))
+
+
+if __name__ == '__main__':
+    unittest.main()